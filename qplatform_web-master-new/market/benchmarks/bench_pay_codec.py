@@ -0,0 +1,119 @@
+"""微信支付编解码 / 签名的微基准测试
+
+对比 market.core.pay.codec 与原来 WeixinPay 中的实现::
+
+    python benchmarks/bench_pay_codec.py [-n 20000]
+"""
+import argparse
+import hashlib
+import random
+import string
+import sys
+import timeit
+from pathlib import Path
+
+from lxml import etree
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from market.core.pay import codec  # noqa: E402
+
+MCH_KEY = "k" * 32
+# 支付结果通知的字段
+NOTIFY = {
+    "appid": "wx2421b1c4370ec43b",
+    "attach": "支付测试",
+    "bank_type": "CFT",
+    "fee_type": "CNY",
+    "is_subscribe": "Y",
+    "mch_id": "10000100",
+    "nonce_str": "5d2b6c2a8db53831f7eda20af46e531c",
+    "openid": "oUpF8uMEb4qRXf22hE3X68TekukE",
+    "out_trade_no": "1409811653",
+    "result_code": "SUCCESS",
+    "return_code": "SUCCESS",
+    "sub_mch_id": "10000100",
+    "time_end": "20140903131540",
+    "total_fee": 1,
+    "coupon_fee": 10,
+    "coupon_count": 1,
+    "coupon_type": "CASH",
+    "coupon_id": "10000",
+    "trade_type": "JSAPI",
+    "transaction_id": "1004400740201409030005092168",
+}
+
+
+# 原来的实现
+def legacy_nonce_str():
+    char = string.ascii_letters + string.digits
+    return "".join(random.choice(char) for _ in range(32))
+
+
+def legacy_sign(raw):
+    raw = [
+        (k, str(raw[k]) if isinstance(raw[k], int) else raw[k])
+        for k in sorted(raw.keys())
+    ]
+    s = "&".join("=".join(kv) for kv in raw if kv[1])
+    s += "&key={0}".format(MCH_KEY)
+    return hashlib.md5(s.encode("utf-8")).hexdigest().upper()
+
+
+def legacy_to_xml(raw):
+    s = ""
+    for k, v in raw.items():
+        s += "<{0}>{1}</{0}>".format(k, v)
+    s = "<xml>{0}</xml>".format(s)
+    return s.encode("utf-8")
+
+
+def legacy_to_dict(content):
+    raw = {}
+    root = etree.fromstring(
+        content.encode("utf-8"), parser=etree.XMLParser(resolve_entities=False)
+    )
+    for child in root:
+        raw[child.tag] = child.text
+    return raw
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20000, help="每项的执行次数")
+    args = parser.parse_args()
+
+    signer = codec.Signer(MCH_KEY)
+    notify = dict(NOTIFY)
+    xml_bytes = legacy_to_xml(notify)
+    xml_str = xml_bytes.decode("utf-8")
+    signed = dict(notify, sign=signer.sign(notify))
+    signed_xml = codec.to_xml(signed)
+
+    assert legacy_sign(notify) == signer.sign(notify)
+    assert legacy_to_dict(xml_str) == codec.from_xml(xml_bytes)
+
+    def legacy_notify():
+        data = legacy_to_dict(signed_xml.decode("utf-8"))
+        sign = data.pop("sign")
+        return sign == legacy_sign(data)
+
+    def codec_notify():
+        return signer.check(codec.from_xml(signed_xml))
+
+    cases = [
+        ("nonce_str", legacy_nonce_str, codec.nonce_str),
+        ("sign", lambda: legacy_sign(notify), lambda: signer.sign(notify)),
+        ("to_xml", lambda: legacy_to_xml(notify), lambda: codec.to_xml(notify)),
+        ("from_xml", lambda: legacy_to_dict(xml_str), lambda: codec.from_xml(xml_bytes)),
+        ("notify (parse + check)", legacy_notify, codec_notify),
+    ]
+    print(f"{'case':<24}{'legacy us':>12}{'codec us':>12}{'speedup':>10}")
+    for name, legacy, new in cases:
+        t_legacy = min(timeit.repeat(legacy, number=args.n, repeat=3)) / args.n * 1e6
+        t_new = min(timeit.repeat(new, number=args.n, repeat=3)) / args.n * 1e6
+        print(f"{name:<24}{t_legacy:>12.2f}{t_new:>12.2f}{t_legacy / t_new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,25 @@ from datetime import timedelta
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Response, status
+from starlette.requests import Request
 
 from market.models.const import SUPER_SCOPE, UserScope2, UserStatus
 import uuid
 import datetime
 from market import config
+from market.api.share.pagination import paginate
 from market.core.security import (
     APIKEY_HEADER_NAME,
+    CachedAdmin,
+    admin_login_guard,
     authenticate_admin_user,
-    info_admin_user,
     create_access_token,
     get_password_hash,
+    info_admin_user,
+    invalidate_admin,
+    pwd_hasher,
     require_active_admin,
+    require_active_admin_row,
     require_super_scope_su,
     verify_password,
 )
@@ -32,13 +39,14 @@ from market.schemas.admin_user import (
 )
 from market.schemas.base import CommonOut
 from market.schemas.token import AdminToken
+from market.utils import client_ip
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.post("/user/login", response_model=AdminToken, tags=["后台——系统管理员"])
-async def admin_login(schema_in: AdminUserIn, response: Response):
+async def admin_login(schema_in: AdminUserIn, request: Request, response: Response):
     """登录管理后台"""
     if schema_in.verification_code != "1234":
         raise HTTPException(
@@ -46,7 +54,9 @@ async def admin_login(schema_in: AdminUserIn, response: Response):
             detail="Incorrect verification_code",
         )
     #user = await authenticate_admin_user(schema_in.user_id, schema_in.password)
-    user,user1 = await info_admin_user(schema_in.user_id, schema_in.password)
+    user,user1 = await info_admin_user(
+        schema_in.user_id, schema_in.password, client_ip=client_ip(request)
+    )
     if user and user1==0:
         if user.status == UserStatus.disabled:
             raise HTTPException(
@@ -74,7 +84,7 @@ async def admin_login(schema_in: AdminUserIn, response: Response):
 
 
 @router.post("/user/logout", response_model=CommonOut, tags=["后台——系统管理员"])
-async def admin_logout(current_user: MarketAdminUser = Depends(require_active_admin)):
+async def admin_logout(current_user: CachedAdmin = Depends(require_active_admin)):
     """注销管理后台"""
     return CommonOut()
 
@@ -82,7 +92,7 @@ async def admin_logout(current_user: MarketAdminUser = Depends(require_active_ad
 @router.post("/user/add", response_model=CommonOut, tags=["后台——系统管理员"])
 async def add_admin(
     schema_in: AdminUserCreate,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """添加管理员，需要总后台超管权限"""
     if current_user.scope1 != "aq" or current_user.scope2 != int(UserScope2.su):
@@ -111,7 +121,7 @@ async def add_admin(
 
     data = schema_in.dict()
     data["uuid"] = uuid.uuid1()
-    data["password"] = get_password_hash(data["password"],data["uuid"].hex)
+    data["password"] = await get_password_hash(data["password"], data["uuid"].hex)
     try:
         await MarketAdminUser.create(
                 uuid = data["uuid"],
@@ -129,14 +139,14 @@ async def add_admin(
         logger.exception("create package failed: %s", schema_in.json())
         print(Exception,'exp---2222222222')
         return CommonOut(errCode=-1, errMsg="添加失败，请检查名字是否重复")
-
+    await admin_login_guard.forget_unknown(schema_in.name, schema_in.phone, schema_in.email)
     return CommonOut()
 
 
 @router.post("/user/change_status", response_model=CommonOut, tags=["后台——系统管理员"])
 async def change_admin_status(
     schema_in: AdminUserChangeStatusIn,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """禁用管理员"""
     if current_user.scope1 != "aq" or current_user.scope2 != int(UserScope2.su):
@@ -154,10 +164,12 @@ async def change_admin_status(
     if schema_in.status == UserStatus.deleted:
         user1 = await MarketAdminUser.query.where(MarketAdminUser.id == schema_in.id).gino.first()
         await user1.delete()
+        invalidate_admin(user1.uuid)
     else:
         try:
             user = await MarketAdminUser.query.where(MarketAdminUser.id == schema_in.id).gino.first()
             await user.update(status=int(schema_in.status)).apply()
+            invalidate_admin(user.uuid)
         except Exception:
             logger.exception("更新管理员信息失败：%s", schema_in.json())
             return CommonOut(errCode=-1, errMsg="更新失败，请检查名字是否重复")
@@ -167,7 +179,7 @@ async def change_admin_status(
 @router.post("/user/edit", response_model=CommonOut, tags=["后台——系统管理员"])
 async def edit_admin(
     schema_in: AdminUserUpdate,
-    current_user: MarketAdminUser = Depends(require_active_admin),
+    current_user: CachedAdmin = Depends(require_active_admin),
 ):
     """编辑管理员信息"""
     try:
@@ -183,53 +195,50 @@ async def edit_admin(
 @router.post("/user/update-password", response_model=CommonOut, tags=["后台——系统管理员"])
 async def change_password(
     update_in: AdminUpdatePassword,
-    current_user: MarketAdminUser = Depends(require_active_admin),
+    current_user: MarketAdminUser = Depends(require_active_admin_row),
 ):
     """更改密码"""
     #print(verify_password(update_in.old_pwd, current_user.password,current_user.uuid.hex),'passwort=====222222')
-    if not verify_password(update_in.old_pwd, current_user.password,current_user.uuid.hex):
+    if not await verify_password(update_in.old_pwd, current_user.password, current_user.uuid.hex):
         raise HTTPException(status_code=400, detail="incorrect password")
 
     #current_user.password = get_password_hash(update_in.new_pwd, current_user.uuid.hex)
     #await current_user.save()
-    await current_user.update(password=get_password_hash(update_in.new_pwd, current_user.uuid.hex)).apply()
+    await current_user.update(password=await get_password_hash(update_in.new_pwd, current_user.uuid.hex)).apply()
+    invalidate_admin(current_user.uuid)
     return CommonOut()
 
 
 @router.post("/user/find", response_model=AdminUserSearchOut, tags=["后台——系统管理员"])
 async def search_admin(
     schema_in: AdminUserSearchIn,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """根据名字和类型查询标签或者风格"""
-    count_query = db.select([db.func.count(MarketAdminUser.id)]).where(
-        MarketAdminUser.status != int(UserStatus.deleted)
-    )
-    fetch_query = MarketAdminUser.query.where(
-        MarketAdminUser.status != int(UserStatus.deleted)
-    )
+    conditions = [MarketAdminUser.status != int(UserStatus.deleted)]
     if schema_in.scope1:
-        count_query = count_query.where(MarketAdminUser.scope1 == schema_in.scope1)
-        fetch_query = fetch_query.where(MarketAdminUser.scope1 == schema_in.scope1)
+        conditions.append(MarketAdminUser.scope1 == schema_in.scope1)
     if schema_in.scope2:
-        count_query = count_query.where(MarketAdminUser.scope2 == int(schema_in.scope2))
-        fetch_query = fetch_query.where(MarketAdminUser.scope2 == int(schema_in.scope2))
+        conditions.append(MarketAdminUser.scope2 == int(schema_in.scope2))
     if schema_in.name:
-        count_query = count_query.where(MarketAdminUser.name.contains(schema_in.name))
-        fetch_query = fetch_query.where(MarketAdminUser.name.contains(schema_in.name))
+        conditions.append(MarketAdminUser.name.contains(schema_in.name))
     if schema_in.phone:
-        count_query = count_query.where(MarketAdminUser.phone.contains(schema_in.phone))
-        fetch_query = fetch_query.where(MarketAdminUser.phone.contains(schema_in.phone))
+        conditions.append(MarketAdminUser.phone.contains(schema_in.phone))
     if schema_in.email:
-        count_query = count_query.where(MarketAdminUser.email.contains(schema_in.email))
-        fetch_query = fetch_query.where(MarketAdminUser.email.contains(schema_in.email))
-    total_count = await db.scalar(count_query)
-    users = (
-        await fetch_query.order_by(MarketAdminUser.name.desc())
-        .offset(schema_in.offset)
-        .limit(schema_in.count)
-        .gino.all()
+        conditions.append(MarketAdminUser.email.contains(schema_in.email))
+    where = db.and_(*conditions)
+    total_count, users = await paginate(
+        MarketAdminUser.query.where(where).order_by(MarketAdminUser.name.desc()),
+        db.select([db.func.count(MarketAdminUser.id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
     )
     return AdminUserSearchOut(
         total=total_count, data=[AdminUserInfo(**user.__dict__["__values__"]) for user in users if user.scope2 != UserScope2.su]
     )
+
+
+@router.get("/user/hasher/stats", response_model=CommonOut, tags=["后台——系统管理员"])
+async def get_hasher_stats(current_user: CachedAdmin = Depends(require_super_scope_su)):
+    """查看密码哈希线程池的排队情况（当前进程）"""
+    return CommonOut(data=pwd_hasher.stats())
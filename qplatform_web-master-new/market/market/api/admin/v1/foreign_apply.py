@@ -4,7 +4,7 @@ import logging
 from fastapi import APIRouter, HTTPException, status
 from fastapi.encoders import jsonable_encoder
 
-from market.ctx import ctx
+from market.api.share.qplatform import get_simulation_detail, get_simulation_owners
 from market.models import QStrategy, ReviewRecord, StrategyMarket
 from market.models.const import ListStatus, ProductType, ReviewOP, ReviewStatus
 from market.schemas.base import CommonOut
@@ -26,31 +26,8 @@ async def query_list_info(query_in: ApplyQuery):
     sim_ids = query_in.sim_id
     if isinstance(sim_ids, str):
         sim_ids = [sim_ids]
-    async with ctx.mysql_cli as conn:
-        cursor = await conn.cursor()
-
-        # get simulation info
-        query_str = f"SELECT user_id FROM wk_simulation WHERE id in ({','.join(['%s']*len(sim_ids))})"
-
-        # get simulation info
-        await cursor.execute(query_str, sim_ids)
-        rows = await cursor.fetchall()
-        if len(rows) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数"
-            )
-        user_ids = [row[0] for row in rows]
-        user_id = str(user_ids[0])
-
-        # get user
-        await cursor.execute("SELECT phone FROM wk_user WHERE id=%s", user_id)
-        rows = await cursor.fetchall()
-        if len(rows) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数"
-            )
-        user_phone = rows[0][0]
-    if query_in.user_id != user_phone:
+    owners = await get_simulation_owners(sim_ids)
+    if not owners or any(owner["phone"] != query_in.user_id for owner in owners):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数")
 
     rows = (
@@ -131,57 +108,27 @@ async def list_apply(schema_in: OnlineApplyInfo):
     if row:
         return CommonOut(errCode=-1, errMsg="申请失败，该策略在商城已存在")
 
-    async with ctx.mysql_cli as conn:
-        cursor = await conn.cursor()
-        # get simulation info
-        await cursor.execute(
-            "SELECT user_id, name, task_id, backtest_id, init_money, start_date FROM wk_simulation WHERE id=%s",
-            schema_in.sim_id,
+    sim = await get_simulation_detail(schema_in.sim_id)
+    if sim is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="未找到对应的模拟交易"
         )
-        rows = await cursor.fetchall()
-        if len(rows) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="未找到对应的模拟交易"
-            )
-        user_id = str(rows[0][0])
-        user_id = str(row[0][0])
-        sim_name = str(row[0][1])
-        task_id = str(row[0][2])
-        backtest_id = row[0][3]
-        sim_start_cash = float(row[0][4])
-        sim_start_dt = datetime.datetime.combine(row[0][5], datetime.time())
-
-        await cursor.execute(
-            "SELECT phone, nick_name FROM wk_user WHERE id=%s", user_id
+    user_id = str(sim["user_id"])
+    task_id = str(sim["task_id"])
+    if sim["phone"] != schema_in.user_id:
+        logger.error(
+            "request list apply for %s user not match (apply: %s, query: %s)",
+            task_id,
+            schema_in.user_id,
+            user_id,
         )
-        rows = await cursor.fetchall()
-        if len(rows) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="模拟交易的用户信息不一致！！！"
-            )
-        user_phone = row[0][0]
-        author_name = row[0][1]
-        if user_phone != schema_in.user_id:
-            logger.error(
-                "request list apply for %s user not match (apply: %s, query: %s)",
-                task_id,
-                schema_in.user_id,
-                user_id,
-            )
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="模拟交易的用户信息不一致！！！"
-            )
-
-        # get backtest task_id
-        await cursor.execute(
-            "SELECT task_id FROM wk_strategy_backtest WHERE id=%s", backtest_id
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="模拟交易的用户信息不一致！！！"
+        )
+    if sim["bt_task_id"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="没找到对应的回测信息"
         )
-        rows = await cursor.fetchall()
-        if len(rows) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="没找到对应的回测信息"
-            )
-        bt_task_id = str(row[0][0])
 
     if schema_in.market_id:
         market = await StrategyMarket.get(schema_in.market_id)
@@ -193,11 +140,11 @@ async def list_apply(schema_in: OnlineApplyInfo):
         user_id=user_id,
         product_id=next_product_id(),
         task_id=task_id,
-        author_name=author_name,
-        sim_name=sim_name,
-        bt_task_id=bt_task_id,
-        sim_start_cash=sim_start_cash,
-        sim_start_dt=sim_start_dt,
+        author_name=sim["nick_name"],
+        sim_name=str(sim["name"]),
+        bt_task_id=str(sim["bt_task_id"]),
+        sim_start_cash=float(sim["init_money"]),
+        sim_start_dt=datetime.datetime.combine(sim["start_date"], datetime.time()),
         status=int(ListStatus.online_review),
         name=schema_in.name,
         category=int(schema_in.category),
@@ -233,30 +180,10 @@ async def list_apply(schema_in: OnlineApplyInfo):
 @router.post("/apply/strategy/delist", response_model=CommonOut, tags=["后台——上下架申请"])
 async def delist_apply(query_in: OfflineApplyInfo):
     """策略下架申请"""
-    async with ctx.mysql_cli as conn:
-        cursor = await conn.cursor()
-        # get simulation info
-        await cursor.execute(
-            "SELECT user_id FROM wk_simulation WHERE id=%s", query_in.sim_id
-        )
-        rows = await cursor.fetchall()
-        if len(rows) != 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数"
-            )
-        user_id = str(rows[0][0])
-
-        # get user
-        await cursor.execute("SELECT phone FROM wk_user WHERE id=%s", user_id)
-        rows = await cursor.fetchall()
-        if len(rows) != 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数"
-            )
-        user_phone = rows[0][0]
-
-    if query_in.user_id != user_phone:
+    owners = await get_simulation_owners([query_in.sim_id])
+    if len(owners) != 1 or owners[0]["phone"] != query_in.user_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请检查查询参数")
+    user_id = str(owners[0]["user_id"])
 
     strategy = await QStrategy.query.where(
         QStrategy.sim_id == query_in.sim_id
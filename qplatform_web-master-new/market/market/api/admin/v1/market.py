@@ -2,8 +2,13 @@ import logging
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from market.core.security import require_super_scope_admin, require_super_scope_su
-from market.models import MarketAdminUser, StrategyMarket, db
+from market.api.share.pagination import paginate
+from market.core.security import (
+    CachedAdmin,
+    require_super_scope_admin,
+    require_super_scope_su,
+)
+from market.models import StrategyMarket, db
 from market.models.const import MarketStatus
 from market.schemas.base import CommonOut
 from market.schemas.market import (
@@ -22,7 +27,7 @@ router = APIRouter()
 @router.post("/market/new", response_model=CommonOut, tags=["后台——超市管理"])
 async def add_market(
     schema_in: MarketCreate,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """添加新的策略超市"""
     await StrategyMarket.create(**schema_in.dict(), status=int(MarketStatus.normal))
@@ -32,7 +37,7 @@ async def add_market(
 @router.post("/market/edit", response_model=CommonOut, tags=["后台——超市管理"])
 async def edit_market(
     schema_in: MarketUpdate,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """编辑策略超市信息"""
     market = await StrategyMarket.get_or_404(schema_in.id)
@@ -49,7 +54,7 @@ async def edit_market(
 @router.post("/market/disable", response_model=CommonOut, tags=["后台——超市管理"])
 async def disable_market(
     schema_in: MarketDisable,
-    current_user: MarketAdminUser = Depends(require_super_scope_su),
+    current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """禁用 / 删除超市"""
     id_list = schema_in.id
@@ -64,23 +69,14 @@ async def disable_market(
 @router.post("/market/find", response_model=MarketSearchOut, tags=["后台——超市管理"])
 async def search_market(
     schema_in: MarketSearch,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """查找超市"""
-    count_query = db.select([db.func.count(StrategyMarket.id)]).where(
-        StrategyMarket.status == int(MarketStatus.normal)
-    )
-    fetch_query = StrategyMarket.query.where(
-        StrategyMarket.status == int(MarketStatus.normal)
-    )
-
+    conditions = [StrategyMarket.status == int(MarketStatus.normal)]
     if schema_in.id:
-        count_query = count_query.where(StrategyMarket.id == schema_in.id)
-        fetch_query = fetch_query.where(StrategyMarket.id == schema_in.id)
+        conditions.append(StrategyMarket.id == schema_in.id)
     if schema_in.name:
-        count_query = count_query.where(StrategyMarket.name.contains(schema_in.name))
-        fetch_query = fetch_query.where(StrategyMarket.name.contains(schema_in.name))
-    total_count = await db.scalar(count_query)
+        conditions.append(StrategyMarket.name.contains(schema_in.name))
     order_bys = []
     for key in schema_in.order_bys:
         if not key.startswith("-"):
@@ -93,15 +89,20 @@ async def search_market(
                 logger.warning("get strategy market has invalid order_by key: %s", key)
                 continue
             order_bys.append(getattr(StrategyMarket, key[1:]).desc())
-    markets = (
-        await fetch_query.order_by(*order_bys).offset(schema_in.offset).limit(schema_in.count).gino.all()
+    order_bys.append(StrategyMarket.id)
+    where = db.and_(*conditions)
+    total_count, markets = await paginate(
+        StrategyMarket.query.where(where).order_by(*order_bys),
+        db.select([db.func.count(StrategyMarket.id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
     )
     return MarketSearchOut(total=total_count, data=markets)
 
 
 @router.get("/market/{market_id}", response_model=MarketInfo, tags=["后台——超市管理"])
 async def show_market(
-    market_id: int, current_user: MarketAdminUser = Depends(require_super_scope_admin)
+    market_id: int, current_user: CachedAdmin = Depends(require_super_scope_admin)
 ):
     """查看超市详情"""
     return await StrategyMarket.get_or_404(market_id)
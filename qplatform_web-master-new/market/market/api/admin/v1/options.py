@@ -2,8 +2,7 @@ import logging
 
 from fastapi import APIRouter, Depends
 
-from market.core.security import require_super_scope_admin
-from market.models import MarketAdminUser
+from market.core.security import CachedAdmin, require_super_scope_admin
 from market.schemas.base import CommonOut
 
 logger = logging.getLogger(__name__)
@@ -12,7 +11,7 @@ router = APIRouter()
 
 @router.post("/options/v", response_model=CommonOut, tags=["后台——选项设置", "后台"])
 async def show_options(
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """添加标签或者风格"""
 
@@ -21,7 +20,7 @@ async def show_options(
 
 @router.post("/options/s", response_model=CommonOut, tags=["后台——选项设置", "后台"])
 async def set_options(
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """添加标签或者风格"""
     return CommonOut()
@@ -3,9 +3,14 @@ import logging
 from fastapi import APIRouter, Depends
 from sqlalchemy.exc import IntegrityError
 
+from market.api.share.pagination import CountMode
 from market.api.share.package import change_pkg_status, edit_pkg, search_pkg, show_pkg
-from market.core.security import require_super_scope_admin, require_super_scope_su
-from market.models import MarketAdminUser, StrategyPackage
+from market.core.security import (
+    CachedAdmin,
+    require_super_scope_admin,
+    require_super_scope_su,
+)
+from market.models import StrategyPackage
 from market.schemas.base import CommonOut
 from market.schemas.package import (
     PkgCreate,
@@ -24,7 +29,7 @@ router = APIRouter()
 @router.post("/pkg/new", response_model=CommonOut, tags=["后台——套餐管理"])
 async def add_package(
     schema_in: PkgCreate,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """添加套餐"""
     schema_in.product_id = next_product_id()
@@ -42,7 +47,7 @@ async def add_package(
 @router.post("/pkg/edit", response_model=CommonOut, tags=["后台——套餐管理"])
 async def admin_edit_pkg(
     schema_in: PkgUpdateIn,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """编辑套餐"""
     return await edit_pkg(schema_in.product_id, schema_in.changed)
@@ -51,7 +56,7 @@ async def admin_edit_pkg(
 @router.post("/pkg/status/change", response_model=CommonOut, tags=["后台——套餐管理"])
 async def change_status(
     schema_in: PkgStatusOp,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """下架套餐"""
     return await change_pkg_status(schema_in.product_id, schema_in.status)
@@ -60,15 +65,15 @@ async def change_status(
 @router.post("/pkg/find", response_model=PkgSearchOut, tags=["后台——套餐管理"])
 async def admin_search_pkg(
     schema_in: PkgSearch,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """搜索套餐"""
-    return await search_pkg(schema_in)
+    return await search_pkg(schema_in, count_mode=CountMode.cached)
 
 
 @router.get("/pkg/{pkg_id}", response_model=PkgInfo, tags=["后台——套餐管理"])
 async def admin_show_pkg(
-    pkg_id: str, current_user: MarketAdminUser = Depends(require_super_scope_su),
+    pkg_id: str, current_user: CachedAdmin = Depends(require_super_scope_su),
 ):
     """查看策略套餐"""
     return await show_pkg(pkg_id)
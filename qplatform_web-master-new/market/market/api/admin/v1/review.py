@@ -2,8 +2,13 @@ import logging
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from market.core.security import require_super_scope_admin, require_super_scope_su
-from market.models import MarketAdminUser, QStrategy, ReviewRecord, StrategyPackage, db
+from market.api.share.pagination import CountMode, paginate
+from market.core.security import (
+    CachedAdmin,
+    require_super_scope_admin,
+    require_super_scope_su,
+)
+from market.models import QStrategy, ReviewRecord, StrategyPackage, db
 from market.models.const import ListStatus, ProductType, ReviewOP, ReviewStatus
 from market.schemas.base import CommonOut
 from market.schemas.review import (
@@ -20,60 +25,29 @@ router = APIRouter()
 @router.post("/review/find", response_model=ReviewSearchOut, tags=["后台——上下架审核管理"])
 async def search_review(
     schema_in: ReviewSearch,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """查找申请"""
-    count_query = db.select([db.func.count(ReviewRecord.id)])
-    fetch_query = ReviewRecord.query
+    conditions = []
     if schema_in.review_id:
-        count_query = count_query.where(ReviewRecord.id == schema_in.review_id)
-        fetch_query = fetch_query.where(ReviewRecord.id == schema_in.review_id)
+        conditions.append(ReviewRecord.id == schema_in.review_id)
     if schema_in.review_status:
-        count_query = count_query.where(
-            ReviewRecord.review_status == int(schema_in.review_status)
-        )
-        fetch_query = fetch_query.where(
-            ReviewRecord.review_status == int(schema_in.review_status)
-        )
+        conditions.append(ReviewRecord.review_status == int(schema_in.review_status))
     else:
-        count_query = count_query.where(
-            ReviewRecord.review_status != int(ReviewStatus.deleted)
-        )
-        fetch_query = fetch_query.where(
-            ReviewRecord.review_status != int(ReviewStatus.deleted)
-        )
+        conditions.append(ReviewRecord.review_status != int(ReviewStatus.deleted))
     if schema_in.operation:
-        count_query = count_query.where(
-            ReviewRecord.operation == int(schema_in.operation)
-        )
-        fetch_query = fetch_query.where(
-            ReviewRecord.operation == int(schema_in.operation)
-        )
+        conditions.append(ReviewRecord.operation == int(schema_in.operation))
     if schema_in.market_id:
-        count_query = count_query.where(ReviewRecord.market_id == schema_in.market_id)
-        fetch_query = fetch_query.where(ReviewRecord.market_id == schema_in.market_id)
+        conditions.append(ReviewRecord.market_id == schema_in.market_id)
     if schema_in.user_id:
-        count_query = count_query.where(ReviewRecord.user_id == schema_in.user_id)
-        fetch_query = fetch_query.where(ReviewRecord.user_id == schema_in.user_id)
+        conditions.append(ReviewRecord.user_id == schema_in.user_id)
     if schema_in.product_type:
-        count_query = count_query.where(
-            ReviewRecord.product_type == int(schema_in.product_type)
-        )
-        fetch_query = fetch_query.where(
-            ReviewRecord.product_type == int(schema_in.product_type)
-        )
+        conditions.append(ReviewRecord.product_type == int(schema_in.product_type))
     if schema_in.product_id:
-        count_query = count_query.where(ReviewRecord.product_id == schema_in.product_id)
-        fetch_query = fetch_query.where(ReviewRecord.product_id == schema_in.product_id)
+        conditions.append(ReviewRecord.product_id == schema_in.product_id)
     if schema_in.contact:
-        count_query = count_query.where(
-            ReviewRecord.contact.contains(schema_in.contact)
-        )
-        fetch_query = fetch_query.where(
-            ReviewRecord.contact.contains(schema_in.contact)
-        )
+        conditions.append(ReviewRecord.contact.contains(schema_in.contact))
 
-    total_count = await db.scalar(count_query)
     order_bys = []
     for key in schema_in.order_bys:
         if not key.startswith("-"):
@@ -89,10 +63,15 @@ async def search_review(
 
     if not order_bys:
         order_bys.append(ReviewRecord.update_dt.desc())
-    review_list = (
-        await fetch_query.order_by(*order_bys)
-        .offset(schema_in.offset)
-        .limit(schema_in.count).gino.all()
+    order_bys.append(ReviewRecord.id.desc())
+    # 总是带有审核状态的条件，不能使用估计的总数
+    where = db.and_(*conditions)
+    total_count, review_list = await paginate(
+        ReviewRecord.query.where(where).order_by(*order_bys),
+        db.select([db.func.count(ReviewRecord.id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
+        CountMode.cached,
     )
     strategy_ids = []
     package_ids = []
@@ -139,7 +118,7 @@ async def search_review(
 @router.post("/review/result", response_model=CommonOut, tags=["后台——上下架审核管理"])
 async def do_review(
     schema_in: ReviewResult,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """审核结果：通过 / 拒绝"""
     review = await ReviewRecord.get_or_404(schema_in.id)
@@ -175,7 +154,7 @@ async def do_review(
 
 @router.get("/review/{review_id}", response_model=ReviewInfo, tags=["后台——上下架审核管理"])
 async def show_review(
-    review_id: int, current_user: MarketAdminUser = Depends(require_super_scope_su)
+    review_id: int, current_user: CachedAdmin = Depends(require_super_scope_su)
 ):
     """查看策略申请"""
     review = await ReviewRecord.get_or_404(review_id)
@@ -2,8 +2,10 @@ import logging
 
 from fastapi import APIRouter, Depends
 
-from market.core.security import require_super_scope_admin
-from market.models import MarketAdminUser
+from market.api.share.run_info import run_info_cache
+from market.api.share.task_index import unindexed_collections
+from market.core.security import CachedAdmin, require_super_scope_admin
+from market.ctx import ctx
 from market.schemas.base import CommonOut
 
 logger = logging.getLogger(__name__)
@@ -16,7 +18,7 @@ router = APIRouter()
 async def get_curves(
     task_type: str,
     task_id: str,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """获取收益曲线
 
@@ -31,7 +33,7 @@ async def get_curves(
 async def get_orders(
     task_type: str,
     task_id: str,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """获取下单信息
 
@@ -46,7 +48,7 @@ async def get_orders(
 async def get_positions(
     task_type: str,
     task_id: str,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """获取持仓信息
 
@@ -63,7 +65,7 @@ async def get_positions(
 async def get_indicators(
     task_type: str,
     task_id: str,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """获取技术指标信息
 
@@ -78,10 +80,35 @@ async def get_indicators(
 async def get_top_orders(
     task_type: str,
     task_id: str,
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """获取模拟交易的牛股（收益高的订单）
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
     """
+
+
+@router.get("/runinfo/cache/stats", response_model=CommonOut, tags=["后台——运行信息"])
+async def get_cache_stats(
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
+):
+    """查看运行信息缓存的命中情况（当前进程）"""
+    return CommonOut(data=run_info_cache.stats())
+
+
+@router.get("/runinfo/qplatform/db/stats", response_model=CommonOut, tags=["后台——运行信息"])
+async def get_qplatform_db_stats(
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
+):
+    """查看 qplatform mysql 连接池的大小、等待时间和查询超时（当前进程）"""
+    return CommonOut(data=ctx.mysql_cli.stats() if ctx.mysql_cli else {})
+
+
+@router.get("/runinfo/index/missing", response_model=CommonOut, tags=["后台——运行信息"])
+async def get_unindexed_collections(
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
+):
+    """列出缺少 day 索引的任务结果集合"""
+    missing = await unindexed_collections()
+    return CommonOut(total=len(missing), data=missing)
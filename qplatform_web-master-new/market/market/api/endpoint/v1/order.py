@@ -5,9 +5,10 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.encoders import jsonable_encoder
 
+from market.api.share.entitlement import invalidate_order
 from market.api.share.order import search_order
-from market.core.security import require_active_user
-from market.models import MarketUser, QStrategy, StrategyPackage, UserOrder, db
+from market.core.security import CachedUser, require_active_user
+from market.models import QStrategy, StrategyPackage, UserOrder, db
 from market.models.const import ListStatus, OrderStatus, ProductType
 from market.schemas.base import CommonOut
 from market.schemas.order import (
@@ -26,7 +27,7 @@ router = APIRouter()
 
 @router.post("/order/calc-price", response_model=CommonOut, tags=["用户端——订单管理"])
 async def calc_price(
-    order_in: OrderCreate, current_user: MarketUser = Depends(require_active_user)
+    order_in: OrderCreate, current_user: CachedUser = Depends(require_active_user)
 ):
     """计算订单的总价格"""
     pass
@@ -34,7 +35,7 @@ async def calc_price(
 
 @router.post("/order/submit", response_model=CommonOut, tags=["用户端——订单管理"])
 async def submit_order(
-    order_in: OrderCreate, current_user: MarketUser = Depends(require_active_user)
+    order_in: OrderCreate, current_user: CachedUser = Depends(require_active_user)
 ):
     """用户下单"""
     # get_prod_info
@@ -144,7 +145,7 @@ async def submit_order(
 
 @router.post("/order/cancel", response_model=CommonOut, tags=["用户端——订单管理"])
 async def cancel_order(
-    schema_in: OrderCancel, current_user: MarketUser = Depends(require_active_user)
+    schema_in: OrderCancel, current_user: CachedUser = Depends(require_active_user)
 ):
     """用户取消订单，发生支付前"""
     if isinstance(schema_in.id, int):
@@ -162,12 +163,13 @@ async def cancel_order(
         )
     # TODO: 取消支付
     await order.update(status=int(OrderStatus.calceled)).apply()
+    await invalidate_order(order)
     return CommonOut()
 
 
 @router.post("/order/search", response_model=OrderSearchOut, tags=["用户端——订单管理"])
 async def user_search_order(
-    schema_in: OrderSearch, current_user: MarketUser = Depends(require_active_user),
+    schema_in: OrderSearch, current_user: CachedUser = Depends(require_active_user),
 ):
     """用户查看自己的订单列表"""
     schema_in.user_id = current_user.id
@@ -3,9 +3,11 @@ import logging
 
 from fastapi import APIRouter, Depends
 
+from market.api.share import counter
+from market.api.share.pagination import CountMode
 from market.api.share.package import search_pkg
-from market.core.security import require_active_user
-from market.models import MarketUser, StrategyPackage, UserOrder
+from market.core.security import CachedUser, require_active_user
+from market.models import StrategyPackage, UserOrder
 from market.models.const import OrderStatus, ProductType
 from market.schemas.package import (
     BuyedPkgInfo,
@@ -21,7 +23,7 @@ router = APIRouter()
 
 @router.post("/pkg/list", response_model=BuyedPkgSearchOut, tags=["用户端——套餐管理"])
 async def list_pkg(
-    schema_in: BuyedPkgSearch, current_user: MarketUser = Depends(require_active_user),
+    schema_in: BuyedPkgSearch, current_user: CachedUser = Depends(require_active_user),
 ):
     """列出已购买套餐"""
     query = UserOrder.query.where(
@@ -29,7 +31,14 @@ async def list_pkg(
         #UserOrder.product_type == int(ProductType.package),
     ).where(UserOrder.product_type == int(ProductType.package))
     if schema_in.show_payed:
-        query = query.where(UserOrder.status == int(OrderStatus.payed))
+        # 到期后订单状态变为超时，已支付过的仍然列出
+        query = query.where(
+            (UserOrder.status == int(OrderStatus.payed))
+            | (
+                (UserOrder.status == int(OrderStatus.expierd))
+                & UserOrder.pay_dt.isnot(None)
+            )
+        )
     if schema_in.show_expired:
         query = query.where(UserOrder.expire_dt >= datetime.datetime.now())
 
@@ -39,6 +48,7 @@ async def list_pkg(
     packages = await StrategyPackage.query.where(
         StrategyPackage.product_id.in_(list(order_dict.keys()))
     ).gino.all()
+    await counter.merge_pending(ProductType.package, packages)
     data = []
     for pkg in packages:
         info = dict(**pkg.__dict__)
@@ -52,4 +62,4 @@ async def list_pkg(
 @router.post("/pkg/find", response_model=PkgSearchOut, tags=["用户端——套餐管理"])
 async def user_search_pkg(schema_in: PkgSearch):
     """搜索套餐"""
-    return await search_pkg(schema_in)
+    return await search_pkg(schema_in, count_mode=CountMode.cached)
@@ -1,25 +1,35 @@
 import logging
 
 from fastapi import APIRouter, Depends
+from starlette.requests import Request
+from starlette.responses import Response
 
-from market.core.security import require_active_user
-from market.models import MarketUser
+from market.api.share.payment import handle_wx_notify
+from market.core.pay import codec
+from market.core.security import CachedUser, require_active_user
 from market.schemas.order import OrderSearchOut
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+@router.post("/pay/notify/wechat", include_in_schema=False)
+async def wechat_pay_notify(request: Request):
+    """微信支付结果通知"""
+    reply = await handle_wx_notify(await request.body())
+    return Response(codec.to_xml(reply), media_type="application/xml")
+
+
 @router.post("/pay/query", response_model=OrderSearchOut, tags=["用户端——支付管理"])
-async def query_pay(current_user: MarketUser = Depends(require_active_user)):
+async def query_pay(current_user: CachedUser = Depends(require_active_user)):
     """用户查询订单支付状态"""
 
 
 @router.post("/refund", response_model=OrderSearchOut, tags=["用户端——支付管理"])
-async def refund(current_user: MarketUser = Depends(require_active_user)):
+async def refund(current_user: CachedUser = Depends(require_active_user)):
     """用户退款申请"""
 
 
 @router.post("/refund/query", response_model=OrderSearchOut, tags=["用户端——支付管理"])
-async def query_refund(current_user: MarketUser = Depends(require_active_user)):
+async def query_refund(current_user: CachedUser = Depends(require_active_user)):
     """用户退款查询"""
@@ -5,8 +5,8 @@ from starlette.requests import Request
 
 from market.api.share.strategy import check_task_permission
 from market.const import TaskType
-from market.core.security import require_active_user
-from market.models import MarketUser, PushInfo, QStrategy
+from market.core.security import CachedUser, require_active_user
+from market.models import PushInfo, QStrategy
 from market.models.const import PushMethod, PushStatus
 from market.schemas.base import CommonOut
 from market.schemas.push import PushCreate, PushSearchIn
@@ -17,7 +17,7 @@ router = APIRouter()
 
 @router.post("/push/query", response_model=CommonOut, tags=["用户端——信号推送"])
 async def check_push(
-    schema_in: PushSearchIn, current_user: MarketUser = Depends(require_active_user)
+    schema_in: PushSearchIn, current_user: CachedUser = Depends(require_active_user)
 ):
     """检查是否开启推送"""
     query = PushInfo.query.where(
@@ -41,7 +41,7 @@ async def check_push(
 async def open_push(
     schema_in: PushCreate,
     request: Request,
-    current_user: MarketUser = Depends(require_active_user),
+    current_user: CachedUser = Depends(require_active_user),
 ):
     """开启推送"""
     if schema_in.push_method != PushMethod.wechat:
@@ -67,7 +67,7 @@ async def open_push(
 async def close_push(
     schema_in: PushCreate,
     # request: Request,
-    current_user: MarketUser = Depends(require_active_user),
+    current_user: CachedUser = Depends(require_active_user),
 ):
     """关闭推送"""
     await PushInfo.update(status=int(PushStatus.disabled)).where(
@@ -1,72 +1,126 @@
 # import datetime
 import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
+import orjson
 from fastapi import APIRouter
 from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
 from market.api.share.run_info import (
+    CURVE_PROJECTION,
+    ORDER_PROJECTION,
+    POSITION_PROJECTION,
     get_curves,
     get_indicators,
     get_orders,
     get_portfolio_info,
     get_positions,
+    iter_run_info,
 )
 from market.api.share.strategy import check_task_permission
-from market.schemas.runinfo import CurvePage, OrderPage, PositionPage, QueryRunInfo
+from market.schemas.runinfo import (
+    CurvePage,
+    ExportRunInfo,
+    OrderPage,
+    PositionPage,
+    QueryRunInfo,
+)
 
 from market.schemas.runinfo import Indicators  # OrderInfo,; PositionInfo,
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def mask_orders(orders: List[Dict]):
+    """没有权限时隐藏下单的标的和价格"""
+    # current_day = int(datetime.date.today().strftime("%Y%m%d"))
+    for order in orders:
+        # 只隐藏最近七天的数据
+        # if current_day - order["day"] > 7:
+        #     break
+        order["symbol"] = "****"
+        order["current"] = "****"
+        order["limit_price"] = "****"
+        order["trade_vwap"] = "****"
+        order["open_vwap"] = "****"
+        try:
+            order["style"]["limit_price"] = "****"
+        except Exception:
+            pass
+
+
+def mask_positions(positions: List[Dict], net_value: float):
+    """没有权限时隐藏持仓的标的和价格，只保留仓位占比"""
+    # current_day = int(datetime.date.today().strftime("%Y%m%d"))
+    for pos in positions:
+        # 只隐藏最近七天的数据
+        # if current_day - pos["day"] > 7:
+        #     break
+        pos["pos_ratio"] = float(pos["market_value"]) / net_value if net_value else 0.0
+        pos["symbol"] = "****"
+        pos["open_vwap"] = "****"
+        pos["hold_vwap"] = "****"
+        pos["market_value"] = "****"
+        pos["close_price"] = "****"
+
+
+async def ndjson_stream(
+    batches: AsyncIterator[List[Dict]],
+    mask: Optional[Callable[[List[Dict]], Any]] = None,
+) -> AsyncIterator[bytes]:
+    """把分批读取的运行信息编码为 NDJSON，每批数据输出一次"""
+    async for batch in batches:
+        if mask is not None:
+            mask(batch)
+        yield b"".join(orjson.dumps(item) + b"\n" for item in batch)
+
+
+def ndjson_response(
+    batches: AsyncIterator[List[Dict]],
+    filename: str,
+    mask: Optional[Callable[[List[Dict]], Any]] = None,
+) -> StreamingResponse:
+    return StreamingResponse(
+        ndjson_stream(batches, mask),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 
 @router.post("/runinfo/orders", response_model=OrderPage, tags=["用户端——策略运行信息"])
 async def query_orders(query_in: QueryRunInfo, request: Request):
     """根据名字和类型查询标签或者风格"""
-    total_cnt, orders = await get_orders(
-        query_in.task_type, query_in.task_id, skip=query_in.offset, limit=query_in.count
+    total_cnt, orders, next_cursor = await get_orders(
+        query_in.task_type,
+        query_in.task_id,
+        skip=query_in.offset,
+        limit=query_in.count,
+        cursor=query_in.cursor,
     )
     if not await check_task_permission(query_in.task_type, query_in.task_id, request):
-        # current_day = int(datetime.date.today().strftime("%Y%m%d"))
-        for order in orders:
-            # 只隐藏最近七天的数据
-            # if current_day - order["day"] > 7:
-            #     break
-            order["symbol"] = "****"
-            order["current"] = "****"
-            order["limit_price"] = "****"
-            order["trade_vwap"] = "****"
-            order["open_vwap"] = "****"
-            try:
-                order["style"]["limit_price"] = "****"
-            except Exception:
-                pass
-    return OrderPage(total=total_cnt, data=orders)
+        mask_orders(orders)
+    return OrderPage(total=total_cnt, data=orders, next_cursor=next_cursor)
 
 
 @router.post("/runinfo/positions", response_model=PositionPage, tags=["用户端——策略运行信息"])
 async def query_positions(query_in: QueryRunInfo, request: Request):
     """根据名字和类型查询标签或者风格"""
-    total_cnt, positions = await get_positions(
-        query_in.task_type, query_in.task_id, skip=query_in.offset, limit=query_in.count
+    total_cnt, positions, next_cursor = await get_positions(
+        query_in.task_type,
+        query_in.task_id,
+        skip=query_in.offset,
+        limit=query_in.count,
+        cursor=query_in.cursor,
     )
     portfolio_info = await get_portfolio_info(query_in.task_type, query_in.task_id)
     net_value = float(portfolio_info.get("net_value", 0.0))
     if not await check_task_permission(query_in.task_type, query_in.task_id, request):
-        # current_day = int(datetime.date.today().strftime("%Y%m%d"))
-        for pos in positions:
-            # 只隐藏最近七天的数据
-            # if current_day - pos["day"] > 7:
-            #     break
-            pos["pos_ratio"] = (
-                float(pos["market_value"]) / net_value if net_value else 0.0
-            )
-            pos["symbol"] = "****"
-            pos["open_vwap"] = "****"
-            pos["hold_vwap"] = "****"
-            pos["market_value"] = "****"
-            pos["close_price"] = "****"
-    return PositionPage(total=total_cnt, data=positions)
+        mask_positions(positions, net_value)
+    return PositionPage(total=total_cnt, data=positions, next_cursor=next_cursor)
 
 
 @router.post("/runinfo/indicators", response_model=Indicators, tags=["用户端——策略运行信息"])
@@ -79,7 +133,50 @@ async def query_indicators(query_in: QueryRunInfo):
 @router.post("/runinfo/curves", response_model=CurvePage, tags=["用户端——策略运行信息"])
 async def query_curves(query_in: QueryRunInfo):
     """根据名字和类型查询标签或者风格"""
-    total_cnt, curves = await get_curves(
-        query_in.task_type, query_in.task_id, skip=query_in.offset, limit=query_in.count
+    total_cnt, curves, next_cursor = await get_curves(
+        query_in.task_type,
+        query_in.task_id,
+        skip=query_in.offset,
+        limit=query_in.count,
+        max_points=query_in.max_points,
+        cursor=query_in.cursor,
+    )
+    return CurvePage(total=total_cnt, data=curves, next_cursor=next_cursor)
+
+
+@router.post("/runinfo/orders/export", tags=["用户端——策略运行信息"])
+async def export_orders(query_in: ExportRunInfo, request: Request):
+    """以 NDJSON 格式导出全部下单信息，每行一条"""
+    batches = iter_run_info(
+        query_in.task_type, query_in.task_id, "orders", ORDER_PROJECTION
+    )
+    mask = None
+    if not await check_task_permission(query_in.task_type, query_in.task_id, request):
+        mask = mask_orders
+    return ndjson_response(batches, f"orders_{query_in.task_id}.ndjson", mask)
+
+
+@router.post("/runinfo/positions/export", tags=["用户端——策略运行信息"])
+async def export_positions(query_in: ExportRunInfo, request: Request):
+    """以 NDJSON 格式导出全部持仓信息，每行一条"""
+    batches = iter_run_info(
+        query_in.task_type, query_in.task_id, "positions", POSITION_PROJECTION
+    )
+    mask = None
+    if not await check_task_permission(query_in.task_type, query_in.task_id, request):
+        portfolio_info = await get_portfolio_info(query_in.task_type, query_in.task_id)
+        net_value = float(portfolio_info.get("net_value", 0.0))
+
+        def mask(positions):
+            mask_positions(positions, net_value)
+
+    return ndjson_response(batches, f"positions_{query_in.task_id}.ndjson", mask)
+
+
+@router.post("/runinfo/curves/export", tags=["用户端——策略运行信息"])
+async def export_curves(query_in: ExportRunInfo):
+    """以 NDJSON 格式导出全部收益曲线，每行一条"""
+    batches = iter_run_info(
+        query_in.task_type, query_in.task_id, "returns", CURVE_PROJECTION
     )
-    return CurvePage(total=total_cnt, data=curves)
+    return ndjson_response(batches, f"curves_{query_in.task_id}.ndjson")
@@ -1,6 +1,9 @@
+import asyncio
 import datetime
 import logging
 from typing import Any, Dict
+from market.api.share import counter
+from market.api.share.leaderboard import is_leaderboard_query, page_leaderboard
 from market.api.share.strategy import sortedd
 from fastapi import APIRouter, Depends, HTTPException, status
 from starlette.requests import Request
@@ -12,12 +15,14 @@ from market.api.share.run_info import (
     get_portfolio_info,
     get_today_positons,
     get_today_returns,
+    load_run_infos,
 )
+from market.api.share.pagination import CountMode
+from market.api.share.qplatform import get_simulation_codes
 from market.api.share.strategy import check_task_permission, search_strategy
 from market.const import TaskType
-from market.core.security import require_active_user
-from market.ctx import ctx
-from market.models import MarketUser, QStrategy, UserOrder, db
+from market.core.security import CachedUser, get_active_user, require_active_user
+from market.models import QStrategy, UserOrder, db
 from market.models.const import ListStatus, ProductType
 from market.schemas.base import CommonOut
 from market.schemas.runinfo import PortfolioRatio
@@ -30,6 +35,7 @@ from market.schemas.strategy import (
     QStrategySearchOut,
     QStrategySearchOVOut,
 )
+from market.utils import client_ip
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -47,33 +53,18 @@ async def check_buyed(task_id: str, request: Request):
         pass
     return CommonOut(errCode=-1, errMsg="没有权限")
 
-import MySQLdb
+
 @router.post("/strategy/copy/{task_id}", response_model=CommonOut, tags=["用户端——策略运行信息"])
 async def get_strategy_code(task_id: str, request: Request):
-    """检查是否需要因此策略信息"""
+    """复制策略代码"""
     if not await check_task_permission(TaskType.PAPER_TRADING, task_id, request):
         raise HTTPException(status.HTTP_403_FORBIDDEN, "没有权限")
-    async with ctx.mysql_cli.acquire() as conn:
-        # get code
-        cursor = await conn.cursor()
-        query_str = "SELECT backtest_id FROM wk_simulation WHERE task_id=%s"
-        await cursor.execute(query_str, task_id)
-        rows = await cursor.fetchall()
-        if len(rows) != 1:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN, detail="复制错误，策略已不存在"
-            )
-        backtest_id = rows[0][0]
-    
-        query_str = f"SELECT code FROM wk_strategy_backtest WHERE id=%s"
-        await cursor.execute(query_str, backtest_id)
-        rows = await cursor.fetchall()
-        if len(rows) != 1:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN, detail="复制错误，策略已不存在"
-            )
-        code = rows[0][0]
-        return CommonOut(data=code)
+    codes = await get_simulation_codes(task_id)
+    if len(codes) != 1 or codes[0] is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="复制错误，策略已不存在"
+        )
+    return CommonOut(data=codes[0])
 
 
 @router.get(
@@ -88,8 +79,10 @@ async def get_portfolio(product_id: str):
     ).where(QStrategy.status == int(ListStatus.online)).gino.first()
     if not strategy:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "未找到该策略")
-    portfolio_info = await get_portfolio_info(TaskType.PAPER_TRADING, strategy.task_id)
-    positions = await get_today_positons(TaskType.PAPER_TRADING, strategy.task_id)
+    portfolio_info, positions = await asyncio.gather(
+        get_portfolio_info(TaskType.PAPER_TRADING, strategy.task_id),
+        get_today_positons(TaskType.PAPER_TRADING, strategy.task_id),
+    )
     try:
         pos_ratio = round(
             float(portfolio_info["positions_value"])
@@ -110,15 +103,25 @@ async def get_portfolio(product_id: str):
     }
 
 
+async def _visitor(request: Request) -> str:
+    """浏览计数的访客：登录用户按用户 id，否则按客户端 IP"""
+    try:
+        user = await get_active_user(request)
+    except Exception:
+        return f"ip:{client_ip(request)}"
+    return f"user:{user.id}"
+
+
 @router.get(
     "/strategy/show/{product_id}", response_model=QStrategyBasicInfo, tags=["用户端——策略信息"]
 )
-async def get_strategy_info(product_id: str):
+async def get_strategy_info(product_id: str, request: Request):
     """获取策略概览信息"""
     strategy = await QStrategy.query.where(
         QStrategy.product_id == product_id).where(QStrategy.status == int(ListStatus.online)).gino.first()
     if not strategy:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "未找到该策略")
+    await counter.record_view(ProductType.qstrategy, product_id, await _visitor(request))
     data = {
         "product_id": strategy.product_id,
         "name": strategy.name,
@@ -150,12 +153,27 @@ async def get_strategy_info(product_id: str):
     return data
 
 
+@router.post("/strategy/share/{product_id}", response_model=CommonOut, tags=["用户端——策略信息"])
+async def share_strategy(product_id: str):
+    """记录一次分享"""
+    online = await db.scalar(
+        db.select([QStrategy.product_id]).where(
+            (QStrategy.product_id == product_id)
+            & (QStrategy.status == int(ListStatus.online))
+        )
+    )
+    if not online:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "未找到该策略")
+    await counter.incr(ProductType.qstrategy, product_id, "share_cnt")
+    return CommonOut()
+
+
 @router.post(
     "/strategy/list", response_model=BuyedQStrategySearchOut, tags=["用户端——策略信息"]
 )
 async def list_strategies(
     schema_in: BuyedQStrategySearch,
-    current_user: MarketUser = Depends(require_active_user),
+    current_user: CachedUser = Depends(require_active_user),
 ):
     """列出已购买策略"""
     count_query = db.select([db.func.count(UserOrder.id)]).where(
@@ -207,6 +225,7 @@ async def list_strategies(
     for i in strategy_list1:
         if i not in strategy_list2:
             strategy_list2.append(i)
+    await counter.merge_pending(ProductType.qstrategy, strategy_list2)
     data = []
     for strategy in strategy_list2:
         total_count+=1
@@ -219,21 +238,22 @@ async def list_strategies(
 @router.post("/strategy/find", response_model=QStrategySearchOut, tags=["用户端——策略信息"])
 async def user_search_strategy(schema_in: QStrategySearch):
     """搜索策略"""
-    return await search_strategy(schema_in)
+    return await search_strategy(schema_in, count_mode=CountMode.cached)
 
 
-@router.post(
-    "/strategy/find/ov", response_model=QStrategySearchOVOut, tags=["用户端——策略信息"]
-)
-async def strategy_overview(schema_in: QStrategySearch):
-    """首页策略列表"""
-    sort = schema_in.sort
+async def _overview_rows(strategies):
+    """组装首页策略列表的数据"""
     data = []
-    total_cnt, strategies = await search_strategy(schema_in, return_strategy_list=True)
+    run_infos = await load_run_infos(
+        TaskType.PAPER_TRADING,
+        [strategy.task_id for strategy in strategies],
+        keys=("indicators", "sparkline", "today_returns"),
+    )
     for strategy in strategies:
-        indicators = await get_indicators(TaskType.PAPER_TRADING, strategy.task_id)
-        _, curve = await get_curves(TaskType.PAPER_TRADING, strategy.task_id)
-        return_info = await get_today_returns(TaskType.PAPER_TRADING, strategy.task_id)
+        run_info = run_infos[strategy.task_id]
+        indicators = run_info["indicators"]
+        curve = run_info["sparkline"]
+        return_info = run_info["today_returns"]
         # info: Dict[str, Any] = {"curve": [], "bench_curve": []}
         info: Dict[str, Any] = {"curve": [], "bench_curve": []}
         for daily_curve in curve:
@@ -246,6 +266,36 @@ async def strategy_overview(schema_in: QStrategySearch):
             info.update(return_info[0])
         info.update(strategy.__dict__['__values__'])
         data.append(info)
+    return data
+
+
+@router.post(
+    "/strategy/find/ov", response_model=QStrategySearchOVOut, tags=["用户端——策略信息"]
+)
+async def strategy_overview(schema_in: QStrategySearch):
+    """首页策略列表"""
+    sort = schema_in.sort
+    if is_leaderboard_query(schema_in):
+        page = await page_leaderboard(
+            sort, schema_in.market_id, schema_in.offset, schema_in.count
+        )
+        if page is not None:
+            # 直接按排行榜分页，只获取当前页策略的运行信息
+            total_cnt, product_ids = page
+            strategies = await QStrategy.query.where(
+                QStrategy.product_id.in_(product_ids)
+            ).where(QStrategy.status == int(ListStatus.online)).gino.all()
+            strategy_dict = {strategy.product_id: strategy for strategy in strategies}
+            strategies = [
+                strategy_dict[product_id]
+                for product_id in product_ids
+                if product_id in strategy_dict
+            ]
+            data = await _overview_rows(strategies)
+            return QStrategySearchOVOut(total=total_cnt, data=data)
+
+    total_cnt, strategies = await search_strategy(schema_in, return_strategy_list=True)
+    data = await _overview_rows(strategies)
     #return QStrategySearchOVOut(total=total_cnt, data=data)
     total_cnt, sort_cum = await sortedd(data, total_cnt, sort)
     #print(total_cnt,'total_cnt---111111111111111111')
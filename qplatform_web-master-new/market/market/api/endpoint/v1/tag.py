@@ -2,8 +2,9 @@ import logging
 
 from fastapi import APIRouter  # , Depends
 
-from market.api.share.tag import search_tag
-from market.schemas.tag import TagSearch, TagSearchOut
+from market.api.share.pagination import CountMode
+from market.api.share.tag import search_tag, search_tag_facets
+from market.schemas.tag import TagFacet, TagFacetOut, TagFacetSearch, TagSearch, TagSearchOut
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -14,4 +15,15 @@ async def user_search_tag(
     schema_in: TagSearch,  # , current_user: MarketUser = Depends(require_active_user)
 ):
     """根据名字和类型查询标签或者风格"""
-    return await search_tag(schema_in)
+    return await search_tag(schema_in, count_mode=CountMode.cached)
+
+
+@router.post("/tag/facets", response_model=TagFacetOut, tags=["用户端——风格和标签页"])
+async def user_tag_facets(schema_in: TagFacetSearch):
+    """上架的策略 / 套餐中各个标签的数量，按数量倒序"""
+    facets = await search_tag_facets(schema_in)
+    data = [
+        TagFacet(name=name, count=count)
+        for name, count in sorted(facets.items(), key=lambda item: -item[1])
+    ]
+    return TagFacetOut(total=len(data), data=data)
@@ -1,16 +1,21 @@
 from datetime import timedelta
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, Response
+from starlette.requests import Request
 
 from market import config
 from market.api.share.sms import send_verify_email, send_verify_sms, verify_auth_code
 from market.api.share.verification_code import generate_verification_code, verify_code
 from market.core.security import (
     APIKEY_HEADER_NAME,
+    CachedUser,
     authenticate_user,
     create_access_token,
     get_password_hash,
+    invalidate_user,
     require_active_user,
+    require_active_user_row,
+    user_login_guard,
     verify_password,
 )
 from market.models import MarketUser, StrategyMarket
@@ -26,6 +31,7 @@ from market.schemas.user import (
     UserRsp,
     UserUpdate,
 )
+from market.utils import client_ip
 
 router = APIRouter()
 
@@ -115,8 +121,10 @@ async def register_user(user_in: UserCreate, response: Response):
     market = await StrategyMarket.get(int(config.MARKET_ID))
     if not market:
         raise HTTPException(status_code=500, detail="配置错误，请联系管理员！")
+    user_uuid = uuid.uuid1()
+    password = await get_password_hash(user_in.password, user_uuid.hex)
     user_data = user_in.dict()
-    user_data["password"] = get_password_hash(user_in.password)
+    user_data["password"] = password
     user_data["market"] = market
     user_data["status"] = int(UserStatus.normal)
     #user = await MarketUser.create(**user_data)
@@ -124,8 +132,8 @@ async def register_user(user_in: UserCreate, response: Response):
             name = user_in.name,
             phone = user_in.phone,
             email = user_in.email,
-            uuid=uuid.uuid1().hex,
-            password = get_password_hash(user_in.password),
+            uuid=user_uuid.hex,
+            password = password,
             #sms_code = user_in.sms_code,
             broker_id = user_in.broker_id,
             #vcode_id = user_in.vcode_id,
@@ -133,6 +141,7 @@ async def register_user(user_in: UserCreate, response: Response):
             market_id = int(market.id),
             status = int(UserStatus.normal),
             )
+    await user_login_guard.forget_unknown(user_in.name, user_in.phone, user_in.email)
 
     access_token_expires = timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
     #print(user.uuid.hex,'uuid--------1222222222221111111111111')
@@ -146,7 +155,7 @@ async def register_user(user_in: UserCreate, response: Response):
 
 
 @router.post("/user/login", response_model=UserToken, tags=["用户端——用户和登录"])
-async def login(user_in: UserIn, response: Response):
+async def login(user_in: UserIn, request: Request, response: Response):
     """
     OAuth2 compatible token login, get an access token for future requests
     """
@@ -160,7 +169,9 @@ async def login(user_in: UserIn, response: Response):
         #print(user.id,'user---333333333333333')
     elif user_in.password:
         await verify_code(user_in.vcode_id, user_in.vcode)
-        user = await authenticate_user(user_in.uid, user_in.password)
+        user = await authenticate_user(
+            user_in.uid, user_in.password, client_ip=client_ip(request)
+        )
         if not user:
             raise HTTPException(status_code=400, detail="用户 ID/ 密码错误")
     else:
@@ -182,7 +193,7 @@ async def login(user_in: UserIn, response: Response):
 
 
 @router.post("/user/logout", response_model=CommonOut, tags=["用户端——用户和登录"])
-def user_logout(current_user: MarketUser = Depends(require_active_user)):
+def user_logout(current_user: CachedUser = Depends(require_active_user)):
     """
     Update own user.
     """
@@ -210,7 +221,8 @@ async def recover_password(schema_in: ResetPassword):
             detail="The user with this email/phone does not exist in the system.",
         )
     #await user.password == get_password_hash(schema_in.password)
-    await user.update(password=get_password_hash(schema_in.password, user.uuid.hex)).apply()
+    await user.update(password=await get_password_hash(schema_in.password, user.uuid.hex)).apply()
+    invalidate_user(user.uuid)
     #await user.save()
     # verify_code = "1234"
     # if schema_in.phone:
@@ -224,22 +236,25 @@ async def recover_password(schema_in: ResetPassword):
     "/user/update-password", response_model=CommonOut, tags=["用户端——用户和登录"],
 )
 async def update_password(
-    update_in: UpdatePassword, current_user: MarketUser = Depends(require_active_user)
+    update_in: UpdatePassword,
+    current_user: MarketUser = Depends(require_active_user_row),
 ):
     """
     Reset password
     """
-    if not verify_password(update_in.old_pwd, current_user.password):
+    if not await verify_password(update_in.old_pwd, current_user.password, current_user.uuid.hex):
         raise HTTPException(status_code=400, detail="incorrect password")
 
-    current_user.password = get_password_hash(update_in.new_pwd)
-    await current_user.save()
+    await current_user.update(
+        password=await get_password_hash(update_in.new_pwd, current_user.uuid.hex)
+    ).apply()
+    invalidate_user(current_user.uuid)
     return CommonOut()
 
 
 @router.post("/user/edit", response_model=UserRsp, tags=["用户端——用户和登录"])
 def update_user_me(
-    schema_in: UserUpdate, current_user: MarketUser = Depends(require_active_user)
+    schema_in: UserUpdate, current_user: CachedUser = Depends(require_active_user)
 ):
     """
     Update own user.
@@ -248,7 +263,7 @@ def update_user_me(
 
 
 @router.get("/user/{user_id}", response_model=UserRsp, tags=["用户端——用户和登录"])
-def read_user_me(current_user: MarketUser = Depends(require_active_user)):
+def read_user_me(current_user: MarketUser = Depends(require_active_user_row)):
     """
     Get current user.
     """
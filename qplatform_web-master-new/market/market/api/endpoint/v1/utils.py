@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from market.core.security import require_active_admin
+from market.core.security import CachedAdmin, require_active_admin
 from market.core.celery_app import celery_app
-from market.models.user import MarketUser
 from market.utils import send_test_email
 
 router = APIRouter()
@@ -11,7 +10,7 @@ router = APIRouter()
 
 @router.post("/test-celery/", response_model=Msg, status_code=201)
 def test_celery(
-    msg: Msg, current_user: MarketUser = Depends(require_active_admin)
+    msg: Msg, current_user: CachedAdmin = Depends(require_active_admin)
 ):
     """
     Test Celery worker.
@@ -22,7 +21,7 @@ def test_celery(
 
 @router.post("/test-email/", response_model=Msg, status_code=201)
 def test_email(
-    email_to: EmailStr, current_user: MarketUser = Depends(require_active_admin)
+    email_to: EmailStr, current_user: CachedAdmin = Depends(require_active_admin)
 ):
     """
     Test emails.
@@ -0,0 +1,210 @@
+"""策略 / 套餐的浏览、收藏、分享计数
+
+计数先在 redis 中累加（每种商品一个 hash，field 为 "product_id:列名"），
+后台任务定时把增量用一条 UPDATE ... FROM (VALUES ...) 批量写入数据库，
+避免每次浏览都更新商品行。浏览数按访客去重：每个商品每天一个 HyperLogLog，
+访客当天第一次浏览才计数
+"""
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import aioredis
+
+from market import config
+from market.ctx import ctx
+from market.models import QStrategy, StrategyPackage, db
+from market.models.const import ProductType
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = ("view_cnt", "collect_cnt", "share_cnt")
+COUNTER_MODELS = {
+    ProductType.qstrategy: QStrategy,
+    ProductType.package: StrategyPackage,
+}
+LOCK_KEY = "counter_flush_lock"
+
+
+def delta_key(product_type: ProductType) -> str:
+    return f"counter_delta_{int(product_type)}"
+
+
+def flushing_key(product_type: ProductType) -> str:
+    """正在写入数据库的增量，写入失败时下次继续写入"""
+    return f"counter_delta_{int(product_type)}_flushing"
+
+
+def visitor_key(product_type: ProductType, product_id: str) -> str:
+    return f"counter_uv_{int(product_type)}_{product_id}_{datetime.date.today():%Y%m%d}"
+
+
+async def incr(product_type: ProductType, product_id: str, column: str, delta: int = 1):
+    """累加计数，column 为 view_cnt / collect_cnt / share_cnt，取消收藏时 delta 为 -1"""
+    if column not in COUNTER_COLUMNS:
+        raise ValueError(f"unknown counter column: {column}")
+    if not ctx.redis_client:
+        return
+    await ctx.redis_client.hincrby(
+        delta_key(product_type), f"{product_id}:{column}", delta
+    )
+
+
+async def record_view(product_type: ProductType, product_id: str, visitor: str):
+    """记录一次浏览，同一访客每天只计一次"""
+    if not ctx.redis_client:
+        return
+    key = visitor_key(product_type, product_id)
+    tr = ctx.redis_client.multi_exec()
+    added = tr.pfadd(key, visitor)
+    tr.expire(key, 60 * 60 * 48)
+    await tr.execute()
+    if await added:
+        await incr(product_type, product_id, "view_cnt")
+
+
+async def pending_counts(
+    product_type: ProductType, product_ids: Iterable[str]
+) -> Dict[str, Dict[str, int]]:
+    """redis 中还没有写入数据库的增量，加上数据库中的值即为最新计数"""
+    product_ids = list(product_ids)
+    if not product_ids or not ctx.redis_client:
+        return {}
+    fields = [f"{pid}:{column}" for pid in product_ids for column in COUNTER_COLUMNS]
+    tr = ctx.redis_client.multi_exec()
+    current = tr.hmget(delta_key(product_type), *fields)
+    flushing = tr.hmget(flushing_key(product_type), *fields)
+    await tr.execute()
+    counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for field, a, b in zip(fields, await current, await flushing):
+        if a is None and b is None:
+            continue
+        product_id, column = field.rsplit(":", 1)
+        counts[product_id][column] = int(a or 0) + int(b or 0)
+    return counts
+
+
+async def merge_pending(product_type: ProductType, items: Iterable):
+    """把还没有写入数据库的增量加到查出的商品上（只改内存中的值），返回的计数不再滞后"""
+    items = [item for item in items if item is not None]
+    pending = await pending_counts(product_type, {str(item.product_id) for item in items})
+    for item in items:
+        for column, delta in pending.get(str(item.product_id), {}).items():
+            setattr(item, column, (getattr(item, column) or 0) + delta)
+    return items
+
+
+def _parse_deltas(raw: Dict[str, str]) -> List[Tuple[str, int, int, int]]:
+    deltas: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for field, value in raw.items():
+        product_id, column = field.rsplit(":", 1)
+        if column in COUNTER_COLUMNS and int(value):
+            deltas[product_id][column] = int(value)
+    return [
+        (pid, *(values.get(column, 0) for column in COUNTER_COLUMNS))
+        for pid, values in deltas.items()
+    ]
+
+
+async def write_deltas(product_type: ProductType, rows: List[Tuple[str, int, int, int]]):
+    """一条 UPDATE ... FROM (VALUES ...) 写入多个商品的增量"""
+    if not rows:
+        return 0
+    table = COUNTER_MODELS[product_type].__tablename__
+    values = []
+    params = {}
+    for i, (product_id, *deltas) in enumerate(rows):
+        params[f"p{i}"] = product_id
+        placeholders = [f"CAST(:p{i} AS varchar)"]
+        for column, delta in zip(COUNTER_COLUMNS, deltas):
+            params[f"{column}{i}"] = delta
+            placeholders.append(f"CAST(:{column}{i} AS integer)")
+        values.append(f"({', '.join(placeholders)})")
+    sets = ", ".join(f"{c} = t.{c} + v.{c}" for c in COUNTER_COLUMNS)
+    sql = (
+        f"UPDATE {table} AS t SET {sets} "
+        f"FROM (VALUES {', '.join(values)}) "
+        f"AS v(product_id, {', '.join(COUNTER_COLUMNS)}) "
+        "WHERE t.product_id = v.product_id"
+    )
+    await db.status(db.text(sql), **params)
+    return len(rows)
+
+
+async def _claim(redis, key: str, fields: List[str]) -> Dict[str, str]:
+    """在一个事务中读取并删除这些增量，同时运行的 flush 不会重复写入"""
+    tr = redis.multi_exec()
+    values = tr.hmget(key, *fields)
+    tr.hdel(key, *fields)
+    await tr.execute()
+    return {f: v for f, v in zip(fields, await values) if v is not None}
+
+
+async def _restore(redis, product_type: ProductType, claimed: Dict[str, str]):
+    """写入失败时把已取出的增量加回 delta key，下次重试"""
+    tr = redis.multi_exec()
+    for field, value in claimed.items():
+        tr.hincrby(delta_key(product_type), field, int(value))
+    await tr.execute()
+
+
+async def flush(product_type: ProductType) -> int:
+    """把 redis 中的增量写入数据库，返回写入的商品数
+
+    增量先 RENAMENX 到 flushing key（期间的新增量在新的 delta key 中），
+    每批写入前在事务中取出并删除该批增量，锁过期后其它进程同时 flush 也不会重复写入；
+    写入失败时把该批增量加回 delta key
+    """
+    redis = ctx.redis_client
+    src, dst = delta_key(product_type), flushing_key(product_type)
+    if not await redis.exists(dst):
+        if not await redis.exists(src):
+            return 0
+        try:
+            await redis.renamenx(src, dst)
+        except aioredis.ReplyError:
+            # src 已被其它进程 rename
+            pass
+    product_ids = sorted({field.rsplit(":", 1)[0] for field in await redis.hkeys(dst)})
+    count = 0
+    for i in range(0, len(product_ids), config.COUNTER_FLUSH_BATCH_SIZE):
+        fields = [
+            f"{pid}:{column}"
+            for pid in product_ids[i : i + config.COUNTER_FLUSH_BATCH_SIZE]
+            for column in COUNTER_COLUMNS
+        ]
+        claimed = await _claim(redis, dst, fields)
+        try:
+            count += await write_deltas(product_type, _parse_deltas(claimed))
+        except Exception:
+            await _restore(redis, product_type, claimed)
+            raise
+    return count
+
+
+async def flush_all():
+    for product_type in COUNTER_MODELS:
+        count = await flush(product_type)
+        if count:
+            logger.info("flushed %s %s counters", count, product_type.name)
+
+
+async def counter_flusher():
+    """后台定时写入计数，多个进程之间通过 redis 锁只写入一次"""
+    while True:
+        await asyncio.sleep(config.COUNTER_FLUSH_INTERVAL)
+        try:
+            locked = await ctx.redis_client.set(
+                LOCK_KEY,
+                "1",
+                expire=config.COUNTER_FLUSH_INTERVAL,
+                exist=ctx.redis_client.SET_IF_NOT_EXIST,
+            )
+            if locked:
+                await flush_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("flush counters failed")
@@ -0,0 +1,61 @@
+"""收益曲线降采样
+
+列表页的缩略图只需要固定数量的点，用 LTTB (Largest-Triangle-Three-Buckets)
+算法保留曲线的形状，同一个任务的收益和基准收益使用相同的采样点
+"""
+from typing import Dict, List
+
+import numpy as np
+
+
+def lttb_indices(values: np.ndarray, n_out: int) -> np.ndarray:
+    """用 LTTB 算法选出 n_out 个点，返回被选中点的下标
+
+    横坐标使用点的序号（交易日），首尾两点总是保留
+    """
+    n = len(values)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.linspace(0, n - 1, n_out).round().astype(np.int64)
+
+    y = values.astype(np.float64)
+    # 中间的点平均分到 n_out - 2 个桶里，edges[i]:edges[i+1] 为第 i 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    avg_x = np.add.reduceat(np.arange(n - 1, dtype=np.float64), edges[:-1]) / sizes
+    avg_y = np.add.reduceat(y[: n - 1], edges[:-1]) / sizes
+    # 每个桶计算面积时用下一个桶的均值点，最后一个桶用曲线的最后一点
+    next_x = np.append(avg_x[1:], n - 1)
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        xs = np.arange(start, end)
+        area = np.abs(
+            (a - next_x[i]) * (y[start:end] - y[a]) - (a - xs) * (next_y[i] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_curve(curve: List[Dict], max_points: int) -> List[Dict]:
+    """按收益（returns）降采样收益曲线，点数不超过 max_points
+
+    :param curve: 按 day 升序排列的 [{"day": xx, "returns": xx, "bench_returns": xx}, ...]
+    :param max_points: 最多保留的点数
+    """
+    if not max_points or len(curve) <= max_points:
+        return curve
+    values = np.fromiter(
+        (point.get("returns") or 0.0 for point in curve),
+        dtype=np.float64,
+        count=len(curve),
+    )
+    np.nan_to_num(values, copy=False)
+    return [curve[i] for i in lttb_indices(values, max_points)]
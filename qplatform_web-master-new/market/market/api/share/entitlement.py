@@ -0,0 +1,114 @@
+"""用户购买权限缓存
+
+task_id -> package_id 以及 (user_id, package_id) -> 订单到期时间 都缓存在
+进程内 LRU + redis 中；到期时间过后权限自然失效，订单支付 / 取消 / 过期时主动删除缓存
+"""
+import datetime
+import logging
+from typing import Optional
+
+from market import config
+from market.const import TaskType
+from market.core.cache import LRUCache, TwoTierCache
+from market.models import QStrategy, UserOrder, db
+from market.models.const import OrderStatus, ProductType
+
+logger = logging.getLogger(__name__)
+
+# 没有对应套餐 / 没有有效订单时也缓存，用空字符串 / 0 表示
+_NO_PACKAGE = ""
+_NO_ENTITLEMENT = 0
+
+task_packages = TwoTierCache(
+    "task_package_",
+    LRUCache(config.ENTITLEMENT_LOCAL_SIZE, config.ENTITLEMENT_LOCAL_TTL),
+    redis_ttl=config.ENTITLEMENT_CACHE_TTL,
+)
+entitlements = TwoTierCache(
+    "entitlement_",
+    LRUCache(config.ENTITLEMENT_LOCAL_SIZE, config.ENTITLEMENT_LOCAL_TTL),
+    redis_ttl=config.ENTITLEMENT_CACHE_TTL,
+)
+
+
+def _task_key(task_type: TaskType, task_id: str) -> str:
+    return f"{task_type.value}:{task_id}"
+
+
+def _entitlement_key(user_id: int, package_id: str) -> str:
+    return f"{user_id}:{package_id}"
+
+
+async def get_task_package(task_type: TaskType, task_id: str) -> Optional[str]:
+    """获取任务所属策略的套餐 id，模拟交易按 task_id，其它按 bt_task_id 查找"""
+    key = _task_key(task_type, task_id)
+    package_id = await task_packages.get(key)
+    if package_id is None:
+        if task_type == TaskType.PAPER_TRADING:
+            column = QStrategy.task_id
+        else:
+            column = QStrategy.bt_task_id
+        row = await QStrategy.select("package_id").where(column == task_id).gino.first()
+        package_id = (row and row["package_id"]) or _NO_PACKAGE
+        await task_packages.set(key, package_id)
+    return package_id or None
+
+
+async def get_entitlement_expire(
+    user_id: int, package_id: str
+) -> Optional[datetime.datetime]:
+    """获取用户购买套餐的到期时间，没有有效订单时返回 None"""
+    key = _entitlement_key(user_id, package_id)
+    expire_ts = await entitlements.get(key)
+    if expire_ts is None:
+        expire_dt = await db.select([db.func.max(UserOrder.expire_dt)]).where(
+            UserOrder.user_id == user_id
+        ).where(UserOrder.product_type == int(ProductType.package)).where(
+            UserOrder.product_id == package_id
+        ).where(
+            UserOrder.status == int(OrderStatus.payed)
+        ).where(
+            UserOrder.expire_dt > datetime.datetime.now()
+        ).gino.scalar()
+        expire_ts = expire_dt.timestamp() if expire_dt else _NO_ENTITLEMENT
+        await entitlements.set(key, expire_ts)
+    if not expire_ts:
+        return None
+    expire_dt = datetime.datetime.fromtimestamp(expire_ts)
+    if expire_dt <= datetime.datetime.now():
+        return None
+    return expire_dt
+
+
+async def has_task_entitlement(user_id: int, task_type: TaskType, task_id: str) -> bool:
+    """用户是否购买了任务所属的套餐且未到期"""
+    package_id = await get_task_package(task_type, task_id)
+    if not package_id:
+        logger.debug("no package found for task %s[%s]", task_id, task_type)
+        return False
+    return await get_entitlement_expire(user_id, package_id) is not None
+
+
+async def invalidate_entitlement(user_id: int, product_type: int, product_id: str):
+    if product_type != int(ProductType.package) or user_id is None:
+        return
+    await entitlements.delete(_entitlement_key(user_id, product_id))
+
+
+async def invalidate_order(order: UserOrder):
+    """订单支付 / 取消 / 过期后删除对应的权限缓存"""
+    await invalidate_entitlement(order.user_id, order.product_type, order.product_id)
+
+
+async def invalidate_strategy(product_id: str):
+    """策略的套餐变更后删除 task_id -> package_id 缓存"""
+    row = await QStrategy.select("task_id", "bt_task_id").where(
+        QStrategy.product_id == product_id
+    ).gino.first()
+    if not row:
+        return
+    await task_packages.delete(_task_key(TaskType.PAPER_TRADING, row["task_id"]))
+    if row["bt_task_id"]:
+        for task_type in TaskType:
+            if task_type != TaskType.PAPER_TRADING:
+                await task_packages.delete(_task_key(task_type, row["bt_task_id"]))
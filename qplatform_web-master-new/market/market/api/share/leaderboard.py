@@ -0,0 +1,209 @@
+"""首页策略排行榜
+
+把上架策略的排序字段写入 redis 有序集合（每个排序字段、每个超市一个），
+首页列表直接按排名分页，只需要获取当前页策略的运行信息
+"""
+import asyncio
+import hashlib
+import logging
+import math
+from typing import Dict, List, Optional, Tuple
+
+from market import config
+from market.api.share.run_info import load_run_infos
+from market.const import TaskType
+from market.ctx import ctx
+from market.models import QStrategy
+from market.models.const import ListStatus
+from market.schemas.strategy import QStrategySearch
+
+logger = logging.getLogger(__name__)
+
+# 排序参数 -> (排序字段, 是否倒序)，与 sortedd 保持一致
+SORT_KEYS = {
+    "1": ("cum_returns", False),
+    "-1": ("cum_returns", True),
+    "2": ("daily_returns", False),
+    "-2": ("daily_returns", True),
+    "3": ("annual_returns", False),
+    "-3": ("annual_returns", True),
+    "4": ("max_drawdown", False),
+    "-4": ("max_drawdown", True),
+    "5": ("sim_start_cash", False),
+    "-5": ("sim_start_cash", True),
+}
+DEFAULT_SORT = "-1"
+SORT_FIELDS = sorted({field for field, _ in SORT_KEYS.values()})
+# 所有超市汇总的排行榜
+ALL_MARKETS = 0
+
+LOCK_KEY = "leaderboard_refresh_lock"
+# 各排行榜内容的摘要，内容没有变化时不重复写 redis
+DIGEST_KEY = "leaderboard_digest"
+
+
+def leaderboard_key(field: str, market_id: int) -> str:
+    return f"leaderboard_{field}_{market_id}"
+
+
+def missing_key(field: str, market_id: int) -> str:
+    """没有该排序字段的策略，排在有序集合之后"""
+    return f"leaderboard_{field}_{market_id}_missing"
+
+
+def is_leaderboard_query(schema_in: QStrategySearch) -> bool:
+    """只按超市过滤的首页查询可以直接使用排行榜"""
+    if schema_in.status and schema_in.status != ListStatus.online:
+        return False
+    return not any(
+        (
+            schema_in.fuzzy,
+            schema_in.product_id,
+            schema_in.name,
+            schema_in.task_id,
+            schema_in.package_id,
+            schema_in.style,
+            schema_in.tag,
+            schema_in.tags_all,
+            schema_in.tags_any,
+            schema_in.category,
+        )
+    )
+
+
+def _score(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return value
+
+
+async def collect_sort_values(
+    strategies: List[QStrategy],
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """获取策略各个排序字段的值，{product_id: {field: value}}"""
+    run_infos = await load_run_infos(
+        TaskType.PAPER_TRADING,
+        [strategy.task_id for strategy in strategies],
+        keys=("indicators", "today_returns"),
+    )
+    values = {}
+    for strategy in strategies:
+        run_info = run_infos[strategy.task_id]
+        info = dict(run_info["indicators"])
+        if run_info["today_returns"]:
+            info.update(run_info["today_returns"][-1])
+        info["sim_start_cash"] = strategy.sim_start_cash
+        values[strategy.product_id] = {
+            field: _score(info.get(field)) for field in SORT_FIELDS
+        }
+    return values
+
+
+def _digest(scores: Dict[str, Optional[float]]) -> str:
+    return hashlib.md5(repr(sorted(scores.items())).encode()).hexdigest()
+
+
+async def _write_board(
+    field: str, market_id: int, scores: Dict[str, Optional[float]]
+):
+    key = leaderboard_key(field, market_id)
+    key_missing = missing_key(field, market_id)
+    ranked: List = []
+    missing: List = []
+    for product_id, score in scores.items():
+        if score is None:
+            missing.extend((0, product_id))
+        else:
+            ranked.extend((score, product_id))
+    # 在一个事务里替换，读到的要么是旧榜单要么是新榜单
+    tr = ctx.redis_client.multi_exec()
+    tr.delete(key, key_missing)
+    if ranked:
+        tr.zadd(key, *ranked)
+    if missing:
+        tr.zadd(key_missing, *missing)
+    if scores:
+        tr.hset(DIGEST_KEY, f"{field}:{market_id}", _digest(scores))
+    else:
+        tr.hdel(DIGEST_KEY, f"{field}:{market_id}")
+    await tr.execute()
+
+
+async def refresh_leaderboards():
+    """重新计算所有上架策略的排序字段并写入 redis"""
+    strategies = await QStrategy.query.where(
+        QStrategy.status == int(ListStatus.online)
+    ).gino.all()
+    values = await collect_sort_values(strategies)
+    boards: Dict[Tuple[str, int], Dict[str, Optional[float]]] = {}
+    for strategy in strategies:
+        market_ids = {ALL_MARKETS}
+        if strategy.market_id:
+            market_ids.add(strategy.market_id)
+        for market_id in market_ids:
+            for field in SORT_FIELDS:
+                boards.setdefault((field, market_id), {})[
+                    strategy.product_id
+                ] = values[strategy.product_id][field]
+
+    digests = await ctx.redis_client.hgetall(DIGEST_KEY)
+    for (field, market_id), scores in boards.items():
+        if digests.get(f"{field}:{market_id}") == _digest(scores):
+            continue
+        await _write_board(field, market_id, scores)
+    # 已经没有上架策略的超市，清空其排行榜
+    for name in digests:
+        field, market_id = name.rsplit(":", 1)
+        if (field, int(market_id)) not in boards:
+            await _write_board(field, int(market_id), {})
+    logger.info("leaderboard refreshed, %s strategies", len(strategies))
+
+
+async def page_leaderboard(
+    sort: Optional[str], market_id: Optional[int], offset: int, count: int
+) -> Optional[Tuple[int, List[str]]]:
+    """按排行榜分页，返回 (总数, 当前页的 product_id 列表)，排行榜未生成时返回 None"""
+    field, reverse = SORT_KEYS.get(sort or DEFAULT_SORT, SORT_KEYS[DEFAULT_SORT])
+    market_id = market_id or ALL_MARKETS
+    key = leaderboard_key(field, market_id)
+    key_missing = missing_key(field, market_id)
+    redis = ctx.redis_client
+    ranked_cnt, missing_cnt = await asyncio.gather(
+        redis.zcard(key), redis.zcard(key_missing)
+    )
+    total = ranked_cnt + missing_cnt
+    if not total:
+        return None
+
+    product_ids: List[str] = []
+    if offset < ranked_cnt:
+        zrange = redis.zrevrange if reverse else redis.zrange
+        product_ids.extend(await zrange(key, offset, offset + count - 1))
+    remain = count - len(product_ids)
+    if remain > 0 and missing_cnt:
+        start = max(0, offset - ranked_cnt)
+        product_ids.extend(await redis.zrange(key_missing, start, start + remain - 1))
+    return total, product_ids
+
+
+async def leaderboard_refresher():
+    """后台定时刷新排行榜，多个进程之间通过 redis 锁只刷新一次"""
+    while True:
+        try:
+            locked = await ctx.redis_client.set(
+                LOCK_KEY,
+                "1",
+                expire=config.LEADERBOARD_REFRESH_INTERVAL,
+                exist=ctx.redis_client.SET_IF_NOT_EXIST,
+            )
+            if locked:
+                await refresh_leaderboards()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("refresh leaderboard failed")
+        await asyncio.sleep(config.LEADERBOARD_REFRESH_INTERVAL)
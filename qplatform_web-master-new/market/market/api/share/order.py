@@ -1,89 +1,86 @@
 import logging
 
-from sqlalchemy import text
-
+from market.api.share.pagination import CountMode, paginate
 from market.models import MarketUser, UserOrder, db
 from market.models.const import OrderStatus
-from market.schemas.order import OrderInfo, OrderSearch, OrderSearchOut
+from market.schemas.order import OrderInfo, OrderSearch, OrderSearchOut, SearchOrder
 
 logger = logging.getLogger(__name__)
 
 
 async def show_order(order_id: int):
     """查看订单详情"""
-    order = UserOrder.get_or_none(id=order_id)
+    order = await UserOrder.get(order_id)
     if order:
-        return OrderInfo(**order.__dict__)
+        return OrderInfo(**order.__dict__["__values__"])
     return None
 
 
-async def search_order(schema_in: OrderSearch):
-    """搜索用户的订单列表"""
-    count_query = db.select([db.func.count(UserOrder.id)]).where(
-        UserOrder.status != int(OrderStatus.deleted)
-    )
-    fetch_query = UserOrder.query.where(UserOrder.status != int(OrderStatus.deleted))
+# 订单列表只查询 SearchOrder 用到的列
+SEARCH_ORDER_COLUMNS = [
+    getattr(UserOrder, name)
+    for name in SearchOrder.__fields__
+    if name not in ("user_id", "user_name", "user_phone")
+]
+DELETED_USER = {"user_id": -1, "user_name": "deleted", "user_phone": "100000000000"}
+
+
+async def search_order(schema_in: OrderSearch, *, count_mode: CountMode = CountMode.exact):
+    """搜索用户的订单列表，订单和用户信息在一次 JOIN 查询中取出"""
+    conditions = [UserOrder.status != int(OrderStatus.deleted)]
     if schema_in.fuzzy:  # 订单模糊搜索，账户和订单 ID
-        fuzzy_check = (
-            UserOrder.user_id.phone.contains(schema_in.fuzzy)
-            | UserOrder.user_id.email.contains(schema_in.fuzzy)
-            | UserOrder.user_id.name.contains(schema_in.fuzzy)
+        matched_users = db.select([MarketUser.id]).where(
+            MarketUser.phone.contains(schema_in.fuzzy, autoescape=True)
+            | MarketUser.email.contains(schema_in.fuzzy, autoescape=True)
+            | MarketUser.name.contains(schema_in.fuzzy, autoescape=True)
         )
+        fuzzy_check = UserOrder.user_id.in_(matched_users)
         try:
-            order_id = int(schema_in.fuzzy)
-            fuzzy_check |= UserOrder.id == order_id
+            fuzzy_check |= UserOrder.id == int(schema_in.fuzzy)
         except ValueError:
             pass
-        fetch_query = fetch_query.where(fuzzy_check)
-        count_query = count_query.where(fuzzy_check)
+        conditions.append(fuzzy_check)
     if schema_in.product_id:
-        product_id = schema_in.product_id
-        try:
-            fetch_query = fetch_query.where(UserOrder.product_id.contains(product_id))
-            count_query = count_query.where(UserOrder.product_id.contains(product_id))
-        except ValueError:
-            pass
+        conditions.append(
+            UserOrder.product_id.contains(schema_in.product_id, autoescape=True)
+        )
     if schema_in.order_id:
-        fetch_query = fetch_query.where(UserOrder.id == schema_in.order_id)
-        count_query = count_query.where(UserOrder.id == schema_in.order_id)
+        conditions.append(UserOrder.id == schema_in.order_id)
     if schema_in.user_id:
-        fetch_query = fetch_query.where(UserOrder.user_id == schema_in.user_id)
-        count_query = count_query.where(UserOrder.user_id == schema_in.user_id)
-    if schema_in.product_id:
-        fetch_query = fetch_query.filter(UserOrder.product_id == schema_in.product_id)
-        count_query = count_query.where(UserOrder.user_id == schema_in.user_id)
+        conditions.append(UserOrder.user_id == schema_in.user_id)
     if schema_in.product_type:
-        fetch_query = fetch_query.where(
-            UserOrder.product_type == int(schema_in.product_type)
-        )
-        count_query = count_query.where(
-            UserOrder.product_type == int(schema_in.product_type)
-        )
+        conditions.append(UserOrder.product_type == int(schema_in.product_type))
     if schema_in.status:
-        fetch_query = fetch_query.where(UserOrder.status == int(schema_in.status))
-        count_query = count_query.where(UserOrder.status == int(schema_in.status))
+        conditions.append(UserOrder.status == int(schema_in.status))
 
-    total_count = await db.scalar(count_query)
-    orders = (
-        await fetch_query.order_by(text("-id"))
-        .offset(schema_in.offset)
-        .limit(schema_in.count)
-        .gino.all()
+    # 状态 / 删除标记也是过滤条件，估计值包含所有行，只能用于不带任何条件的查询
+    if conditions and count_mode == CountMode.estimated:
+        count_mode = CountMode.exact
+    where = db.and_(*conditions)
+    total_count, rows = await paginate(
+        db.select(
+            [
+                *SEARCH_ORDER_COLUMNS,
+                MarketUser.id.label("user_id"),
+                MarketUser.name.label("user_name"),
+                MarketUser.phone.label("user_phone"),
+            ]
+        )
+        .select_from(
+            UserOrder.outerjoin(MarketUser, UserOrder.user_id == MarketUser.id)
+        )
+        .where(where)
+        .order_by(UserOrder.id.desc()),
+        db.select([db.func.count(UserOrder.id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
+        count_mode,
+        UserOrder.__tablename__,
     )
     data = []
-    print(orders,'orders---222222222222222')
-    for order in orders:
-        print(order.__dict__,'order----111111111111111')
-
-        if order.user:
-            mk = await MarketUser.get(int(order.user_id))
-            info = {
-                "user_id": mk.id,
-                "user_name": mk.name,
-                "user_phone": mk.phone,
-            }
-        else:
-            info = {"user_id": -1, "user_name": "deleted", "user_phone": "100000000000"}
-        info.update(order.__dict__["__values__"])
+    for row in rows:
+        info = dict(row)
+        if info["user_id"] is None:  # 用户已删除
+            info.update(DELETED_USER)
         data.append(info)
     return OrderSearchOut(total=total_count, data=data)
@@ -0,0 +1,127 @@
+"""订单过期
+
+后台任务定时把到期的已支付订单、超时未支付的订单改为超时状态，每批最多
+ORDER_SWEEP_BATCH_SIZE 条（FOR UPDATE SKIP LOCKED，不阻塞正在支付 / 取消的订单），
+并删除对应用户的权限缓存。线下支付的订单由管理员确认或取消，不会超时关闭。
+超时的微信支付订单先关闭微信端的预支付订单（二维码不能再支付），微信返回已支付的
+订单保持待支付，由支付通知 / 对账处理
+"""
+import asyncio
+import datetime
+import logging
+from typing import Dict, List
+
+from market import config
+from market.api.share.entitlement import invalidate_entitlement
+from market.core.pay import PayException, cancel_pay
+from market.ctx import ctx
+from market.models import UserOrder, db
+from market.models.const import OrderStatus, PayMethod
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "order_sweep_lock"
+# 关闭时返回这些错误码的订单在微信端已经不能支付
+CLOSED_CODES = ("ORDERNOTEXIST", "ORDERCLOSED")
+
+
+async def _expire_batch(condition) -> int:
+    """把满足条件的一批订单改为超时，返回更新的数量"""
+    ids = (
+        db.select([UserOrder.id])
+        .where(condition)
+        .limit(config.ORDER_SWEEP_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    rows = await (
+        db.update(UserOrder.__table__)
+        .values(status=int(OrderStatus.expierd), update_dt=datetime.datetime.now())
+        .where(UserOrder.id.in_(ids))
+        .returning(UserOrder.user_id, UserOrder.product_type, UserOrder.product_id)
+        .gino.all()
+    )
+    for row in rows:
+        await invalidate_entitlement(
+            row["user_id"], row["product_type"], row["product_id"]
+        )
+    return len(rows)
+
+
+async def _expire_all(condition) -> int:
+    total = 0
+    while True:
+        count = await _expire_batch(condition)
+        total += count
+        if count < config.ORDER_SWEEP_BATCH_SIZE:
+            return total
+
+
+async def _close_wx_order(order) -> bool:
+    """关闭微信端的预支付订单，返回订单是否可以改为超时"""
+    try:
+        await cancel_pay(order["foreign_order_id"])
+    except PayException as e:
+        if e.code in CLOSED_CODES:
+            return True
+        if e.code == "ORDERPAID":
+            logger.warning("abandoned order %s is payed on wechat", order["id"])
+        else:
+            logger.warning("close wechat order %s failed: %s", order["id"], e)
+        return False
+    return True
+
+
+async def _close_abandoned(cutoff: datetime.datetime) -> int:
+    """关闭超时未支付的微信支付订单，返回更新的数量；关闭失败的订单下次再处理"""
+    total = 0
+    last_id = 0
+    while True:
+        orders = await db.select([UserOrder.id, UserOrder.foreign_order_id]).where(
+            (UserOrder.status == int(OrderStatus.unpayed))
+            & (UserOrder.create_dt <= cutoff)
+            & (UserOrder.pay_method == int(PayMethod.wechat))
+            & (UserOrder.id > last_id)
+        ).order_by(UserOrder.id).limit(config.ORDER_SWEEP_BATCH_SIZE).gino.all()
+        if not orders:
+            return total
+        last_id = orders[-1]["id"]
+        closed = await asyncio.gather(*(_close_wx_order(order) for order in orders))
+        ids: List[int] = [order["id"] for order, ok in zip(orders, closed) if ok]
+        if ids:
+            # 关闭期间可能收到了支付通知，只更新仍然待支付的订单
+            total += await _expire_batch(
+                UserOrder.id.in_(ids) & (UserOrder.status == int(OrderStatus.unpayed))
+            )
+
+
+async def sweep_orders() -> Dict[str, int]:
+    """处理所有到期 / 超时的订单，返回各类更新的数量"""
+    now = datetime.datetime.now()
+    expired = await _expire_all(
+        (UserOrder.status == int(OrderStatus.payed)) & (UserOrder.expire_dt <= now)
+    )
+    abandoned = await _close_abandoned(
+        now - datetime.timedelta(seconds=config.ORDER_PAY_TIMEOUT)
+    )
+    if expired or abandoned:
+        logger.info("swept %s expired and %s abandoned orders", expired, abandoned)
+    return {"expired": expired, "abandoned": abandoned}
+
+
+async def order_sweeper():
+    """后台定时处理过期订单，多个进程之间通过 redis 锁只处理一次"""
+    while True:
+        try:
+            locked = await ctx.redis_client.set(
+                LOCK_KEY,
+                "1",
+                expire=config.ORDER_SWEEP_INTERVAL,
+                exist=ctx.redis_client.SET_IF_NOT_EXIST,
+            )
+            if locked:
+                await sweep_orders()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("sweep orders failed")
+        await asyncio.sleep(config.ORDER_SWEEP_INTERVAL)
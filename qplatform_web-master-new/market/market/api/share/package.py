@@ -3,11 +3,13 @@ from typing import List, Union
 
 from fastapi import HTTPException, status
 from fastapi.exceptions import ValidationError
-from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 
+from market.api.share import counter
+from market.api.share.pagination import CountMode, paginate
+from market.api.share.tag import tag_filter
 from market.models import StrategyPackage, db
-from market.models.const import ListStatus
+from market.models.const import ListStatus, ProductType
 from market.schemas.base import CommonOut
 from market.schemas.package import PkgCreate, PkgSearch, PkgSearchOut, PkgUpdateFields
 
@@ -16,9 +18,11 @@ logger = logging.getLogger(__name__)
 
 async def show_pkg(pkg_id: str):
     """查看策略套餐"""
-    return await StrategyPackage.query.where(
+    pkg = await StrategyPackage.query.where(
         StrategyPackage.product_id == pkg_id
     ).gino.first()
+    await counter.merge_pending(ProductType.package, [pkg])
+    return pkg
 
 
 async def create_package(schema_in: PkgCreate):
@@ -62,57 +66,34 @@ async def change_pkg_status(product_id: str, change_status: ListStatus):
     return CommonOut()
 
 
-async def search_pkg(schema_in: PkgSearch):
+async def search_pkg(schema_in: PkgSearch, *, count_mode: CountMode = CountMode.exact):
     """搜索套餐"""
-    # TODO: support tag search, perphaps need to use raw sql
-    count_query = db.select([db.func.count(StrategyPackage.product_id)])
-    fetch_query = StrategyPackage.query
-    print(count_query,'3333333333333333333333333')
-    print(fetch_query,'22222222222222222222')
+    conditions = []
     if schema_in.status:
-        #count_query = count_query.filter(
-        #    StrategyPackage.status == int(schema_in.status)
-        #)
-        count_query = count_query.where(StrategyPackage.status == int(schema_in.status))
-        #fetch_query = fetch_query.filter(
-        #    StrategyPackage.status == int(schema_in.status)
-        #)
-        fetch_query = fetch_query.where(StrategyPackage.status == int(schema_in.status))
+        conditions.append(StrategyPackage.status == int(schema_in.status))
     else:
-        #count_query = count_query.filter(
-        #    StrategyPackage.status != int(ListStatus.deleted)
-        #)
-        count_query = count_query.where(StrategyPackage.status != int(ListStatus.deleted))
-        #fetch_query = fetch_query.filter(
-        #    StrategyPackage.status != int(ListStatus.deleted)
-        #)
-        fetch_query = fetch_query.where(StrategyPackage.status != int(ListStatus.deleted))
+        conditions.append(StrategyPackage.status != int(ListStatus.deleted))
     if schema_in.product_id:
-        count_query = count_query.where(
-            StrategyPackage.product_id == schema_in.product_id
-        )
-        fetch_query = fetch_query.where(
-            StrategyPackage.product_id == schema_in.product_id
-        )
+        conditions.append(StrategyPackage.product_id == schema_in.product_id)
     if schema_in.name:
-        count_query = count_query.where(StrategyPackage.name.contains(schema_in.name))
-        fetch_query = fetch_query.where(StrategyPackage.name.contains(schema_in.name))
+        conditions.append(StrategyPackage.name.contains(schema_in.name))
+    tags_all = list(schema_in.tags_all)
     if schema_in.tag:
-        # TODO: support tag search
-        pass
+        tags_all.append(schema_in.tag)
+    conditions.extend(tag_filter(StrategyPackage.tags, tags_all, schema_in.tags_any))
     if schema_in.market_id:
-        count_query = count_query.where(
-            StrategyPackage.market_id == schema_in.market_id
-        )
-        fetch_query = fetch_query.where(
-            StrategyPackage.market_id == schema_in.market_id
-        )
-    total_count = await db.scalar(count_query)
-    print(total_count,'444444444444444444444')
-    pkg_list = (
-        await fetch_query.order_by(text("name"))
-        .offset(schema_in.offset)
-        .limit(schema_in.count).gino.all()
+        conditions.append(StrategyPackage.market_id == schema_in.market_id)
+    # 状态 / 删除标记也是过滤条件，估计值包含所有行，只能用于不带任何条件的查询
+    if conditions and count_mode == CountMode.estimated:
+        count_mode = CountMode.exact
+    where = db.and_(*conditions)
+    total_count, pkg_list = await paginate(
+        StrategyPackage.query.where(where).order_by(StrategyPackage.name),
+        db.select([db.func.count(StrategyPackage.product_id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
+        count_mode,
+        StrategyPackage.__tablename__,
     )
-    print(pkg_list,'1111111111111111111111111111111')
-    return PkgSearchOut(total=total_count, data=[pkg for pkg in pkg_list])
+    await counter.merge_pending(ProductType.package, pkg_list)
+    return PkgSearchOut(total=total_count, data=pkg_list)
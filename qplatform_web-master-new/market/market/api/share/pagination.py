@@ -0,0 +1,105 @@
+"""分页查询
+
+列表接口的总数有三种取法（CountMode）：
+
+- exact：每次执行 count，和分页查询在两个连接上并发执行
+- cached：count 结果按查询条件的哈希缓存 PAGINATE_COUNT_TTL 秒，翻页时不再重复 count
+- estimated：使用 pg_class.reltuples 的估计行数，是整张表的行数（包括已删除的行），
+  只适用于没有任何过滤条件（包括默认的状态 / 删除标记）的后台列表；
+  表较小（估计值低于 PAGINATE_ESTIMATE_MIN）时仍然精确 count
+
+取到的这一页数据和总数矛盾时（缓存 / 估计值过期），以这一页的数据修正总数
+"""
+import asyncio
+import enum
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+
+from sqlalchemy.dialects import postgresql
+
+from market import config
+from market.core.cache import LRUCache, TwoTierCache
+from market.models import db
+
+logger = logging.getLogger(__name__)
+
+count_cache = TwoTierCache(
+    "page_count_",
+    LRUCache(config.PAGINATE_COUNT_LOCAL_SIZE, config.PAGINATE_COUNT_TTL),
+    redis_ttl=config.PAGINATE_COUNT_TTL,
+)
+
+
+class CountMode(enum.Enum):
+    exact = "exact"
+    cached = "cached"
+    estimated = "estimated"
+
+
+def count_key(count_query) -> str:
+    """count 查询的缓存 key：SQL 和参数的哈希"""
+    compiled = count_query.compile(dialect=postgresql.dialect())
+    params = sorted((k, repr(v)) for k, v in compiled.params.items())
+    return hashlib.sha1(f"{compiled}|{params}".encode()).hexdigest()
+
+
+async def _scalar(query):
+    async with db.acquire(reuse=False) as conn:
+        return await conn.scalar(query)
+
+
+async def _all(query):
+    async with db.acquire(reuse=False) as conn:
+        return await conn.all(query)
+
+
+async def estimated_count(table_name: str) -> Optional[int]:
+    """pg_class 中的估计行数，表没有 analyze 过时返回 None"""
+    reltuples = await _scalar(
+        db.text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name").bindparams(
+            name=table_name
+        )
+    )
+    if reltuples is None or reltuples < 0:
+        return None
+    return reltuples
+
+
+async def _count(count_query, mode: CountMode, table_name: Optional[str]) -> int:
+    if mode == CountMode.estimated and table_name:
+        total = await estimated_count(table_name)
+        if total is not None and total >= config.PAGINATE_ESTIMATE_MIN:
+            return total
+    elif mode == CountMode.cached:
+        key = count_key(count_query)
+        total = await count_cache.get(key)
+        if total is None:
+            total = await _scalar(count_query)
+            await count_cache.set(key, total)
+        return total
+    return await _scalar(count_query)
+
+
+async def paginate(
+    fetch_query,
+    count_query,
+    offset: int,
+    limit: int,
+    mode: CountMode = CountMode.exact,
+    table_name: Optional[str] = None,
+) -> Tuple[int, List]:
+    """并发执行 count 和分页查询，返回 (总数, 这一页的数据)
+
+    fetch_query 不需要带 offset / limit；estimated 模式需要传 table_name
+    """
+    total, rows = await asyncio.gather(
+        _count(count_query, mode, table_name),
+        _all(fetch_query.offset(offset).limit(limit)),
+    )
+    if (rows and len(rows) < limit) or (not rows and offset == 0):
+        # 最后一页，总数是确定的
+        total = offset + len(rows)
+    elif rows:
+        total = max(total, offset + len(rows))
+    return total, rows
@@ -0,0 +1,186 @@
+"""订单支付
+
+微信支付通知和线下订单的支付确认都通过一条带条件的
+UPDATE ... WHERE status = 待支付 RETURNING 把订单改为已支付，重复处理不会重复更新；
+超时关闭（没有 pay_dt）的订单收到支付通知时同样改为已支付。
+微信支付通知先按 transaction_id 在 redis 中 SETNX 去重，重试的通知不访问数据库；
+支付成功后删除权限缓存，推送的重新开启等后续工作交给 celery 处理
+"""
+import datetime
+import logging
+from typing import Dict, Optional
+
+from lxml import etree
+from starlette.concurrency import run_in_threadpool
+
+from market import config
+from market.api.share.entitlement import invalidate_entitlement
+from market.core.pay import wx_pay
+from market.ctx import ctx
+from market.models import PushInfo, QStrategy, UserOrder, db
+from market.models.const import OrderStatus, PayMethod, ProductType, PushStatus
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = "SUCCESS"
+FAIL = "FAIL"
+# 已支付，或支付后已到期（pay_dt 不为空）
+PAYED_STATUS = (int(OrderStatus.payed), int(OrderStatus.expierd))
+
+
+def notify_key(transaction_id: str) -> str:
+    return f"pay_notify_{transaction_id}"
+
+
+def _reply(return_code: str = SUCCESS, return_msg: str = "OK") -> Dict[str, str]:
+    return {"return_code": return_code, "return_msg": return_msg}
+
+
+def is_payed(status: int, pay_dt) -> bool:
+    """订单是否已支付：超时关闭的未支付订单没有 pay_dt"""
+    return status in PAYED_STATUS and pay_dt is not None
+
+
+async def mark_payed(
+    condition, payed_cash=None, pay_id: Optional[str] = None, include_abandoned=False
+):
+    """把满足条件的待支付订单改为已支付，返回更新的订单，订单已处理过时返回 None
+
+    :param condition: 订单的查询条件
+    :param payed_cash: 实付金额，默认为订单的应付金额
+    :param pay_id: 外部支付单号
+    :param include_abandoned: 是否包括超时关闭的未支付订单（用户在关闭前已经付款）
+    """
+    now = datetime.datetime.now()
+    values = {
+        "status": int(OrderStatus.payed),
+        "payed_cash": UserOrder.pay_cash if payed_cash is None else payed_cash,
+        "pay_dt": now,
+        "expire_dt": db.literal(now, db.DateTime)
+        + db.func.make_interval(0, 0, 0, UserOrder.total_days + UserOrder.coupon_days),
+        "update_dt": now,
+    }
+    if pay_id:
+        values["pay_id"] = pay_id
+    unpayed = UserOrder.status == int(OrderStatus.unpayed)
+    if include_abandoned:
+        unpayed = unpayed | (
+            (UserOrder.status == int(OrderStatus.expierd)) & UserOrder.pay_dt.is_(None)
+        )
+    order = await (
+        db.update(UserOrder.__table__)
+        .values(**values)
+        .where(condition & unpayed)
+        .returning(
+            UserOrder.id, UserOrder.user_id, UserOrder.product_type, UserOrder.product_id
+        )
+        .gino.first()
+    )
+    if order is not None:
+        await invalidate_entitlement(
+            order["user_id"], order["product_type"], order["product_id"]
+        )
+        await enqueue_order_payed(order["id"])
+    return order
+
+
+async def enqueue_order_payed(order_id: int):
+    """订单支付后的后续工作，入队失败不影响支付结果"""
+    # 只在入队时依赖 celery，API 进程导入本模块时不需要加载 celery
+    from market.core.celery_app import celery_app
+
+    try:
+        await run_in_threadpool(
+            celery_app.send_task, "market.order_payed", args=[order_id]
+        )
+    except Exception:
+        logger.exception("enqueue order_payed %s failed", order_id)
+
+
+async def _mark_wx_payed(data: Dict[str, str]) -> Dict[str, str]:
+    out_trade_no = data.get("out_trade_no")
+    total_fee = int(data.get("total_fee") or 0)
+    order = await mark_payed(
+        (UserOrder.foreign_order_id == out_trade_no)
+        & (UserOrder.pay_method == int(PayMethod.wechat))
+        & (db.func.round(UserOrder.pay_cash * 100) == total_fee),
+        payed_cash=total_fee / 100,
+        pay_id=data["transaction_id"],
+        include_abandoned=True,
+    )
+    if order is not None:
+        logger.info("order %s payed by %s", order["id"], data["transaction_id"])
+        return _reply()
+    # 没有更新时才查询原因：重复通知，或订单不存在 / 已取消 / 金额不符（记录错误，由对账处理）
+    order = await db.select([UserOrder.status, UserOrder.pay_dt]).where(
+        (UserOrder.foreign_order_id == out_trade_no)
+        & (UserOrder.pay_method == int(PayMethod.wechat))
+    ).gino.first()
+    status = order["status"] if order else None
+    if order is None or not is_payed(order["status"], order["pay_dt"]):
+        logger.error(
+            "unmatched wechat pay notify %s: order %s status %s fee %s",
+            data["transaction_id"],
+            out_trade_no,
+            status,
+            total_fee,
+        )
+    return _reply()
+
+
+async def handle_wx_notify(content: bytes) -> Dict[str, str]:
+    """处理微信支付结果通知，返回给微信的应答（return_code 为 FAIL 时微信会重试）"""
+    try:
+        data = wx_pay.to_dict(content)
+    except etree.XMLSyntaxError:
+        return _reply(FAIL, "报文格式错误")
+    if not wx_pay.signer.check(data):
+        logger.warning("wechat pay notify with bad sign: %s", data.get("out_trade_no"))
+        return _reply(FAIL, "签名错误")
+    if data.get("appid") != wx_pay.app_id or data.get("mch_id") != wx_pay.mch_id:
+        return _reply(FAIL, "商户信息错误")
+    if data.get("return_code") != SUCCESS or data.get("result_code") != SUCCESS:
+        return _reply()
+    transaction_id = data.get("transaction_id")
+    if not transaction_id or not data.get("out_trade_no"):
+        return _reply(FAIL, "参数错误")
+
+    key = notify_key(transaction_id)
+    if ctx.redis_client:
+        first = await ctx.redis_client.set(
+            key,
+            "1",
+            expire=config.PAY_NOTIFY_DEDUP_TTL,
+            exist=ctx.redis_client.SET_IF_NOT_EXIST,
+        )
+        if not first:
+            return _reply()
+    try:
+        return await _mark_wx_payed(data)
+    except Exception:
+        logger.exception("handle wechat pay notify %s failed", transaction_id)
+        # 让微信重试
+        if ctx.redis_client:
+            await ctx.redis_client.delete(key)
+        return _reply(FAIL, "处理失败")
+
+
+async def activate_pushes(order_id: int) -> int:
+    """订单支付后重新开启用户因到期关闭的推送，返回开启的数量"""
+    order = await UserOrder.get(order_id)
+    if order is None or order.status != int(OrderStatus.payed):
+        return 0
+    if order.product_type == int(ProductType.package):
+        qstrategy_ids = db.select([QStrategy.product_id]).where(
+            QStrategy.package_id == order.product_id
+        )
+    elif order.product_type == int(ProductType.qstrategy):
+        qstrategy_ids = [order.product_id]
+    else:
+        return 0
+    result, _ = await PushInfo.update.values(status=int(PushStatus.normal)).where(
+        (PushInfo.user_id == order.user_id)
+        & (PushInfo.status == int(PushStatus.expired))
+        & PushInfo.qstrategy_id.in_(qstrategy_ids)
+    ).gino.status()
+    return int(result.split()[-1])
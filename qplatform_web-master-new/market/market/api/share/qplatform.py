@@ -0,0 +1,46 @@
+"""qplatform（量化平台）数据库中的模拟交易 / 用户 / 回测信息
+
+每个查询都用一条 JOIN 语句完成，只读一次 mysql
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from market.ctx import ctx
+
+SIMULATION_OWNERS_SQL = (
+    "SELECT s.id AS sim_id, s.user_id, u.phone"
+    " FROM wk_simulation s LEFT JOIN wk_user u ON u.id = s.user_id"
+    " WHERE s.id IN ({})"
+)
+SIMULATION_DETAIL_SQL = (
+    "SELECT s.user_id, s.name, s.task_id, s.init_money, s.start_date,"
+    " u.phone, u.nick_name, b.task_id AS bt_task_id"
+    " FROM wk_simulation s"
+    " LEFT JOIN wk_user u ON u.id = s.user_id"
+    " LEFT JOIN wk_strategy_backtest b ON b.id = s.backtest_id"
+    " WHERE s.id = %s"
+)
+SIMULATION_CODE_SQL = (
+    "SELECT b.code FROM wk_simulation s"
+    " LEFT JOIN wk_strategy_backtest b ON b.id = s.backtest_id"
+    " WHERE s.task_id = %s LIMIT 2"
+)
+
+
+async def get_simulation_owners(sim_ids: Sequence[str]) -> List[Dict[str, Any]]:
+    """模拟交易的用户 id 和手机号（用户不存在时 phone 为 None）"""
+    if not sim_ids:
+        return []
+    return await ctx.mysql_cli.fetch_all(
+        SIMULATION_OWNERS_SQL.format(",".join(["%s"] * len(sim_ids))), list(sim_ids)
+    )
+
+
+async def get_simulation_detail(sim_id: str) -> Optional[Dict[str, Any]]:
+    """模拟交易、所属用户以及对应回测的 task_id"""
+    return await ctx.mysql_cli.fetch_one(SIMULATION_DETAIL_SQL, (sim_id,))
+
+
+async def get_simulation_codes(task_id: str) -> List[Optional[str]]:
+    """模拟交易对应的回测代码，task_id 重复时返回多条（回测不存在时为 None）"""
+    rows = await ctx.mysql_cli.fetch_all(SIMULATION_CODE_SQL, (task_id,))
+    return [row["code"] for row in rows]
@@ -0,0 +1,151 @@
+"""微信支付对账
+
+逐行读取对账单，每 RECONCILE_BATCH_SIZE 条记录用一次 IN 查询匹配订单
+（商户订单号 = foreign_order_id，微信订单号 = pay_id，金额 = payed_cash），
+差异写入 billmismatch 表。对账单中匹配到的订单 id 只保存在 int64 数组中，
+最后分批扫描当天支付的订单，找出对账单中缺少的订单
+"""
+import datetime
+import logging
+from array import array
+from collections import Counter
+from typing import AsyncIterable, Dict, List, Optional
+
+import numpy as np
+
+from market import config
+from market.core.pay.bill import BillRow, parse_bill
+from market.models import BillMismatch, UserOrder, db
+from market.models.const import BillMismatchType, OrderStatus, PayMethod
+
+logger = logging.getLogger(__name__)
+
+# 已支付的订单到期后状态变为超时（pay_dt 不为空），超时关闭的未支付订单没有 pay_dt
+PAYED_STATUS = (int(OrderStatus.payed), int(OrderStatus.expierd))
+ORDER_COLUMNS = [
+    UserOrder.id,
+    UserOrder.foreign_order_id,
+    UserOrder.pay_id,
+    UserOrder.payed_cash,
+    UserOrder.status,
+    UserOrder.pay_dt,
+]
+# 金额比较的精度，元
+CASH_EPSILON = 0.005
+
+
+def _mismatch(
+    bill_date: datetime.date,
+    mismatch_type: BillMismatchType,
+    row: Optional[BillRow] = None,
+    order=None,
+) -> Dict:
+    return {
+        "bill_date": bill_date,
+        "mismatch_type": int(mismatch_type),
+        "out_trade_no": row.out_trade_no if row else order["foreign_order_id"],
+        "transaction_id": row.transaction_id if row else order["pay_id"],
+        "order_id": order["id"] if order else None,
+        "bill_cash": row.cash if row else None,
+        "order_cash": order["payed_cash"] if order else None,
+        "order_status": order["status"] if order else None,
+    }
+
+
+def compare(bill_date: datetime.date, row: BillRow, order) -> List[Dict]:
+    """比较对账单中的一条支付记录和订单"""
+    if order is None:
+        return [_mismatch(bill_date, BillMismatchType.order_missing, row)]
+    mismatches = []
+    if order["status"] not in PAYED_STATUS or order["pay_dt"] is None:
+        mismatches.append(_mismatch(bill_date, BillMismatchType.status_mismatch, row, order))
+    if order["pay_id"] != row.transaction_id:
+        mismatches.append(_mismatch(bill_date, BillMismatchType.pay_id_mismatch, row, order))
+    if abs((order["payed_cash"] or 0) - row.cash) > CASH_EPSILON:
+        mismatches.append(_mismatch(bill_date, BillMismatchType.cash_mismatch, row, order))
+    return mismatches
+
+
+async def _save(mismatches: List[Dict]):
+    if mismatches:
+        await BillMismatch.insert().gino.all(mismatches)
+
+
+async def _match_batch(
+    bill_date: datetime.date, rows: List[BillRow], matched: array, stats: Counter
+):
+    orders = await db.select(ORDER_COLUMNS).where(
+        UserOrder.foreign_order_id.in_([row.out_trade_no for row in rows])
+    ).gino.all()
+    by_no = {order["foreign_order_id"]: order for order in orders}
+    mismatches = []
+    for row in rows:
+        order = by_no.get(row.out_trade_no)
+        if order is not None:
+            matched.append(order["id"])
+        mismatches.extend(compare(bill_date, row, order))
+    await _save(mismatches)
+    stats["checked"] += len(rows)
+    for item in mismatches:
+        stats[BillMismatchType(item["mismatch_type"]).name] += 1
+
+
+async def _find_bill_missing(bill_date: datetime.date, matched: array, stats: Counter):
+    """当天支付但对账单中没有的微信支付订单"""
+    matched_ids = np.frombuffer(matched, dtype=np.int64) if matched else np.empty(0, np.int64)
+    start = datetime.datetime.combine(bill_date, datetime.time())
+    end = start + datetime.timedelta(days=1)
+    last_id = 0
+    while True:
+        orders = await db.select(ORDER_COLUMNS).where(
+            (UserOrder.pay_method == int(PayMethod.wechat))
+            & UserOrder.status.in_(PAYED_STATUS)
+            & (UserOrder.pay_dt >= start)
+            & (UserOrder.pay_dt < end)
+            & (UserOrder.id > last_id)
+        ).order_by(UserOrder.id).limit(config.RECONCILE_BATCH_SIZE).gino.all()
+        if not orders:
+            return
+        ids = np.fromiter((order["id"] for order in orders), dtype=np.int64)
+        found = np.isin(ids, matched_ids)
+        missing = [
+            _mismatch(bill_date, BillMismatchType.bill_missing, order=order)
+            for order, ok in zip(orders, found)
+            if not ok
+        ]
+        await _save(missing)
+        stats["bill_missing"] += len(missing)
+        last_id = orders[-1]["id"]
+
+
+async def reconcile(bill_date: datetime.date, lines: AsyncIterable[str]) -> Dict[str, int]:
+    """对账，lines 为对账单的行（可以是 AsyncWeixinPay.stream_bill），返回各项统计
+
+    重新对账时先删除当天之前的对账结果
+    """
+    await BillMismatch.delete.where(BillMismatch.bill_date == bill_date).gino.status()
+    stats: Counter = Counter()
+    matched = array("q")
+    batch: List[BillRow] = []
+    async for row in parse_bill(lines):
+        stats["lines"] += 1
+        if row.trade_state != "SUCCESS":
+            # 退款 / 撤销记录不对应订单的支付
+            stats["skipped"] += 1
+            continue
+        batch.append(row)
+        if len(batch) >= config.RECONCILE_BATCH_SIZE:
+            await _match_batch(bill_date, batch, matched, stats)
+            batch = []
+    if batch:
+        await _match_batch(bill_date, batch, matched, stats)
+    await _find_bill_missing(bill_date, matched, stats)
+    logger.info("reconcile %s: %s", bill_date, dict(stats))
+    return dict(stats)
+
+
+async def reconcile_wx_bill(bill_date: datetime.date) -> Dict[str, int]:
+    """下载微信支付的对账单并对账"""
+    from market.core.pay import wx_pay
+
+    return await reconcile(bill_date, wx_pay.stream_bill(bill_date.strftime("%Y%m%d")))
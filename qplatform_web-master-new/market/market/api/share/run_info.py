@@ -1,141 +1,287 @@
+import asyncio
 import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
+import orjson
 import pymongo
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
 
+from market import config
+from market.api.share.curve import downsample_curve
+from market.api.share.task_index import result_col, task_index_manager
 from market.const import TaskType
+from market.core.cache import RunInfoCache
 from market.ctx import ctx
 
 logger = logging.getLogger(__name__)
 
 
+CURVE_PROJECTION = {"_id": False, "day": True, "returns": True, "bench_returns": True}
+ORDER_PROJECTION = {
+    "_id": False,
+    "day": True,
+    "returns": True,
+    "bench_returns": True,
+    "symbol": True,
+    "limit_price": True,
+    "volume": True,
+    "filled_volume": True,
+    "trade_vwap": True,
+    "open_vwap": True,
+    "create_ts": True,
+    "update_ts": True,
+    "side": True,
+    "action": True,
+    "style": True,
+    # { "style" : 1, "props" : { "trade_type" : 0, "limit_price" : 0 } },
+    "status": True,
+    "fee": True,
+    "pnl": True,
+    "trade_amount": True,
+    "current": True,
+}
+POSITION_PROJECTION = {
+    "_id": False,
+    "day": True,
+    "returns": True,
+    "bench_returns": True,
+    "symbol": True,
+    "multiplier": True,
+    "side": True,
+    "volume": True,
+    "open_vwap": True,
+    "hold_vwap": True,
+    "market_value": True,
+    "close_price": True,
+    "sum_pnl": True,
+    "today_pnl": True,
+    "create_ts": True,
+    "update_ts": True,
+}
+
+
 def get_mongo():
     return ctx.mongo_client
 
 
+async def get_result_col(task_type: TaskType, task_id: str, name: str):
+    """获取任务的结果集合，首次访问任务时确保集合上有索引"""
+    await task_index_manager.ensure(task_type, task_id)
+    return result_col(task_type, task_id, name)
+
+
+def encode_cursor(doc: Dict) -> str:
+    """由一页的最后一条数据生成下一页的游标：day_ObjectId"""
+    return f"{doc['day']}_{doc['_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, ObjectId]:
+    try:
+        day, oid = cursor.split("_", 1)
+        return int(day), ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="无效的翻页游标")
+
+
+async def _query_page(
+    col, projection: Dict, skip: int, limit: int, cursor: Optional[str] = None
+):
+    """分页查询任务结果集合，返回按 day 升序的 (总数, 数据, 下一页游标)
+
+    以 (day, _id) 倒序翻页，cursor 为空字符串时从第一页开始；
+    总数使用集合的元数据估算，不再每次都全表计数
+    """
+    query: Dict = {}
+    if cursor:
+        day, oid = decode_cursor(cursor)
+        query = {"$or": [{"day": {"$lt": day}}, {"day": day, "_id": {"$lt": oid}}]}
+        skip = 0
+    elif cursor is not None:
+        skip = 0
+    total_cnt, data = await asyncio.gather(
+        col.estimated_document_count(),
+        col.find(
+            query,
+            {**projection, "_id": True},
+            skip=skip,
+            limit=limit,
+            sort=[("day", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)],
+        ).to_list(None),
+    )
+    next_cursor = encode_cursor(data[-1]) if len(data) == limit else None
+    for doc in data:
+        doc.pop("_id")
+    # 结果集合上有 day 倒序索引，查询结果已经有序，翻转成升序即可
+    data.reverse()
+    return total_cnt, data, next_cursor
+
+
+run_info_cache = RunInfoCache(
+    day_loader=lambda task_type, task_id, name: get_latest_day(
+        task_type, task_id, name
+    ),
+    enable=config.RUN_INFO_CACHE_ENABLE,
+    local_size=config.RUN_INFO_CACHE_LOCAL_SIZE,
+    local_ttl=config.RUN_INFO_CACHE_LOCAL_TTL,
+    redis_ttl=config.RUN_INFO_CACHE_TTL,
+    day_ttl=config.RUN_INFO_DAY_TTL,
+)
+
+
 async def get_curves(
-    task_type: TaskType, task_id: str, skip: int = 0, limit: int = 100000
+    task_type: TaskType,
+    task_id: str,
+    skip: int = 0,
+    limit: int = 100000,
+    max_points: Optional[int] = None,
+    cursor: Optional[str] = None,
 ):
-    """获取收益曲线
+    """获取收益曲线，返回 (总数, 数据, 下一页游标)
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
+    :param max_points: 降采样后最多保留的点数，不传时返回全部数据
+    :param cursor: 翻页游标，传入时忽略 skip
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["returns"]
-    total_cnt = await col.count_documents({})
-    data = await col.find(
-        {},
-        {"_id": False, "day": True, "returns": True, "bench_returns": True},
+    col = await get_result_col(task_type, task_id, "returns")
+    total_cnt, data, next_cursor = await _query_page(
+        col,
+        CURVE_PROJECTION,
         skip=skip,
         limit=limit,
-        sort=[("day", pymongo.DESCENDING)],
-    ).to_list(None)
-    # mongo 查询到的数据排序可能有问题，这里重新排序一下
-    data.sort(key=lambda v: v["day"])
-    return total_cnt, data
+        cursor=cursor,
+    )
+    if max_points:
+        data = downsample_curve(data, max_points)
+    return total_cnt, data, next_cursor
+
+
+async def get_latest_day(task_type: TaskType, task_id: str, name: str = "returns"):
+    """获取任务结果集合中最新的日期，没有数据时返回 None
+
+    :param task_type: sim/bt/compile
+    :param task_id: xxxx
+    :param name: 结果集合名，returns/orders/positions/analyze
+    """
+    col = await get_result_col(task_type, task_id, name)
+    datas = await col.find(
+        {}, {"_id": False, "day": True}, sort=[("day", pymongo.DESCENDING)], limit=1,
+    ).to_list(1)
+    if not datas:
+        return None
+    return datas[0].get("day")
+
+
+async def get_sparkline(
+    task_type: TaskType, task_id: str, max_points: int = config.SPARKLINE_POINTS
+):
+    """获取降采样后的收益曲线（列表页缩略图）
+
+    结果按任务最新的 day 缓存在 redis 中，有新的收益数据时重新计算
+    """
+    latest_day = await run_info_cache.latest_day(task_type, task_id)
+    if latest_day is None:
+        return []
+    key = f"sparkline_{task_type.value}_{task_id}_{max_points}"
+    cached = await ctx.redis_client.get(key)
+    if cached:
+        cached = orjson.loads(cached)
+        if cached["day"] == latest_day:
+            return cached["curve"]
+    _, curve, _ = await get_curves(task_type, task_id, max_points=max_points)
+    await ctx.redis_client.set(
+        key,
+        orjson.dumps({"day": latest_day, "curve": curve}),
+        expire=config.SPARKLINE_CACHE_TIMEOUT,
+    )
+    return curve
 
 
 async def get_orders(
-    task_type: TaskType, task_id: str, skip: int = 0, limit: int = 100000
+    task_type: TaskType,
+    task_id: str,
+    skip: int = 0,
+    limit: int = 100000,
+    cursor: Optional[str] = None,
 ):
-    """获取下单信息
+    """获取下单信息，返回 (总数, 数据, 下一页游标)
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
+    :param cursor: 翻页游标，传入时忽略 skip
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["orders"]
-    total_cnt = await col.count_documents({})
-    data = await col.find(
-        {},
-        {
-            "_id": False,
-            "day": True,
-            "returns": True,
-            "bench_returns": True,
-            "symbol": True,
-            "limit_price": True,
-            "volume": True,
-            "filled_volume": True,
-            "trade_vwap": True,
-            "open_vwap": True,
-            "create_ts": True,
-            "update_ts": True,
-            "side": True,
-            "action": True,
-            "style": True,
-            # { "style" : 1, "props" : { "trade_type" : 0, "limit_price" : 0 } },
-            "status": True,
-            "fee": True,
-            "pnl": True,
-            "trade_amount": True,
-            "current": True,
-        },
+    col = await get_result_col(task_type, task_id, "orders")
+    return await _query_page(
+        col,
+        ORDER_PROJECTION,
         skip=skip,
         limit=limit,
-        sort=[("day", pymongo.DESCENDING)],
-    ).to_list(None)
-    # mongo 查询到的数据排序可能有问题，这里重新排序一下
-    data.sort(key=lambda v: v["day"])
-    return total_cnt, data
+        cursor=cursor,
+    )
 
 
 async def get_positions(
-    task_type: TaskType, task_id: str, skip: int = 0, limit: int = 100000
+    task_type: TaskType,
+    task_id: str,
+    skip: int = 0,
+    limit: int = 100000,
+    cursor: Optional[str] = None,
 ):
-    """获取持仓信息
+    """获取持仓信息，返回 (总数, 数据, 下一页游标)
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
+    :param cursor: 翻页游标，传入时忽略 skip
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["positions"]
-    total_cnt = await col.count_documents({})
-    data = await col.find(
-        {},
-        {
-            "_id": False,
-            "day": True,
-            "returns": True,
-            "bench_returns": True,
-            "symbol": True,
-            "multiplier": True,
-            "side": True,
-            "volume": True,
-            "open_vwap": True,
-            "hold_vwap": True,
-            "market_value": True,
-            "close_price": True,
-            "sum_pnl": True,
-            "today_pnl": True,
-            "create_ts": True,
-            "update_ts": True,
-        },
+    col = await get_result_col(task_type, task_id, "positions")
+    return await _query_page(
+        col,
+        POSITION_PROJECTION,
         skip=skip,
         limit=limit,
-        sort=[("day", pymongo.DESCENDING)],
-    ).to_list(None)
-    # mongo 查询到的数据排序可能有问题，这里重新排序一下
-    data.sort(key=lambda v: v["day"])
-    return total_cnt, data
+        cursor=cursor,
+    )
+
+
+async def iter_run_info(
+    task_type: TaskType,
+    task_id: str,
+    name: str,
+    projection: Dict,
+    batch_size: int = config.RUN_INFO_EXPORT_BATCH_SIZE,
+) -> AsyncIterator[List[Dict]]:
+    """按 day 升序分批读取任务的全部运行信息，每次返回一批
 
+    :param name: 结果集合名，returns/orders/positions
+    :param projection: CURVE_PROJECTION/ORDER_PROJECTION/POSITION_PROJECTION
+    """
+    col = await get_result_col(task_type, task_id, name)
+    cursor = col.find(
+        {},
+        projection,
+        sort=[("day", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+        batch_size=batch_size,
+    )
+    try:
+        while True:
+            batch = await cursor.to_list(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        await cursor.close()
 
+
+@run_info_cache.cached("analyze", "basic")
 async def get_indicators(task_type: TaskType, task_id: str):
     """获取技术指标信息
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["analyze"]
+    col = await get_result_col(task_type, task_id, "analyze")
     datas = await col.find(
         {"rtype": "basic"},
         {
@@ -173,6 +319,7 @@ async def get_indicators(task_type: TaskType, task_id: str):
     return data
 
 
+@run_info_cache.cached("returns", "today")
 async def get_today_returns(
     task_type: TaskType, task_id: str, skip: int = 0, limit: int = 1
 ):
@@ -181,10 +328,7 @@ async def get_today_returns(
     :param task_type: sim/bt/compile
     :param task_id: xxxx
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["returns"]
+    col = await get_result_col(task_type, task_id, "returns")
     data = await col.find(
         {},
         {
@@ -199,8 +343,8 @@ async def get_today_returns(
         limit=limit,
         sort=[("day", pymongo.DESCENDING)],
     ).to_list(None)
-    # mongo 查询到的数据排序可能有问题，这里重新排序一下
-    data.sort(key=lambda v: v["day"])
+    # 结果集合上有 day 倒序索引，查询结果已经有序，翻转成升序即可
+    data.reverse()
     return data
 
 
@@ -214,12 +358,10 @@ async def get_top_orders(
     """
 
 
+@run_info_cache.cached("analyze", "period")
 async def get_period_returns(task_id: str):
     """获取 1 月 /3 月 /6 月 /12 月的收益"""
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_T_SIM"
-    col = mongo_client[db_name][col_name]["analyze"]
+    col = await get_result_col(TaskType.PAPER_TRADING, task_id, "analyze")
     data = await col.find(
         {"rtype": "period"},
         {
@@ -245,12 +387,10 @@ async def get_period_returns(task_id: str):
     return info
 
 
+@run_info_cache.cached("portfolios", "portfolio")
 async def get_portfolio_info(task_type: TaskType, task_id: str):
     """获取策略持仓信息"""
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["portfolios"]
+    col = await get_result_col(task_type, task_id, "portfolios")
     datas = await col.find(
         {"id": "portfolio"},
         {"_id": False},
@@ -263,42 +403,62 @@ async def get_portfolio_info(task_type: TaskType, task_id: str):
 
 
 async def get_today_positons(task_type: TaskType, task_id: str):
-    """获取持仓信息
+    """获取最新一个交易日的持仓信息
+
+    最新日期从 run_info_cache 中获取，只需要一次按 day 索引的查询
 
     :param task_type: sim/bt/compile
     :param task_id: xxxx
     """
-    mongo_client = get_mongo()
-    col_name = "task_info_" + str(task_id)
-    db_name = "task_result_" + task_type.value
-    col = mongo_client[db_name][col_name]["positions"]
-    current_day_info = await col.aggregate(
-        [{"$group": {"_id": "max", "current_day": {"$max": "$day"}}}]
-    ).to_list(1)
-    try:
-        current_day = current_day_info[0]["current_day"]
-    except (IndexError, KeyError):
+    current_day = await run_info_cache.latest_day(task_type, task_id, "positions")
+    if current_day is None:
         return []
-    data = await col.find(
-        {"day": current_day},
-        {
-            "_id": False,
-            "day": True,
-            "returns": True,
-            "bench_returns": True,
-            "symbol": True,
-            "multiplier": True,
-            "side": True,
-            "volume": True,
-            "open_vwap": True,
-            "hold_vwap": True,
-            "market_value": True,
-            "close_price": True,
-            "sum_pnl": True,
-            "today_pnl": True,
-            "create_ts": True,
-            "update_ts": True,
-        },
-    ).to_list(None)
-    # mongo 查询到的数据排序可能有问题，这里重新排序一下
-    return data
+    col = await get_result_col(task_type, task_id, "positions")
+    return await col.find({"day": current_day}, POSITION_PROJECTION).to_list(None)
+
+
+async def load_run_infos(
+    task_type: TaskType,
+    task_ids: Iterable[str],
+    keys: Iterable[str] = ("indicators", "curves", "today_returns"),
+) -> Dict[str, Dict[str, Any]]:
+    """批量获取多个任务的指标、收益曲线和当日收益
+
+    各集合的查询并发执行，同时进行的查询数由 ``RUN_INFO_CONCURRENCY`` 限制
+
+    :param task_type: sim/bt/compile
+    :param task_ids: 任务 id 列表
+    :param keys: 需要获取的信息，indicators/curves/sparkline/today_returns
+    :return: {task_id: {"indicators": {}, "curves": [], "today_returns": []}}
+    """
+    sem = asyncio.Semaphore(config.RUN_INFO_CONCURRENCY)
+
+    async def _load(loader, task_id):
+        async with sem:
+            return await loader(task_type, task_id)
+
+    async def _load_curves(task_type, task_id):
+        _, curves, _ = await get_curves(task_type, task_id)
+        return curves
+
+    all_loaders = {
+        "indicators": get_indicators,
+        "curves": _load_curves,
+        "sparkline": get_sparkline,
+        "today_returns": get_today_returns,
+    }
+    loaders = {key: all_loaders[key] for key in keys}
+    infos: Dict[str, Dict[str, Any]] = {}
+    jobs = []
+    keys = []
+    for task_id in task_ids:
+        if task_id in infos:
+            continue
+        infos[task_id] = {}
+        for key, loader in loaders.items():
+            keys.append((task_id, key))
+            jobs.append(_load(loader, task_id))
+    results = await asyncio.gather(*jobs)
+    for (task_id, key), result in zip(keys, results):
+        infos[task_id][key] = result
+    return infos
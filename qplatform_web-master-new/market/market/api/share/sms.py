@@ -1,14 +1,13 @@
-import json
 import logging
 import random
 from typing import Optional
 
-from aliyunsdkcore.request import CommonRequest
 from fastapi import HTTPException
 from pydantic import EmailStr
 
 from market import config
 from market.const import SMSType
+from market.core.sms_gateway import SMSError
 from market.ctx import ctx
 from market.schemas.token import AuthCodeRsp
 
@@ -38,34 +37,21 @@ async def send_verify_sms(phone: str, tmpl: SMSType, sys="aliyun"):
         raise HTTPException(status_code=406, detail="请勿频繁调用短信验证码发送")
     code = "".join(random.choices([str(i) for i in range(10)], k=4))
 
-    request = CommonRequest()
-    request.set_accept_format("json")
-    request.set_domain("dysmsapi.aliyuncs.com")
-    request.set_method("POST")
-    request.set_protocol_type("https")  # https | http
-    request.set_version("2017-05-25")
-    request.set_action_name("SendSms")
-
-    request.add_query_param("RegionId", config.SMS_REQ_REGION_ID)
-    request.add_query_param("SignName", config.SMS_REQ_REGION_SIGN_NAME)
-
-    request.add_query_param("TemplateCode", tmpl.to_tmpl_id())
-    request.add_query_param("PhoneNumbers", phone)
-    request.add_query_param("TemplateParam", {"code": code})
-
-    resp = ctx.sms_client.do_action(request)
+    if not ctx.sms_client:
+        raise HTTPException(status_code=503, detail="短信服务不可用")
     try:
-        ret = json.loads(resp)
-        if ret.get("Code") != "OK":
-            logger.error("Send verify_auth_code sms failed: %s", ret)
-            return AuthCodeRsp(code=-1, auth=code)
-    except json.JSONDecodeError:
+        await ctx.sms_client.send(phone, tmpl.to_tmpl_id(), {"code": code})
+    except SMSError as e:
+        logger.error("Send verify_auth_code sms failed: %s", e)
+        return AuthCodeRsp(code=-1, auth=code)
+    except Exception:
         logger.exception("Send verify_auth_code sms failed: ")
         return AuthCodeRsp(code=-100, auth=code)
 
     await ctx.redis_client.set(
         "sms_verify_" + phone, code, expire=config.SMS_VERIFY_CODE_TIMEOUT
     )
+    await ctx.redis_client.set("sms_expire_" + phone, "e", expire=config.SMS_LIMIT_TIME)
     return AuthCodeRsp(code=0, auth=code)
 
 
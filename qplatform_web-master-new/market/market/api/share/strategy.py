@@ -1,14 +1,16 @@
-import datetime
 import logging
 from typing import List, Union
 from sqlalchemy import and_,or_
-from fastapi import HTTPException, status
 from starlette.requests import Request
 
+from market.api.share import counter
+from market.api.share.entitlement import has_task_entitlement, invalidate_strategy
+from market.api.share.pagination import CountMode, paginate
+from market.api.share.tag import tag_filter
 from market.const import TaskType
-from market.core.security import get_active_user
-from market.models import MarketUser, QStrategy, UserOrder, db
-from market.models.const import ListStatus, OrderStatus, ProductType
+from market.core.security import CachedUser, get_active_user
+from market.models import QStrategy, db
+from market.models.const import ListStatus, ProductType
 from market.schemas.base import CommonOut
 from market.schemas.strategy import (
     QStrategyInfo,
@@ -23,48 +25,17 @@ logger = logging.getLogger(__name__)
 async def check_task_permission(task_type: TaskType, task_id: str, request: Request):
     """检查用户是否有该策略的权限"""
     try:
-        current_user: MarketUser = await get_active_user(request)
+        current_user: CachedUser = await get_active_user(request)
     except Exception:
         logger.warning("check_task_permission no active user found")
         return False
-    if task_type == TaskType.PAPER_TRADING:
-        row = (
-                await QStrategy.select("package_id")
-                .where(QStrategy.task_id == task_id)
-                .gino.first()
-        )
-    else:
-        row = (
-            await QStrategy.select("package_id")
-            .where(QStrategy.bt_task_id == task_id)
-            .gino.first()
-        )
-    if not row:
-        logger.warning("check_task_permission no product found")
-        return False
-    product_id = row["package_id"]
-    print(row,'row1')
-    print(current_user.id,'current_user.id-------111111111111111')
-    row = (
-        await UserOrder.select("id")
-        .where(
-            and_(
-            UserOrder.user_id==current_user.id,
-            UserOrder.product_type==int(ProductType.package),
-            UserOrder.product_id==product_id,
-            UserOrder.status==int(OrderStatus.payed),
-            (UserOrder.expire_dt)>datetime.datetime.now(),
-            )).gino.first()
-    )
-    if row:
-        logger.warning("check_task_permission no user order found")
-        return True
-    return False
+    return await has_task_entitlement(current_user.id, task_type, task_id)
 
 
 async def show_strategy(strategy_id: str):
     """查看策略"""
     strategy = await QStrategy.get_or_404(strategy_id)
+    await counter.merge_pending(ProductType.qstrategy, [strategy])
     return QStrategyInfo(**strategy.to_dict())
 
 
@@ -77,6 +48,7 @@ async def edit_strategy(product_id: str, changed: QStrategyUpdateFields):
     except Exception:
         logger.exception("更新策略 (%s) 失败：%s", product_id, changed.json())
         return CommonOut(errCode=-1, errMsg="更新失败，请检查名字是否重复")
+    await invalidate_strategy(product_id)
     return CommonOut()
 
 
@@ -90,93 +62,66 @@ async def change_strategy_status(id_list: Union[str, List[str]], status: ListSta
     return CommonOut()
 
 
-async def search_strategy(schema_in: QStrategySearch, return_strategy_list=False):
-    """搜索策略"""
-    # TODO: support tag search, perphaps need to use raw sql
-    count_query = db.select([db.func.count(QStrategy.product_id)])
-    fetch_query = QStrategy.query
+def strategy_relevance(fuzzy: str):
+    """模糊搜索的相关度，使用 pg_trgm 的 similarity"""
+    return db.func.greatest(
+        db.func.similarity(QStrategy.name, fuzzy),
+        db.func.similarity(QStrategy.author_name, fuzzy),
+        db.func.similarity(QStrategy.product_id, fuzzy),
+    )
 
-    #if schema_in.status and schema_in.status != int(ListStatus.deleted):
-    #if schema_in.status:
-    #    count_query = count_query.where(QStrategy.status == int(schema_in.status))
-    #    fetch_query = fetch_query.where(QStrategy.status == int(schema_in.status))
-    #else:
-    #    #count_query = count_query.where(QStrategy.status != int(ListStatus.deleted))
-    #    #fetch_query = fetch_query.where(QStrategy.status != int(ListStatus.deleted))
-    #    count_query = count_query.where(QStrategy.status == int(ListStatus.online))
-    #    fetch_query = fetch_query.where(QStrategy.status == int(ListStatus.online))
-    if not return_strategy_list:
-        if schema_in.status:
-            count_query = count_query.where(QStrategy.status == int(schema_in.status))
-            fetch_query = fetch_query.where(QStrategy.status == int(schema_in.status))
-        else:
-            count_query = count_query
-            fetch_query = fetch_query
-    else:
-        if schema_in.status:
-            count_query = count_query.where(QStrategy.status == int(schema_in.status))
-            fetch_query = fetch_query.where(QStrategy.status == int(schema_in.status))
-        else:
-            count_query = count_query.where(QStrategy.status == int(ListStatus.online))
-            fetch_query = fetch_query.where(QStrategy.status == int(ListStatus.online))
+
+async def search_strategy(
+    schema_in: QStrategySearch,
+    return_strategy_list=False,
+    *,
+    count_mode: CountMode = CountMode.exact,
+):
+    """搜索策略
+
+    标签过滤使用 JSONB 的 @>，由 jsonb_path_ops 的 GIN 索引支持；模糊匹配（LIKE '%xx%'）由 pg_trgm 的 GIN 索引支持，有 fuzzy 时按相关度排序；
+    return_strategy_list 为 True 时（首页列表需要按运行信息排序）返回全部匹配的策略，
+    否则在数据库中分页，总数按 count_mode 获取（有过滤条件时不使用估计值）
+    """
+    conditions = []
+    if schema_in.status:
+        conditions.append(QStrategy.status == int(schema_in.status))
+    elif return_strategy_list:
+        conditions.append(QStrategy.status == int(ListStatus.online))
     if schema_in.product_id:
-        count_query = count_query.where(QStrategy.product_id == schema_in.product_id)
-        fetch_query = fetch_query.where(QStrategy.product_id == schema_in.product_id)
+        conditions.append(QStrategy.product_id == schema_in.product_id)
     if schema_in.market_id:
-        count_query = count_query.where(QStrategy.market_id == schema_in.market_id)
-        fetch_query = fetch_query.where(QStrategy.market_id == schema_in.market_id)
+        conditions.append(QStrategy.market_id == schema_in.market_id)
     if schema_in.package_id:
-        count_query = count_query.where(QStrategy.package_id == schema_in.package_id)
-        fetch_query = fetch_query.where(QStrategy.package_id == schema_in.package_id)
+        conditions.append(QStrategy.package_id == schema_in.package_id)
     if schema_in.task_id:
-        count_query = count_query.where(QStrategy.task_id.contains(schema_in.task_id))
-        fetch_query = fetch_query.where(QStrategy.task_id.contains(schema_in.task_id))
+        conditions.append(QStrategy.task_id.contains(schema_in.task_id, autoescape=True))
     if schema_in.style:
-        count_query = count_query.where(QStrategy.style.contains(schema_in.style))
-        fetch_query = fetch_query.where(QStrategy.style.contains(schema_in.style))
+        conditions.append(QStrategy.style.contains(schema_in.style, autoescape=True))
     if schema_in.category:
-        count_query = count_query.where(QStrategy.category == int(schema_in.category))
-        fetch_query = fetch_query.where(QStrategy.category == int(schema_in.category))
+        conditions.append(QStrategy.category == int(schema_in.category))
     if schema_in.name:
-        count_query = count_query.where(QStrategy.name.contains(schema_in.name))
-        fetch_query = fetch_query.where(QStrategy.name.contains(schema_in.name))
-    if return_strategy_list:
-        if schema_in.fuzzy:
-            #count_query = count_query.where(QStrategy.name.contains(schema_in.fuzzy))
-            count_query = count_query.where(
-                    or_(
-                        and_(QStrategy.name.contains(schema_in.fuzzy),QStrategy.status==ListStatus.online),
-                        and_(QStrategy.author_name.contains(schema_in.fuzzy),QStrategy.status==ListStatus.online),
-                        )
-                    )
-            #print(await db.scalar(count_query),'qqqqqqqqqqqqqqqqqqqq')
-            #print(schema_in.fuzzy,'fuzzy--------1111111111111111111')
-            #fetch_query = fetch_query.where(QStrategy.name.in_(schema_in.fuzzy)).where(QStrategy.author_name.in_(schema_in.fuzzy))
-            fetch_query = fetch_query.where(
-                    or_(
-                        and_(QStrategy.name.contains(schema_in.fuzzy),QStrategy.status==ListStatus.online),
-                        and_(QStrategy.author_name.contains(schema_in.fuzzy),QStrategy.status==ListStatus.online),
+        conditions.append(QStrategy.name.contains(schema_in.name, autoescape=True))
+    tags_all = list(schema_in.tags_all)
+    if schema_in.tag:
+        tags_all.append(schema_in.tag)
+    conditions.extend(tag_filter(QStrategy.tags, tags_all, schema_in.tags_any))
+    if schema_in.fuzzy:
+        fuzzy_fields = [QStrategy.name, QStrategy.author_name]
+        if return_strategy_list:
+            # 首页只搜索上架的策略
+            conditions.append(QStrategy.status == int(ListStatus.online))
+        else:
+            fuzzy_fields.append(QStrategy.product_id)
+        conditions.append(
+            or_(*(field.contains(schema_in.fuzzy, autoescape=True) for field in fuzzy_fields))
+        )
+    where = and_(*conditions)
+    fetch_query = QStrategy.query.where(where)
 
-                        )
-                    )
-    else:
-        if schema_in.fuzzy:
-            count_query = count_query.where( 
-                or_(
-                    QStrategy.name.contains(schema_in.fuzzy),
-                    QStrategy.author_name.contains(schema_in.fuzzy),
-                    QStrategy.product_id.contains(schema_in.fuzzy),
-                    )
-                )
-            fetch_query = fetch_query.where(
-                or_(
-                    QStrategy.name.contains(schema_in.fuzzy),
-                    QStrategy.author_name.contains(schema_in.fuzzy),
-                    QStrategy.product_id.contains(schema_in.fuzzy),
-                    )
-                )
-    total_count = await db.scalar(count_query)
     order_bys = []
+    if schema_in.fuzzy:
+        order_bys.append(strategy_relevance(schema_in.fuzzy).desc())
     for key in schema_in.order_bys:
         if not key.startswith("-"):
             if not hasattr(QStrategy, key):
@@ -188,22 +133,29 @@ async def search_strategy(schema_in: QStrategySearch, return_strategy_list=False
                 logger.warning("search strategy has invalid order_by key: %s", key)
                 continue
             order_bys.append(getattr(QStrategy, key[1:]).desc())
+    # 保证分页结果稳定
+    order_bys.append(QStrategy.product_id)
 
-    #strategy_list = (
-    #    await fetch_query.order_by(*order_bys)
-    #    .offset(schema_in.offset)
-    #    .limit(schema_in.count).gino.all()
-    #)
-    print(order_bys,'order_bus---111111111111111')
-    strategy_list = (
-            await fetch_query.order_by(*order_bys).gino.all())
+    fetch_query = fetch_query.order_by(*order_bys)
     if return_strategy_list:
-        return total_count, strategy_list
-    # tag_names = [tag.name for tag in tags]
+        strategy_list = await fetch_query.gino.all()
+        return len(strategy_list), strategy_list
+    if conditions and count_mode == CountMode.estimated:
+        count_mode = CountMode.exact
+    total_count, strategy_list = await paginate(
+        fetch_query,
+        db.select([db.func.count(QStrategy.product_id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
+        count_mode,
+        QStrategy.__tablename__,
+    )
+    await counter.merge_pending(ProductType.qstrategy, strategy_list)
     return QStrategySearchOut(
         total=total_count, data=[strategy for strategy in strategy_list],
     )
 
+
 async def sortedd(data,total_cnt,sort):
     info2 = []
     info1 = []
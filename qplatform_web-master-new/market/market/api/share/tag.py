@@ -1,12 +1,23 @@
 import logging
+from typing import Dict, Iterable, List, Optional
 
 from fastapi import HTTPException, status
-from sqlalchemy import text
+from sqlalchemy import and_, or_, text
 from sqlalchemy.exc import IntegrityError
 
-from market.models import Tag, db
+from market.api.share.pagination import CountMode, paginate
+from market.models import QStrategy, StrategyPackage, Tag, db
+from market.models.const import ListStatus
 from market.schemas.base import CommonOut
-from market.schemas.tag import TagBatDel, TagCreate, TagSearch, TagSearchOut, TagUpdate
+from market.schemas.tag import (
+    TagBatDel,
+    TagCreate,
+    TagFacetSearch,
+    TagFacetTarget,
+    TagSearch,
+    TagSearchOut,
+    TagUpdate,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -52,21 +63,15 @@ async def del_tag(schema_in: TagBatDel):
     return CommonOut()
 
 
-async def search_tag(schema_in: TagSearch):
+async def search_tag(schema_in: TagSearch, *, count_mode: CountMode = CountMode.exact):
     """根据名字和类型查询标签或者风格"""
-    count_query = db.select([db.func.count(Tag.id)]).where(Tag.deleted == False)
-    fetch_query = Tag.query.where(Tag.deleted == False)
-
+    conditions = [Tag.deleted == False]
     if schema_in.tag_type:
-        count_query = count_query.where(Tag.tag_type == int(schema_in.tag_type))
-        fetch_query = fetch_query.where(Tag.tag_type == int(schema_in.tag_type))
+        conditions.append(Tag.tag_type == int(schema_in.tag_type))
     if schema_in.name:
-        count_query = count_query.where(Tag.name.contains(schema_in.name))
-        fetch_query = fetch_query.where(Tag.name.contains(schema_in.name))
+        conditions.append(Tag.name.contains(schema_in.name))
     elif schema_in.fuzzy:
-        count_query = count_query.where(Tag.name.contains(schema_in.fuzzy))
-        fetch_query = fetch_query.where(Tag.name.contains(schema_in.fuzzy))
-    total_count = await db.scalar(count_query)
+        conditions.append(Tag.name.contains(schema_in.fuzzy))
     order_bys = []
     for key in schema_in.order_bys:
         if not key.startswith("-"):
@@ -79,12 +84,19 @@ async def search_tag(schema_in: TagSearch):
                 logger.warning("get tag has invalid order_by key: %s", key)
                 continue
             order_bys.append(getattr(Tag, key[1:]).desc())
-
-    tags = (
-        await fetch_query.order_by(*order_bys)
-        .offset(schema_in.offset)
-        .limit(schema_in.count)
-        .gino.all()
+    order_bys.append(Tag.id)
+
+    # 状态 / 删除标记也是过滤条件，估计值包含所有行，只能用于不带任何条件的查询
+    if conditions and count_mode == CountMode.estimated:
+        count_mode = CountMode.exact
+    where = and_(*conditions)
+    total_count, tags = await paginate(
+        Tag.query.where(where).order_by(*order_bys),
+        db.select([db.func.count(Tag.id)]).where(where),
+        schema_in.offset,
+        schema_in.count,
+        count_mode,
+        Tag.__tablename__,
     )
     return TagSearchOut(total=total_count, data=tags)
 
@@ -92,3 +104,48 @@ async def search_tag(schema_in: TagSearch):
 async def show_tag(tag_id: int):
     """查看标签或者风格"""
     return await Tag.get_or_404(tag_id)
+
+
+def tag_filter(
+    column, tags_all: Optional[Iterable[str]] = None, tags_any: Optional[Iterable[str]] = None
+) -> List:
+    """JSONB 标签列的过滤条件
+
+    tags_all 为包含全部标签（@>），tags_any 为包含任意一个标签；任意一个也拆成多个 @>，
+    这样可以使用 jsonb_path_ops 的 GIN 索引（该索引不支持 ?|）
+    """
+    conditions = []
+    tags_all = list(tags_all or [])
+    if tags_all:
+        conditions.append(column.contains(tags_all))
+    tags_any = list(tags_any or [])
+    if tags_any:
+        conditions.append(or_(*(column.contains([tag]) for tag in tags_any)))
+    return conditions
+
+
+async def tag_facets(column, conditions: List) -> Dict[str, int]:
+    """统计满足条件的记录中每个标签出现的次数，一次聚合查询"""
+    tags = (
+        db.select([db.func.jsonb_array_elements_text(column).label("tag")])
+        .where(and_(*conditions))
+        .alias("tags")
+    )
+    rows = await db.select([tags.c.tag, db.func.count().label("cnt")]).select_from(
+        tags
+    ).group_by(tags.c.tag).gino.all()
+    return {row["tag"]: row["cnt"] for row in rows}
+
+
+async def search_tag_facets(schema_in: TagFacetSearch) -> Dict[str, int]:
+    """上架的策略 / 套餐中各个标签的数量"""
+    if schema_in.target == TagFacetTarget.package:
+        model = StrategyPackage
+    else:
+        model = QStrategy
+    conditions = [model.status == int(ListStatus.online)]
+    # 标签列可能是 null 或者非数组
+    conditions.append(db.func.jsonb_typeof(model.tags) == "array")
+    if schema_in.market_id:
+        conditions.append(model.market_id == schema_in.market_id)
+    return await tag_facets(model.tags, conditions)
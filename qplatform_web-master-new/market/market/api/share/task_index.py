@@ -0,0 +1,194 @@
+"""任务结果集合的索引管理
+
+任务结果保存在 task_result_<type>.task_info_<task_id>.<name> 这些动态创建的集合里，
+读取时都按 day 倒序排序，这里保证每个集合都有对应的索引：首次访问任务时给已经存在的
+结果集合创建（不存在的任务不会创建集合），也可以通过命令行检查/创建::
+
+    python -m market.api.share.task_index report
+    python -m market.api.share.task_index ensure
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import pymongo
+from pymongo.errors import OperationFailure, PyMongoError
+
+from market import config
+from market.const import TaskType
+from market.core.cache import LRUCache
+from market.ctx import ctx
+
+logger = logging.getLogger(__name__)
+
+# 需要建索引的结果集合
+RESULT_COLLECTIONS = ("returns", "orders", "positions", "analyze")
+# (索引名, 索引字段)，day_id 的前缀也用于只按 day 排序的查询
+RESULT_INDEXES = (
+    ("day_id", [("day", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+    ("rtype_day", [("rtype", pymongo.ASCENDING), ("day", pymongo.DESCENDING)]),
+)
+DB_PREFIX = "task_result_"
+COL_PREFIX = "task_info_"
+# IndexOptionsConflict：相同字段的索引已经以其它名字存在
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def result_col(task_type: TaskType, task_id: str, name: str):
+    mongo_client = ctx.mongo_client
+    return mongo_client[DB_PREFIX + task_type.value][COL_PREFIX + str(task_id)][name]
+
+
+def index_keys(index_info: Dict) -> Set[tuple]:
+    """index_information() 中所有索引的字段"""
+    return {
+        tuple((field, int(direction)) for field, direction in value["key"])
+        for value in index_info.values()
+    }
+
+
+async def ensure_col_indexes(col) -> bool:
+    """给一个结果集合创建缺少的索引，已有相同字段的索引（名字不同）也算已创建"""
+    try:
+        existed = index_keys(await col.index_information())
+        for index_name, keys in RESULT_INDEXES:
+            if tuple(keys) in existed:
+                continue
+            try:
+                await col.create_index(keys, name=index_name, background=True)
+            except OperationFailure as e:
+                if e.code != INDEX_OPTIONS_CONFLICT:
+                    raise
+    except PyMongoError:
+        logger.exception("create index on %s failed", col.full_name)
+        return False
+    return True
+
+
+class TaskIndexManager:
+    """记录本进程已经检查过索引的任务，每个任务在 ttl 秒内只检查一次
+
+    只给已经存在的结果集合建索引，不存在的任务（集合都不存在）不记录，也不创建集合；
+    记录的任务数不超过 maxsize，过期后重新检查，以便给任务运行中新建的集合建索引
+    """
+
+    def __init__(self, enable: bool = True, maxsize: int = 10000, ttl: float = 3600):
+        self.enable = enable
+        self._ensured = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._pending: Dict[Tuple[str, str], "asyncio.Future"] = {}
+
+    async def ensure(self, task_type: TaskType, task_id: str):
+        if not self.enable:
+            return
+        key = (task_type.value, str(task_id))
+        if self._ensured.get(key):
+            return
+        fut = self._pending.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._ensure_task(task_type, task_id))
+            self._pending[key] = fut
+            fut.add_done_callback(lambda _: self._pending.pop(key, None))
+        await asyncio.shield(fut)
+
+    async def _ensure_task(self, task_type: TaskType, task_id: str):
+        db = ctx.mongo_client[DB_PREFIX + task_type.value]
+        names = [f"{COL_PREFIX}{task_id}.{name}" for name in RESULT_COLLECTIONS]
+        try:
+            existed = await db.list_collection_names(filter={"name": {"$in": names}})
+        except PyMongoError:
+            logger.exception("list result collections of %s failed", task_id)
+            return
+        if not existed:
+            return
+        results = await asyncio.gather(*(ensure_col_indexes(db[name]) for name in existed))
+        # 创建失败的下次访问时再试
+        if all(results):
+            self._ensured.set((task_type.value, str(task_id)), True)
+
+    def forget(self, task_type: TaskType, task_id: str):
+        self._ensured.delete((task_type.value, str(task_id)))
+
+
+task_index_manager = TaskIndexManager(
+    enable=config.RUN_INFO_ENSURE_INDEX,
+    maxsize=config.RUN_INFO_INDEX_TRACK_SIZE,
+    ttl=config.RUN_INFO_INDEX_TRACK_TTL,
+)
+
+
+def _is_result_col(col_name: str) -> bool:
+    if not col_name.startswith(COL_PREFIX):
+        return False
+    return col_name.rsplit(".", 1)[-1] in RESULT_COLLECTIONS
+
+
+async def list_result_cols(task_types: Optional[List[TaskType]] = None):
+    """列出所有任务结果集合，返回 [(db, collection), ...]"""
+    cols = []
+    for task_type in task_types or list(TaskType):
+        db = ctx.mongo_client[DB_PREFIX + task_type.value]
+        for col_name in await db.list_collection_names():
+            if _is_result_col(col_name):
+                cols.append((db, col_name))
+    return cols
+
+
+async def unindexed_collections(
+    task_types: Optional[List[TaskType]] = None,
+) -> List[str]:
+    """返回缺少索引的结果集合 (db.collection)"""
+    missing = []
+    for db, col_name in await list_result_cols(task_types):
+        existed = index_keys(await db[col_name].index_information())
+        for _, keys in RESULT_INDEXES:
+            if tuple(keys) not in existed:
+                missing.append(f"{db.name}.{col_name}")
+                break
+    return missing
+
+
+async def ensure_all_indexes(task_types: Optional[List[TaskType]] = None) -> int:
+    """给所有已存在的结果集合创建索引，返回失败的集合数"""
+    failed = 0
+    for db, col_name in await list_result_cols(task_types):
+        if not await ensure_col_indexes(db[col_name]):
+            failed += 1
+    return failed
+
+
+def _run(coro):
+    import motor.motor_asyncio
+
+    async def _main():
+        ctx.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(config.MONGO_SERVER)
+        try:
+            return await coro
+        finally:
+            ctx.mongo_client.close()
+
+    return asyncio.get_event_loop().run_until_complete(_main())
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.group()
+    def cli():
+        """任务结果集合索引管理"""
+
+    @cli.command()
+    def report():
+        """列出缺少索引的结果集合"""
+        missing = _run(unindexed_collections())
+        for name in missing:
+            click.echo(name)
+        click.echo(f"{len(missing)} collections unindexed")
+
+    @cli.command()
+    def ensure():
+        """给所有结果集合创建索引"""
+        failed = _run(ensure_all_indexes())
+        click.echo(f"done, {failed} collections failed")
+
+    logging.basicConfig(level=logging.INFO)
+    cli()
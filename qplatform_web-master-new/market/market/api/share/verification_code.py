@@ -1,8 +1,12 @@
 # from captcha.audio import AudioCaptcha
+import asyncio
 import base64
+import collections
+import logging
 import random
-import time
-from typing import Optional
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, List, Optional, Tuple
 
 from captcha.image import ImageCaptcha
 from fastapi import HTTPException
@@ -11,6 +15,8 @@ from market import config
 from market.ctx import ctx
 from market.schemas.base import CommonOut
 
+logger = logging.getLogger(__name__)
+
 # audio = AudioCaptcha(voicedir='/path/to/voices')
 image = ImageCaptcha()
 
@@ -38,14 +44,96 @@ def get_image_verify(code: str = "", length=6):
     return "data:image/png;base64," + base64.b64encode(data.read()).decode()
 
 
+def render_captchas(count: int, length: int = 6) -> List[Tuple[str, str]]:
+    """生成 count 个验证码图片，返回 [(验证码, 图片), ...]，在进程池中执行"""
+    captchas = []
+    for _ in range(count):
+        code = generate_random_verify(length)
+        captchas.append((code, get_image_verify(code)))
+    return captchas
+
+
+class CaptchaPool:
+    """预先生成的验证码图片池
+
+    图片在进程池中批量生成，取用时直接从池中弹出，数量低于 low_water 时在后台补充；
+    池为空时才临时生成（同样在进程池中）
+
+    :param size: 池的容量
+    :param low_water: 低于该数量时开始补充
+    :param batch: 每次在进程池中生成的数量
+    :param workers: 进程数
+    """
+
+    def __init__(self, size: int = 200, low_water: int = 50, batch: int = 20, workers: int = 1):
+        self.size = size
+        self.low_water = low_water
+        self.batch = batch
+        self.workers = workers
+        self._pool: Deque[Tuple[str, str]] = collections.deque()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._refilling: Optional[asyncio.Future] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # 启动后才创建，避免在导入时 fork
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _render(self, count: int) -> List[Tuple[str, str]]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._get_executor(), render_captchas, count)
+
+    async def refill(self):
+        """补充到 size 个"""
+        while len(self._pool) < self.size:
+            count = min(self.batch, self.size - len(self._pool))
+            try:
+                self._pool.extend(await self._render(count))
+            except Exception:
+                logger.exception("render captcha failed")
+                break
+
+    def _ensure_refill(self):
+        if len(self._pool) < self.low_water and (
+            self._refilling is None or self._refilling.done()
+        ):
+            self._refilling = asyncio.ensure_future(self.refill())
+
+    async def pop(self) -> Tuple[str, str]:
+        """取出一个 (验证码, 图片)"""
+        try:
+            captcha = self._pool.popleft()
+        except IndexError:
+            captcha = (await self._render(1))[0]
+        self._ensure_refill()
+        return captcha
+
+    def __len__(self):
+        return len(self._pool)
+
+    def close(self):
+        if self._refilling is not None:
+            self._refilling.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+captcha_pool = CaptchaPool(
+    size=config.CAPTCHA_POOL_SIZE,
+    low_water=config.CAPTCHA_POOL_LOW_WATER,
+    workers=config.CAPTCHA_POOL_WORKERS,
+)
+
+
 async def generate_verification_code():
-    """生成验证码并存储到 redis"""
-    code = generate_random_verify()
-    data = get_image_verify(code)
-    redis_id = "verify_" + str(time.time() % 10000)
-    code = code.lower()
-    await ctx.redis_client.set(redis_id, code, expire=config.VERIFY_CODE_TIMEOUT)
-    return CommonOut(data={"id": redis_id, "code": data})
+    """从验证码池中取出一个验证码，存储到 redis"""
+    code, data = await captcha_pool.pop()
+    captcha_id = uuid.uuid4().hex
+    await ctx.redis_client.set(
+        "verify_" + captcha_id, code.lower(), expire=config.VERIFY_CODE_TIMEOUT
+    )
+    return CommonOut(data={"id": captcha_id, "code": data})
 
 
 async def verify_code(key: Optional[str], code: Optional[str]):
@@ -54,6 +142,9 @@ async def verify_code(key: Optional[str], code: Optional[str]):
         raise HTTPException(status_code=406, detail="请输入验证码")
     val = await ctx.redis_client.get("verify_" + key)
     lower_code = code.lower()
-    if val and val != lower_code and lower_code != "web.py":
-        raise HTTPException(status_code=406, detail="验证码错误")
+    if lower_code != "web.py":
+        if not val:
+            raise HTTPException(status_code=406, detail="验证码已过期")
+        if val != lower_code:
+            raise HTTPException(status_code=406, detail="验证码错误")
     await ctx.redis_client.delete("verify_" + key)
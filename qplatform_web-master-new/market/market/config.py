@@ -24,6 +24,11 @@ ADMIN_API_PREFIX = config("ADMIN_API_PREFIX", default="/xxx/fake")
 
 DEFAULT_PAGE_SIZE = config("DEFAULT_PAGE_SIZE", cast=int, default=20)
 PAGE_SIZE_LIMIT = config("PAGE_SIZE_LIMIT", cast=int, default=300)
+# 列表总数缓存的时间（秒）和进程内缓存的条数
+PAGINATE_COUNT_TTL = config("PAGINATE_COUNT_TTL", cast=int, default=30)
+PAGINATE_COUNT_LOCAL_SIZE = config("PAGINATE_COUNT_LOCAL_SIZE", cast=int, default=2048)
+# 估计行数低于该值时仍然精确 count
+PAGINATE_ESTIMATE_MIN = config("PAGINATE_ESTIMATE_MIN", cast=int, default=10000)
 
 # a string of origins separated by commas, e.g:
 # "http://localhost, http://localhost:8080, http://local.dockertoolbox.tiangolo.com"
@@ -33,6 +38,63 @@ BACKEND_CORS_ORIGINS = config("BACKEND_CORS_ORIGINS", default="http://localhost:
 MONGODB_MIN_POOL_SIZE = config("MONGODB_MIN_POOL_SIZE", cast=int, default=0)
 MONGODB_MAX_POOL_SIZE = config("MONGODB_MAX_POOL_SIZE", cast=int, default=100)
 MONGO_SERVER = config("MONGO_SERVER", default="mongodb://192.168.0.115:27017")
+# 批量获取运行信息时，同时发往 mongo 的最大查询数
+RUN_INFO_CONCURRENCY = config("RUN_INFO_CONCURRENCY", cast=int, default=32)
+# 运行信息缓存：进程内 LRU 的大小和过期时间，redis 缓存过期时间，
+# 任务最新日期的缓存时间（日期前进后运行信息缓存失效），秒
+RUN_INFO_CACHE_ENABLE = config("RUN_INFO_CACHE_ENABLE", cast=bool, default=True)
+RUN_INFO_CACHE_LOCAL_SIZE = config("RUN_INFO_CACHE_LOCAL_SIZE", cast=int, default=4096)
+RUN_INFO_CACHE_LOCAL_TTL = config("RUN_INFO_CACHE_LOCAL_TTL", cast=int, default=300)
+RUN_INFO_CACHE_TTL = config("RUN_INFO_CACHE_TTL", cast=int, default=60 * 60 * 24)
+RUN_INFO_DAY_TTL = config("RUN_INFO_DAY_TTL", cast=int, default=60)
+# 首次访问任务时给任务结果集合创建 day 索引
+RUN_INFO_ENSURE_INDEX = config("RUN_INFO_ENSURE_INDEX", cast=bool, default=True)
+# 记录已建索引的任务数，以及多久后重新检查（任务运行中可能新建结果集合），秒
+RUN_INFO_INDEX_TRACK_SIZE = config("RUN_INFO_INDEX_TRACK_SIZE", cast=int, default=10000)
+RUN_INFO_INDEX_TRACK_TTL = config("RUN_INFO_INDEX_TRACK_TTL", cast=int, default=60 * 60)
+# 导出完整运行信息时每批从 mongo 读取的条数
+RUN_INFO_EXPORT_BATCH_SIZE = config(
+    "RUN_INFO_EXPORT_BATCH_SIZE", cast=int, default=1000
+)
+# 列表页缩略收益曲线的点数和缓存时间（秒），任务有新数据时缓存自动失效
+SPARKLINE_POINTS = config("SPARKLINE_POINTS", cast=int, default=64)
+SPARKLINE_CACHE_TIMEOUT = config(
+    "SPARKLINE_CACHE_TIMEOUT", cast=int, default=60 * 60 * 24 * 7
+)
+# 用户购买权限缓存：进程内缓存大小和时间（其它进程的缓存不会被主动删除，不宜过长），redis 缓存时间，秒
+ENTITLEMENT_LOCAL_SIZE = config("ENTITLEMENT_LOCAL_SIZE", cast=int, default=10000)
+ENTITLEMENT_LOCAL_TTL = config("ENTITLEMENT_LOCAL_TTL", cast=int, default=5)
+ENTITLEMENT_CACHE_TTL = config("ENTITLEMENT_CACHE_TTL", cast=int, default=60 * 60)
+# 首页排行榜（redis 有序集合）的刷新间隔，秒
+LEADERBOARD_REFRESH_INTERVAL = config(
+    "LEADERBOARD_REFRESH_INTERVAL", cast=int, default=300
+)
+# 浏览 / 收藏 / 分享计数从 redis 写入数据库的间隔（秒）和每条 UPDATE 的商品数
+COUNTER_FLUSH_INTERVAL = config("COUNTER_FLUSH_INTERVAL", cast=int, default=60)
+COUNTER_FLUSH_BATCH_SIZE = config("COUNTER_FLUSH_BATCH_SIZE", cast=int, default=500)
+# 过期订单的处理间隔（秒）、每批更新的订单数，以及线上支付订单的支付超时时间（秒）
+ORDER_SWEEP_INTERVAL = config("ORDER_SWEEP_INTERVAL", cast=int, default=60)
+ORDER_SWEEP_BATCH_SIZE = config("ORDER_SWEEP_BATCH_SIZE", cast=int, default=500)
+ORDER_PAY_TIMEOUT = config("ORDER_PAY_TIMEOUT", cast=int, default=60 * 60 * 2)
+# 微信支付，WX_PAY_HOST 可以指向本地的 mock 服务（python -m market.core.pay.mock_server）
+WX_PAY_APP_ID = config("WX_PAY_APP_ID", default="")
+WX_PAY_MCH_ID = config("WX_PAY_MCH_ID", default="")
+WX_PAY_MCH_KEY = config("WX_PAY_MCH_KEY", default="")
+WX_PAY_NOTIFY_URL = config("WX_PAY_NOTIFY_URL", default="")
+WX_PAY_KEY = config("WX_PAY_KEY", default=None)
+WX_PAY_CERT = config("WX_PAY_CERT", default=None)
+WX_PAY_HOST = config("WX_PAY_HOST", default="https://api.mch.weixin.qq.com")
+# 下单时上报的终端 IP（NATIVE 支付为服务器 IP）
+WX_PAY_CLIENT_IP = config("WX_PAY_CLIENT_IP", default="127.0.0.1")
+# 微信支付请求的超时时间（秒），连接池的最大连接数和 keep-alive 连接数
+WX_PAY_TIMEOUT = config("WX_PAY_TIMEOUT", cast=float, default=10)
+WX_PAY_CONNECT_TIMEOUT = config("WX_PAY_CONNECT_TIMEOUT", cast=float, default=3)
+WX_PAY_MAX_CONNECTIONS = config("WX_PAY_MAX_CONNECTIONS", cast=int, default=100)
+WX_PAY_MAX_KEEPALIVE = config("WX_PAY_MAX_KEEPALIVE", cast=int, default=20)
+# 微信支付通知按 transaction_id 去重的时间（秒），微信在 24 小时内重试
+PAY_NOTIFY_DEDUP_TTL = config("PAY_NOTIFY_DEDUP_TTL", cast=int, default=60 * 60 * 48)
+# 对账时每次查询订单 / 写入差异的条数
+RECONCILE_BATCH_SIZE = config("RECONCILE_BATCH_SIZE", cast=int, default=1000)
 # redis connection
 REDIS_URL = config(
     "REDIS_URL", default="redis://:123456@localhost:6379/0?encoding=utf-8"
@@ -80,6 +142,10 @@ FIRST_SUPERUSER_PASSWORD = config("FIRST_SUPERUSER_PASSWORD", default="Market.12
 
 # verify code and sms config
 VERIFY_CODE_TIMEOUT = config("VERIFY_CODE_TIMEOUT", cast=int, default=180)  # 秒超时时间
+# 预先生成的验证码图片池：容量，低于多少时补充，生成图片的进程数
+CAPTCHA_POOL_SIZE = config("CAPTCHA_POOL_SIZE", cast=int, default=200)
+CAPTCHA_POOL_LOW_WATER = config("CAPTCHA_POOL_LOW_WATER", cast=int, default=50)
+CAPTCHA_POOL_WORKERS = config("CAPTCHA_POOL_WORKERS", cast=int, default=1)
 ACCESS_TOKEN_EXPIRE_MINUTES = config(
     "ACCESS_TOKEN_EXPIRE_MINUTES",
     cast=int,
@@ -96,6 +162,12 @@ SMS_CLI_ACCESSSECRET = config("SMS_CLI_ACCESSSECRET", default="NOOP")
 SMS_CLI_REGION = config("SMS_CLI_REGION", default="cn-hangzhou")
 SMS_REQ_REGION_ID = config("SMS_REQ_REGION_ID", default="cn-hangzhou")
 SMS_REQ_REGION_SIGN_NAME = config("SMS_REQ_REGION_SIGN_NAME", default="NOOP")
+# 短信平台：aliyun / fake（只打日志，不真正发送）
+SMS_PROVIDER = config("SMS_PROVIDER", default="aliyun")
+# 调用短信平台的线程数，网络异常时的重试次数和首次重试等待的秒数
+SMS_WORKERS = config("SMS_WORKERS", cast=int, default=4)
+SMS_RETRIES = config("SMS_RETRIES", cast=int, default=2)
+SMS_RETRY_BACKOFF = config("SMS_RETRY_BACKOFF", cast=float, default=0.5)
 
 # QP_WEB_DSN = config("QP_WEB_DSN", default="sqlite://:memory:")
 QP_WEB_DB_HOST = config("QP_WEB_DB_HOST", default="localhost")
@@ -105,12 +177,37 @@ QP_WEB_DB_PASSWORD = config("QP_WEB_DB_PASSWORD", default="")
 QP_WEB_DB_NAME = config("QP_WEB_DB_NAME", default="wk_aq")
 QP_WEB_DB_UNIX_SOCKET = config("QP_WEB_DB_UNIX_SOCKET", default=None)
 QP_WEB_DB_CHARSET = config("QP_WEB_DB_CHARSET", default="")
+# qplatform mysql 连接池的最小 / 最大连接数，连接的回收时间，以及连接、等待空闲连接、查询的超时时间（秒）
+QP_WEB_DB_POOL_MIN = config("QP_WEB_DB_POOL_MIN", cast=int, default=1)
+QP_WEB_DB_POOL_MAX = config("QP_WEB_DB_POOL_MAX", cast=int, default=10)
+QP_WEB_DB_POOL_RECYCLE = config("QP_WEB_DB_POOL_RECYCLE", cast=int, default=3600)
+QP_WEB_DB_CONNECT_TIMEOUT = config("QP_WEB_DB_CONNECT_TIMEOUT", cast=float, default=5)
+QP_WEB_DB_ACQUIRE_TIMEOUT = config("QP_WEB_DB_ACQUIRE_TIMEOUT", cast=float, default=5)
+QP_WEB_DB_QUERY_TIMEOUT = config("QP_WEB_DB_QUERY_TIMEOUT", cast=float, default=5)
 
 SECRET_KEY = config(
     "SECRET_KEY",
     default="09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7",
 )
 SECRET_ALGORITHM = config("SECRET_ALGORITHM", default="HS256")
+# bcrypt 轮数（调高后旧密码在下次登录时重新哈希），计算哈希的线程数，
+# 排队 + 计算中的哈希数超过 PASSWORD_HASH_MAX_PENDING 时拒绝请求（0 不限制）
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", cast=int, default=12)
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", cast=int, default=4)
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", cast=int, default=64)
+# 应用前面的反向代理层数，客户端 IP 从 X-Forwarded-For 的右边数第几个地址取（见 utils.client_ip），
+# 0 表示直接对外、不信任 X-Forwarded-For / X-Real-IP；和实际层数不一致时登录的 IP 限制会按代理地址计数
+TRUSTED_PROXY_COUNT = config("TRUSTED_PROXY_COUNT", cast=int, default=1)
+# 登录限制：账号在 LOGIN_FAIL_WINDOW 秒内最多失败次数，同一 IP 在 LOGIN_IP_WINDOW 秒内
+# 最多登录次数（0 不限制），不存在的账号缓存时间，秒
+LOGIN_MAX_FAILURES = config("LOGIN_MAX_FAILURES", cast=int, default=10)
+LOGIN_FAIL_WINDOW = config("LOGIN_FAIL_WINDOW", cast=int, default=600)
+LOGIN_MAX_IP_ATTEMPTS = config("LOGIN_MAX_IP_ATTEMPTS", cast=int, default=60)
+LOGIN_IP_WINDOW = config("LOGIN_IP_WINDOW", cast=int, default=60)
+LOGIN_UNKNOWN_TTL = config("LOGIN_UNKNOWN_TTL", cast=int, default=60)
+# 进程内用户缓存（按 uuid）的大小和过期时间，秒
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", cast=int, default=10000)
+USER_CACHE_TTL = config("USER_CACHE_TTL", cast=int, default=30)
 
 
 # SMTP_TLS = getenv_boolean("SMTP_TLS", True)
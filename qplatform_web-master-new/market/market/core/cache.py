@@ -0,0 +1,229 @@
+"""缓存
+
+LRUCache 为进程内缓存，TwoTierCache 在进程内缓存之后再查 redis，
+RunInfoCache 用于 mongo 中的策略运行信息，任务的最新日期变化后缓存失效
+"""
+import functools
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from market.const import TaskType
+from market.ctx import ctx
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """进程内的 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """进程内 LRU + redis 的两级缓存，值使用 orjson 序列化
+
+    local / redis 任意一级可以关闭（传 None / redis_ttl=0）
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        local: Optional[LRUCache] = None,
+        redis_ttl: int = 0,
+    ):
+        self.prefix = prefix
+        self.local = local
+        self.redis_ttl = redis_ttl
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        if self.local is not None:
+            raw = self.local.get(key)
+            if raw is not None:
+                self.local_hits += 1
+                return orjson.loads(raw)
+        if self.redis_ttl and ctx.redis_client:
+            raw = await ctx.redis_client.get(self.prefix + key, encoding=None)
+            if raw is not None:
+                self.redis_hits += 1
+                if self.local is not None:
+                    self.local.set(key, raw)
+                return orjson.loads(raw)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value):
+        raw = orjson.dumps(value)
+        if self.local is not None:
+            self.local.set(key, raw)
+        if self.redis_ttl and ctx.redis_client:
+            await ctx.redis_client.set(self.prefix + key, raw, expire=self.redis_ttl)
+
+    async def delete(self, key: str):
+        if self.local is not None:
+            self.local.delete(key)
+        if self.redis_ttl and ctx.redis_client:
+            await ctx.redis_client.delete(self.prefix + key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "local_size": len(self.local) if self.local is not None else 0,
+        }
+
+
+class RunInfoCache:
+    """策略运行信息的读穿缓存
+
+    缓存以 (task_type, task_id, collection, projection) 为 key，值中记录了写入时
+    该结果集合的最新日期；最新日期本身也会缓存 day_ttl 秒，日期前进后旧的缓存失效。
+    各结果集合的写入时间不同，每个集合按自己的最新日期判断是否失效
+    """
+
+    def __init__(
+        self,
+        day_loader: Callable[[TaskType, str, str], Awaitable[Any]],
+        enable: bool = True,
+        local_size: int = 4096,
+        local_ttl: int = 300,
+        redis_ttl: int = 60 * 60 * 24,
+        day_ttl: int = 60,
+    ):
+        self.day_loader = day_loader
+        self.enable = enable
+        self.data = TwoTierCache(
+            "runinfo_", LRUCache(local_size, local_ttl), redis_ttl=redis_ttl
+        )
+        self.days = TwoTierCache(
+            "runinfo_day_", LRUCache(local_size, day_ttl), redis_ttl=day_ttl
+        )
+        # 查询过最新日期的结果集合，失效时一并删除
+        self._day_names = {"returns"}
+        self.hits = 0
+        self.misses = 0
+
+    async def latest_day(
+        self, task_type: TaskType, task_id: str, name: str = "returns"
+    ):
+        """任务结果集合 name 中最新的日期，没有数据时返回 None"""
+        self._day_names.add(name)
+        key = f"{task_type.value}:{task_id}:{name}"
+        day = await self.days.get(key)
+        if day is None:
+            day = await self.day_loader(task_type, task_id, name)
+            if day is not None:
+                await self.days.set(key, day)
+        return day
+
+    async def invalidate(self, task_type: TaskType, task_id: str):
+        """任务有新数据时主动失效，下次读取重新获取最新日期"""
+        for name in self._day_names:
+            await self.days.delete(f"{task_type.value}:{task_id}:{name}")
+
+    async def get_or_load(
+        self,
+        task_type: TaskType,
+        task_id: str,
+        collection: str,
+        projection: str,
+        loader: Callable[[], Awaitable[Any]],
+    ):
+        day = await self.latest_day(task_type, task_id, collection)
+        if day is None:
+            # 任务还没有数据，不缓存
+            self.misses += 1
+            return await loader()
+        key = f"{task_type.value}:{task_id}:{collection}:{projection}"
+        item = await self.data.get(key)
+        if item is not None and item["day"] == day:
+            self.hits += 1
+            return item["data"]
+        self.misses += 1
+        data = await loader()
+        await self.data.set(key, {"day": day, "data": data})
+        return data
+
+    def cached(
+        self,
+        collection: str,
+        projection: str,
+        task_type: TaskType = TaskType.PAPER_TRADING,
+    ):
+        """缓存运行信息查询函数的装饰器
+
+        被装饰的函数需要有 task_id 参数，没有 task_type 参数时使用 task_type，
+        其余参数会加到 projection 里
+        """
+
+        def decorator(func):
+            sig = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enable:
+                    return await func(*args, **kwargs)
+                bound = sig.bind(*args, **kwargs)
+                bound.apply_defaults()
+                params = dict(bound.arguments)
+                task_id = params.pop("task_id")
+                real_type = params.pop("task_type", task_type)
+                key = projection
+                if params:
+                    key += ":" + ",".join(f"{k}={v}" for k, v in params.items())
+                return await self.get_or_load(
+                    real_type,
+                    task_id,
+                    collection,
+                    key,
+                    lambda: func(*args, **kwargs),
+                )
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "data": self.data.stats(),
+            "days": self.days.stats(),
+        }
@@ -1,5 +1,10 @@
 from celery import Celery
+from celery.schedules import crontab
 
 celery_app = Celery("worker", broker="amqp://guest@queue//")
 
 celery_app.conf.task_routes = {"app.worker.test_celery": "main-queue"}
+# 微信支付的对账单在次日 10 点后生成
+celery_app.conf.beat_schedule = {
+    "reconcile-bill": {"task": "market.reconcile_bill", "schedule": crontab(hour=10, minute=30)},
+}
@@ -0,0 +1,86 @@
+"""密码哈希
+
+bcrypt 每次计算需要上百毫秒，放到线程池中执行以免阻塞事件循环；
+同时计算的数量受线程数限制，排队过多时直接拒绝
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """在线程池中计算 / 校验密码哈希
+
+    :param context: passlib 的 CryptContext，轮数低于配置的哈希在登录时会重新计算
+    :param workers: 线程数，即同时计算的最大数量
+    :param max_pending: 排队 + 计算中的最大数量，0 表示不限制
+    """
+
+    def __init__(self, context: CryptContext, workers: int = 4, max_pending: int = 0):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pwd_hasher"
+        )
+        self.pending = 0
+        self.running = 0
+        self.max_seen_pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _run(self, func, *args):
+        if self.max_pending and self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning("password hasher busy, %s pending", self.pending)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后再试",
+            )
+        self.pending += 1
+        self.max_seen_pending = max(self.max_seen_pending, self.pending)
+        loop = asyncio.get_event_loop()
+
+        def _call():
+            self.running += 1
+            try:
+                return func(*args)
+            finally:
+                self.running -= 1
+
+        try:
+            return await loop.run_in_executor(self._executor, _call)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, secret: str) -> str:
+        return await self._run(self.context.hash, secret)
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, secret, hashed)
+
+    async def verify_and_update(
+        self, secret: str, hashed: str
+    ) -> Tuple[bool, Optional[str]]:
+        """校验密码，哈希需要升级（轮数变化等）时同时返回新的哈希"""
+        return await self._run(self.context.verify_and_update, secret, hashed)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": max(self.pending - self.running, 0),
+            "max_pending": self.max_seen_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
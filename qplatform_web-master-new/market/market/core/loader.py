@@ -0,0 +1,92 @@
+"""批量加载
+
+列表接口里逐条查询关联数据会产生 N+1 次查询，BatchLoader 把同一轮事件循环中的
+load 调用合并成一次批量查询（dataloader 的做法），model_loader 用于按列加载 gino 模型::
+
+    users = model_loader(MarketUser, columns=[MarketUser.name, MarketUser.phone])
+    rows = await users.load_many([order.user_id for order in orders])
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from market.models import db
+
+
+class BatchLoader:
+    """
+    :param batch_fn: 接收 key 列表，返回 {key: value} 的协程函数，缺少的 key 得到 None
+    :param max_batch: 每次批量查询最多的 key 数
+    :param cache: 是否缓存结果，loader 一般只在一个请求内使用
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch: int = 1000,
+        cache: bool = True,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.cache = cache
+        self._futures: Dict[Hashable, "asyncio.Future"] = {}
+        self._queue: List[Hashable] = []
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        fut = self._futures.get(key)
+        if fut is not None:
+            return fut
+        loop = asyncio.get_event_loop()
+        fut = loop.create_future()
+        self._futures[key] = fut
+        self._queue.append(key)
+        if len(self._queue) == 1:
+            # 等本轮的 load 都调用完再查询
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return fut
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        for i in range(0, len(keys), self.max_batch):
+            batch = keys[i : i + self.max_batch]
+            try:
+                values = await self.batch_fn(batch)
+            except Exception as e:
+                for key in batch:
+                    self._resolve(key, exception=e)
+                continue
+            for key in batch:
+                self._resolve(key, values.get(key))
+
+    def _resolve(self, key, value=None, exception: Optional[BaseException] = None):
+        fut = self._futures[key] if self.cache else self._futures.pop(key)
+        if exception is not None:
+            if self.cache:
+                # 出错的不缓存，下次重新加载
+                self._futures.pop(key, None)
+            fut.set_exception(exception)
+        else:
+            fut.set_result(value)
+
+    def clear(self):
+        self._futures.clear()
+
+
+def model_loader(model, key=None, columns=None, max_batch: int = 1000) -> BatchLoader:
+    """按 key 列（默认主键 id）批量加载 model
+
+    指定 columns 时只查询这些列，结果是数据库行（可按列名取值），否则是模型实例
+    """
+    key = model.id if key is None else key
+
+    async def batch_fn(keys):
+        if columns:
+            query = db.select([key.label("_key"), *columns]).where(key.in_(keys))
+            rows = await query.gino.all()
+            return {row["_key"]: row for row in rows}
+        rows = await model.query.where(key.in_(keys)).gino.all()
+        return {getattr(row, key.name): row for row in rows}
+
+    return BatchLoader(batch_fn, max_batch=max_batch)
@@ -0,0 +1,97 @@
+"""登录频率限制
+
+在 redis 中记录每个登录账号的失败次数和每个 IP 的登录次数，超过限制后直接拒绝；
+不存在的账号也会缓存一段时间，撞库请求不会再查询数据库
+"""
+import logging
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from market.ctx import ctx
+
+logger = logging.getLogger(__name__)
+
+
+class LoginGuard:
+    """
+    :param prefix: redis key 前缀，区分用户端和管理后台
+    :param max_failures: 账号在 fail_window 秒内最多失败的次数
+    :param max_ip_attempts: 同一个 IP 在 ip_window 秒内最多的登录次数，0 表示不限制
+    :param unknown_ttl: 不存在的账号缓存的时间，秒
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        max_failures: int = 10,
+        fail_window: int = 600,
+        max_ip_attempts: int = 0,
+        ip_window: int = 60,
+        unknown_ttl: int = 60,
+    ):
+        self.prefix = prefix
+        self.max_failures = max_failures
+        self.fail_window = fail_window
+        self.max_ip_attempts = max_ip_attempts
+        self.ip_window = ip_window
+        self.unknown_ttl = unknown_ttl
+
+    def _fail_key(self, identifier: str) -> str:
+        return f"{self.prefix}fail_{identifier}"
+
+    def _unknown_key(self, identifier: str) -> str:
+        return f"{self.prefix}unknown_{identifier}"
+
+    def _ip_key(self, client_ip: str) -> str:
+        return f"{self.prefix}ip_{client_ip}"
+
+    async def _incr(self, key: str, expire: int) -> int:
+        tr = ctx.redis_client.multi_exec()
+        fut = tr.incr(key)
+        tr.expire(key, expire)
+        await tr.execute()
+        return await fut
+
+    async def check(self, identifier: str, client_ip: Optional[str] = None) -> bool:
+        """登录前检查，超过限制时抛出 429；返回账号是否已知不存在"""
+        if not ctx.redis_client:
+            return False
+        if client_ip and self.max_ip_attempts:
+            attempts = await self._incr(self._ip_key(client_ip), self.ip_window)
+            if attempts > self.max_ip_attempts:
+                logger.warning("too many login attempts from %s", client_ip)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="登录过于频繁，请稍后再试",
+                )
+        failures, unknown = await ctx.redis_client.mget(
+            self._fail_key(identifier), self._unknown_key(identifier)
+        )
+        if failures and int(failures) >= self.max_failures:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="密码错误次数过多，请稍后再试",
+            )
+        return bool(unknown)
+
+    async def failed(self, identifier: str, unknown: bool = False):
+        """记录一次失败，unknown 表示账号不存在"""
+        if not ctx.redis_client:
+            return
+        await self._incr(self._fail_key(identifier), self.fail_window)
+        if unknown and self.unknown_ttl:
+            await ctx.redis_client.set(
+                self._unknown_key(identifier), "1", expire=self.unknown_ttl
+            )
+
+    async def succeeded(self, identifier: str):
+        if not ctx.redis_client:
+            return
+        await ctx.redis_client.delete(self._fail_key(identifier))
+
+    async def forget_unknown(self, *identifiers: Optional[str]):
+        """新建账号后删除不存在的缓存"""
+        keys = [self._unknown_key(i) for i in identifiers if i]
+        if keys and ctx.redis_client:
+            await ctx.redis_client.delete(*keys)
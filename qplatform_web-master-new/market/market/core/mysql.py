@@ -0,0 +1,121 @@
+"""qplatform mysql 的连接池
+
+- 获取连接时统计等待时间，超过 acquire_timeout 报错
+- 每条查询都有超时，超时的连接直接关闭，不放回连接池
+- 只用于只读查询，连接池需要 autocommit=True，否则连接归还时处于事务中会被关闭
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiomysql
+
+logger = logging.getLogger(__name__)
+
+
+class MySQLPool:
+    """aiomysql 连接池的封装，查询结果为 dict
+
+    :param pool: aiomysql 连接池
+    :param query_timeout: 默认的查询超时时间，秒
+    :param acquire_timeout: 等待空闲连接的超时时间，秒
+    """
+
+    def __init__(
+        self, pool: aiomysql.Pool, query_timeout: float = 5, acquire_timeout: float = 5
+    ):
+        self.pool = pool
+        self.query_timeout = query_timeout
+        self.acquire_timeout = acquire_timeout
+        self.acquired = 0
+        self.acquire_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.queries = 0
+        self.query_timeouts = 0
+        self.query_time_total = 0.0
+
+    @classmethod
+    async def create(
+        cls, query_timeout: float = 5, acquire_timeout: float = 5, **kwargs
+    ) -> "MySQLPool":
+        """创建连接池，kwargs 为 aiomysql.create_pool 的参数"""
+        pool = await aiomysql.create_pool(**kwargs)
+        return cls(pool, query_timeout, acquire_timeout)
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            logger.warning("mysql pool exhausted: %s", self.stats())
+            raise
+        wait = time.perf_counter() - start
+        self.acquired += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    @staticmethod
+    async def _fetch(conn, sql: str, args) -> List[Dict[str, Any]]:
+        cursor = await conn.cursor(aiomysql.DictCursor)
+        await cursor.execute(sql, args)
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return list(rows)
+
+    async def fetch_all(
+        self, sql: str, args: Optional[Sequence] = None, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        async with self.acquire() as conn:
+            start = time.perf_counter()
+            self.queries += 1
+            try:
+                return await asyncio.wait_for(
+                    self._fetch(conn, sql, args), timeout or self.query_timeout
+                )
+            except asyncio.TimeoutError:
+                self.query_timeouts += 1
+                # 连接上可能还有未读完的结果，不能再复用
+                conn.close()
+                logger.warning("mysql query timeout: %s %s", sql, args)
+                raise
+            finally:
+                self.query_time_total += time.perf_counter() - start
+
+    async def fetch_one(
+        self, sql: str, args: Optional[Sequence] = None, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        rows = await self.fetch_all(sql, args, timeout)
+        return rows[0] if rows else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.pool.size,
+            "free": self.pool.freesize,
+            "used": self.pool.size - self.pool.freesize,
+            "minsize": self.pool.minsize,
+            "maxsize": self.pool.maxsize,
+            "acquired": self.acquired,
+            "acquire_timeouts": self.acquire_timeouts,
+            "wait_avg_ms": round(self.wait_total / self.acquired * 1000, 3)
+            if self.acquired
+            else 0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "queries": self.queries,
+            "query_timeouts": self.query_timeouts,
+            "query_avg_ms": round(self.query_time_total / self.queries * 1000, 3)
+            if self.queries
+            else 0,
+        }
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
@@ -1,10 +1,23 @@
 from enum import Enum
 
-from market.config import PAY_PARAMS
-
-from .wechat_pay import WeixinPay
-
-wx_pay = WeixinPay(PAY_PARAMS)  # noqa
+from market import config
+
+from .base import WeixinError
+from .wechat_pay import AsyncWeixinPay
+
+wx_pay = AsyncWeixinPay(
+    config.WX_PAY_APP_ID,
+    config.WX_PAY_MCH_ID,
+    config.WX_PAY_MCH_KEY,
+    config.WX_PAY_NOTIFY_URL,
+    key=config.WX_PAY_KEY,
+    cert=config.WX_PAY_CERT,
+    host=config.WX_PAY_HOST,
+    timeout=config.WX_PAY_TIMEOUT,
+    connect_timeout=config.WX_PAY_CONNECT_TIMEOUT,
+    max_connections=config.WX_PAY_MAX_CONNECTIONS,
+    max_keepalive=config.WX_PAY_MAX_KEEPALIVE,
+)  # noqa
 
 
 class PayMethod(Enum):
@@ -24,61 +37,102 @@ class PayMode(Enum):
 
 
 class PayException(Exception):
-    """支付异常"""
+    """支付异常，code 为支付平台返回的错误码"""
+
+    def __init__(self, msg: str = "", code: str = None):
+        super().__init__(msg)
+        self.code = code
 
 
 class PayUnSupport(PayException):
     """不支持的支付方式异常"""
 
 
-def pay(
+def to_fee(cash: float) -> int:
+    """元 -> 分"""
+    return int(round(cash * 100))
+
+
+async def _call(func, **kwargs):
+    try:
+        return await func(**kwargs)
+    except WeixinError as e:
+        raise PayException(str(e), getattr(e, "err_code", None)) from e
+
+
+async def pay(
     product_name: str,
     product_id: str,
     cash: float,
     order_no: str,
     method: PayMethod,
     mode: PayMode,
+    client_ip: str = config.WX_PAY_CLIENT_IP,
 ):
-    """支付下单
+    """支付下单，PC 网页使用微信扫码支付（NATIVE），返回结果中的 code_url 生成二维码
 
     :param product_name: 商品名称
     :param product_id: 商品 ID
     :param cash: 金额
     :param order_no: 平台（外部）订单号
     :param method: 支付方法（平台）
-    :param pattern: 支付模式
+    :param mode: 支付模式
+    :param client_ip: 终端 IP
     """
     if method != PayMethod.wx:
         raise PayUnSupport("不支持的支付方法")
     if mode != PayMode.PAGE:
         raise PayUnSupport("不支持的支付模式")
-
-
-def cancel_pay(order_no: str):
+    return await _call(
+        wx_pay.unified_order,
+        body=product_name,
+        product_id=product_id,
+        total_fee=to_fee(cash),
+        out_trade_no=order_no,
+        trade_type="NATIVE",
+        spbill_create_ip=client_ip,
+    )
+
+
+async def cancel_pay(order_no: str):
     """取消支付下单
 
     :param order_no: 平台（外部）订单号
     """
+    return await _call(wx_pay.close_order, out_trade_no=order_no)
 
 
-def pay_query(order_no: str):
+async def pay_query(order_no: str):
     """支付查询
 
     :param order_no: 平台（外部）订单号
     """
+    return await _call(wx_pay.order_query, out_trade_no=order_no)
 
 
-def refund(order_no: str, refund_no: str):
+async def refund(order_no: str, refund_no: str, cash: float, refund_cash: float):
     """申请退款
 
     :param order_no: 平台（外部）订单号
     :param refund_no: 退款申请号
+    :param cash: 订单金额
+    :param refund_cash: 退款金额
     """
+    return await _call(
+        wx_pay.refund,
+        out_trade_no=order_no,
+        out_refund_no=refund_no,
+        total_fee=to_fee(cash),
+        refund_fee=to_fee(refund_cash),
+    )
 
 
-def refund_query(order_no: str, refund_no: str):
+async def refund_query(order_no: str, refund_no: str):
     """退款查询
 
     :param order_no: 平台（外部）订单号
     :param refund_no: 退款申请号
     """
+    return await _call(
+        wx_pay.refund_query, out_trade_no=order_no, out_refund_no=refund_no
+    )
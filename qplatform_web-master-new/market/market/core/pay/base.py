@@ -0,0 +1,19 @@
+# coding: utf-8
+
+
+class WeixinError(Exception):
+    def __init__(self, msg):
+        super(WeixinError, self).__init__(msg)
+
+
+class Map(dict):
+    """可以用属性访问的 dict，不存在的键返回 None"""
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        self.pop(key, None)
@@ -0,0 +1,49 @@
+"""微信支付对账单解析
+
+对账单为 csv 格式：第一行为表头，每条记录的字段都以 ` 开头，
+最后两行为汇总（"总交易单数,..." 和汇总数据）
+"""
+import datetime
+from typing import AsyncIterable, AsyncIterator, NamedTuple
+
+SUMMARY_PREFIX = "总交易单数"
+
+
+class BillRow(NamedTuple):
+    trade_dt: datetime.datetime
+    transaction_id: str  # 微信订单号
+    out_trade_no: str  # 商户订单号
+    trade_state: str  # SUCCESS / REFUND / REVOKED
+    cash: float  # 订单金额，元
+    refund_cash: float  # 退款金额，元
+    out_refund_no: str
+
+
+def parse_line(line: str) -> BillRow:
+    """解析一行 ALL 类型对账单的记录"""
+    fields = [f[1:] if f.startswith("`") else f for f in line.split(",")]
+    return BillRow(
+        trade_dt=datetime.datetime.strptime(fields[0], "%Y-%m-%d %H:%M:%S"),
+        transaction_id=fields[5],
+        out_trade_no=fields[6],
+        trade_state=fields[9],
+        # 订单金额在第 25 列，旧版对账单没有时使用应结订单金额
+        cash=float(fields[24] if len(fields) > 24 and fields[24] else fields[12]),
+        refund_cash=float(fields[16] or 0),
+        out_refund_no=fields[15],
+    )
+
+
+async def parse_bill(lines: AsyncIterable[str]) -> AsyncIterator[BillRow]:
+    """逐行解析对账单，跳过表头，遇到汇总行结束"""
+    header = True
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if header:
+            header = False
+            continue
+        if line.startswith(SUMMARY_PREFIX):
+            break
+        yield parse_line(line)
@@ -0,0 +1,96 @@
+# coding: utf-8
+"""微信支付报文的编解码和签名
+
+- to_xml 一次拼接生成 xml，包含特殊字符的值使用 CDATA
+- from_xml 每个线程复用一个解析器（不解析实体、不访问网络），只读取根节点下的一层字段；
+  报文只有一层、通常不到 1KB，iterparse 逐个事件回调反而比 fromstring 慢一倍左右
+- Signer 缓存每种字段组合排序后的顺序，签名时不再重复排序
+- nonce_str 使用 secrets 生成
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+from typing import Dict, Mapping, Tuple, Union
+
+from lxml import etree
+
+# 解析器不是线程安全的，同步客户端（WeixinPay.to_dict）和 celery worker 会在其它线程中调用，
+# 每个线程使用自己的解析器
+_local = threading.local()
+
+
+def _parser() -> etree.XMLParser:
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(
+            resolve_entities=False, no_network=True, remove_comments=True, huge_tree=False
+        )
+    return parser
+
+
+def nonce_str() -> str:
+    """32 位随机字符串"""
+    return secrets.token_hex(16)
+
+
+def _xml_value(value) -> str:
+    if value.__class__ is int:
+        return str(value)
+    value = str(value)
+    if "<" in value or "&" in value or ">" in value:
+        return "<![CDATA[" + value.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+    return value
+
+
+def to_xml(data: Mapping) -> bytes:
+    body = "".join(
+        [f"<{key}>{_xml_value(value)}</{key}>" for key, value in data.items()]
+    )
+    return f"<xml>{body}</xml>".encode("utf-8")
+
+
+def from_xml(content: Union[str, bytes]) -> Dict[str, str]:
+    """解析根节点下一层的字段，值为字符串（空节点为 None）"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    root = etree.fromstring(content, parser=_parser())
+    return {child.tag: child.text for child in root}
+
+
+class Signer:
+    """MD5 签名，空值和 sign 字段不参与签名
+
+    按字段的插入顺序缓存排序后的字段顺序，同一接口的请求 / 响应字段组合固定，
+    通常只在第一次签名时排序
+    """
+
+    def __init__(self, key: str, max_cached: int = 256):
+        self.suffix = "&key=" + key
+        self.max_cached = max_cached
+        self._orders: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def _order(self, keys: Tuple[str, ...]) -> Tuple[str, ...]:
+        order = self._orders.get(keys)
+        if order is None:
+            order = tuple(sorted(k for k in keys if k != "sign"))
+            if len(self._orders) >= self.max_cached:
+                self._orders.clear()
+            self._orders[keys] = order
+        return order
+
+    def sign(self, data: Mapping) -> str:
+        parts = []
+        for key in self._order(tuple(data)):
+            value = data[key]
+            if value is None or value == "":
+                continue
+            parts.append(f"{key}={value}")
+        s = "&".join(parts) + self.suffix
+        return hashlib.md5(s.encode("utf-8")).hexdigest().upper()
+
+    def check(self, data: Mapping) -> bool:
+        sign = data.get("sign")
+        if not sign:
+            return False
+        return hmac.compare_digest(sign, self.sign(data))
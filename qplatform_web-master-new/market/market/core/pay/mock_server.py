@@ -0,0 +1,347 @@
+"""本地 mock 微信支付服务
+
+实现下单、查询、关单、退款、退款查询、下载对账单接口，订单保存在内存中，
+请求和响应都按 mch_key 签名。用于本地开发和测试，也可以用来压测支付链路::
+
+    python -m market.core.pay.mock_server --port 8900 --mch-key xxx
+    WX_PAY_HOST=http://127.0.0.1:8900
+
+测试中可以不启动服务，直接通过 httpx 的 ASGITransport 请求::
+
+    app = create_app("key")
+    client = AsyncWeixinPay(..., mch_key="key", transport=httpx.ASGITransport(app=app))
+
+POST /mock/pay/{out_trade_no} 模拟用户完成支付，并向下单时的 notify_url 发送支付通知
+"""
+import datetime
+import itertools
+import logging
+import uuid
+from typing import Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from .wechat_pay import FAIL, SUCCESS, WeixinPay
+
+logger = logging.getLogger(__name__)
+
+BILL_HEADER = (
+    "交易时间,公众账号ID,商户号,特约商户号,设备号,微信订单号,商户订单号,用户标识,"
+    "交易类型,交易状态,付款银行,货币种类,应结订单金额,代金券金额,微信退款单号,"
+    "商户退款单号,退款金额,充值券退款金额,退款类型,退款状态,商品名称,商户数据包,"
+    "手续费,费率,订单金额,申请退款金额,费率备注"
+)
+BILL_SUMMARY_HEADER = "总交易单数,应结订单总金额,退款总金额,充值券退款总金额,手续费总金额,订单总金额,申请退款总金额"
+
+
+class MockWeixinPay:
+    """mock 服务的状态：订单和退款"""
+
+    def __init__(self, mch_key: str, app_id: str = "", mch_id: str = ""):
+        # 只用于签名 / 编解码
+        self.codec = WeixinPay(app_id, mch_id, mch_key, "")
+        self.orders: Dict[str, Dict] = {}
+        self.refunds: Dict[str, Dict] = {}
+        self._seq = itertools.count(1)
+        self.notify_transport = None
+
+    def reply(self, result: Optional[Dict] = None, err_code: str = "", err_msg: str = ""):
+        data = {"return_code": SUCCESS, "return_msg": "OK"}
+        if err_code:
+            data.update(result_code=FAIL, err_code=err_code, err_code_des=err_msg)
+        else:
+            data["result_code"] = SUCCESS
+            data.update(result or {})
+        data["nonce_str"] = self.codec.nonce_str
+        data["sign"] = self.codec.sign(data)
+        return Response(self.codec.to_xml(data), media_type="text/xml")
+
+    def fail(self, msg: str):
+        return Response(
+            self.codec.to_xml({"return_code": FAIL, "return_msg": msg}),
+            media_type="text/xml",
+        )
+
+    async def parse(self, request: Request) -> Optional[Dict]:
+        data = self.codec.to_dict((await request.body()).decode("utf-8"))
+        if "sign" not in data or not self.codec.check(dict(data)):
+            return None
+        return data
+
+    def _order_info(self, order: Dict) -> Dict:
+        info = {
+            "out_trade_no": order["out_trade_no"],
+            "trade_state": order["trade_state"],
+            "total_fee": order["total_fee"],
+            "trade_type": order["trade_type"],
+        }
+        if order.get("transaction_id"):
+            info.update(
+                transaction_id=order["transaction_id"],
+                time_end=order["time_end"].strftime("%Y%m%d%H%M%S"),
+                cash_fee=order["total_fee"],
+                bank_type="OTHERS",
+                fee_type="CNY",
+                openid=order.get("openid") or "mock_openid",
+                is_subscribe="N",
+            )
+        return info
+
+    async def unified_order(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        out_trade_no = data["out_trade_no"]
+        order = self.orders.get(out_trade_no)
+        if order:
+            if order["trade_state"] != "NOTPAY":
+                return self.reply(err_code="ORDERPAID", err_msg="该订单已支付")
+            if order["total_fee"] != int(data["total_fee"]):
+                return self.reply(err_code="INVALID_REQUEST", err_msg="订单金额不一致")
+        else:
+            order = self.orders[out_trade_no] = {
+                "out_trade_no": out_trade_no,
+                "body": data.get("body", ""),
+                "total_fee": int(data["total_fee"]),
+                "trade_type": data["trade_type"],
+                "trade_state": "NOTPAY",
+                "notify_url": data.get("notify_url", ""),
+                "openid": data.get("openid"),
+                "prepay_id": f"wx{uuid.uuid4().hex}",
+                "create_dt": datetime.datetime.now(),
+            }
+        result = {"prepay_id": order["prepay_id"], "trade_type": order["trade_type"]}
+        if order["trade_type"] == "NATIVE":
+            result["code_url"] = f"weixin://wxpay/bizpayurl?pr={order['prepay_id'][-8:]}"
+        return self.reply(result)
+
+    async def order_query(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        order = self.orders.get(data.get("out_trade_no"))
+        if order is None and data.get("transaction_id"):
+            order = next(
+                (
+                    o
+                    for o in self.orders.values()
+                    if o.get("transaction_id") == data["transaction_id"]
+                ),
+                None,
+            )
+        if order is None:
+            return self.reply(err_code="ORDERNOTEXIST", err_msg="订单不存在")
+        return self.reply(self._order_info(order))
+
+    async def close_order(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        order = self.orders.get(data["out_trade_no"])
+        if order is None:
+            return self.reply(err_code="ORDERNOTEXIST", err_msg="订单不存在")
+        if order["trade_state"] == "SUCCESS":
+            return self.reply(err_code="ORDERPAID", err_msg="订单已支付")
+        order["trade_state"] = "CLOSED"
+        return self.reply()
+
+    async def refund(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        order = self.orders.get(data.get("out_trade_no"))
+        if order is None or order["trade_state"] not in ("SUCCESS", "REFUND"):
+            return self.reply(err_code="ORDERNOTEXIST", err_msg="订单不存在或未支付")
+        refund_fee = int(data["refund_fee"])
+        refunded = sum(
+            r["refund_fee"]
+            for r in self.refunds.values()
+            if r["out_trade_no"] == order["out_trade_no"]
+        )
+        if refunded + refund_fee > order["total_fee"]:
+            return self.reply(err_code="NOTENOUGH", err_msg="退款金额超过订单金额")
+        refund = self.refunds.setdefault(
+            data["out_refund_no"],
+            {
+                "out_trade_no": order["out_trade_no"],
+                "out_refund_no": data["out_refund_no"],
+                "refund_id": f"50{next(self._seq):026d}",
+                "refund_fee": refund_fee,
+                "refund_status": "SUCCESS",
+            },
+        )
+        order["trade_state"] = "REFUND"
+        return self.reply(
+            {
+                "transaction_id": order["transaction_id"],
+                "out_trade_no": order["out_trade_no"],
+                "out_refund_no": refund["out_refund_no"],
+                "refund_id": refund["refund_id"],
+                "refund_fee": refund["refund_fee"],
+                "total_fee": order["total_fee"],
+                "cash_fee": order["total_fee"],
+            }
+        )
+
+    async def refund_query(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        refunds = [
+            r
+            for r in self.refunds.values()
+            if r["out_refund_no"] == data.get("out_refund_no")
+            or r["out_trade_no"] == data.get("out_trade_no")
+        ]
+        if not refunds:
+            return self.reply(err_code="REFUNDNOTEXIST", err_msg="退款不存在")
+        result = {"out_trade_no": refunds[0]["out_trade_no"], "refund_count": len(refunds)}
+        for i, r in enumerate(refunds):
+            result[f"out_refund_no_{i}"] = r["out_refund_no"]
+            result[f"refund_id_{i}"] = r["refund_id"]
+            result[f"refund_fee_{i}"] = r["refund_fee"]
+            result[f"refund_status_{i}"] = r["refund_status"]
+        return self.reply(result)
+
+    def bill(self, bill_date: str) -> str:
+        """bill_date 当天支付成功的订单，格式与微信的对账单相同（ALL）"""
+        lines = [BILL_HEADER]
+        count = total = 0
+        codec = self.codec
+        for order in self.orders.values():
+            time_end = order.get("time_end")
+            if not time_end or time_end.strftime("%Y%m%d") != bill_date:
+                continue
+            fee = "%.2f" % (order["total_fee"] / 100)
+            fields = [
+                time_end.strftime("%Y-%m-%d %H:%M:%S"),
+                codec.app_id,
+                codec.mch_id,
+                "0",
+                "",
+                order["transaction_id"],
+                order["out_trade_no"],
+                order.get("openid") or "mock_openid",
+                order["trade_type"],
+                "SUCCESS",
+                "OTHERS",
+                "CNY",
+                fee,
+                "0.00",
+                "0",
+                "0",
+                "0.00",
+                "0.00",
+                "",
+                "",
+                order["body"],
+                "",
+                "0.00000",
+                "0.60%",
+                fee,
+                "0.00",
+                "",
+            ]
+            lines.append(",".join("`" + f for f in fields))
+            count += 1
+            total += order["total_fee"]
+        total_fee = "%.2f" % (total / 100)
+        lines.append(BILL_SUMMARY_HEADER)
+        lines.append(
+            ",".join(
+                "`" + f
+                for f in (str(count), total_fee, "0.00", "0.00", "0.00000", total_fee, "0.00")
+            )
+        )
+        return "\r\n".join(lines) + "\r\n"
+
+    async def download_bill(self, request: Request):
+        data = await self.parse(request)
+        if data is None:
+            return self.fail("签名错误")
+        content = self.bill(data["bill_date"])
+        if content.count("\n") <= 3:
+            return self.fail("No Bill Exist")
+        return Response(content.encode("utf-8"), media_type="text/plain; charset=utf-8")
+
+    async def notify(self, order: Dict):
+        """向下单时的 notify_url 发送支付结果通知"""
+        import httpx
+
+        if not order["notify_url"]:
+            return None
+        data = {
+            "return_code": SUCCESS,
+            "result_code": SUCCESS,
+            "appid": self.codec.app_id,
+            "mch_id": self.codec.mch_id,
+            "nonce_str": self.codec.nonce_str,
+            **self._order_info(order),
+        }
+        data.pop("trade_state")
+        data["sign"] = self.codec.sign(data)
+        kwargs = {}
+        if self.notify_transport is not None:
+            kwargs["transport"] = self.notify_transport
+        async with httpx.AsyncClient(**kwargs) as client:
+            resp = await client.post(order["notify_url"], content=self.codec.to_xml(data))
+        return resp.text
+
+    async def mock_pay(self, request: Request):
+        """模拟用户完成支付，?notify=0 时不发送通知"""
+        order = self.orders.get(request.path_params["out_trade_no"])
+        if order is None:
+            return Response("order not found", status_code=404)
+        if order["trade_state"] == "NOTPAY":
+            order.update(
+                trade_state="SUCCESS",
+                transaction_id=f"42{next(self._seq):026d}",
+                time_end=datetime.datetime.now(),
+            )
+        reply = None
+        if request.query_params.get("notify", "1") != "0":
+            try:
+                reply = await self.notify(order)
+            except Exception:
+                logger.exception("notify %s failed", order["out_trade_no"])
+        return Response(reply or "", media_type="text/xml")
+
+
+def create_app(mch_key: str, app_id: str = "", mch_id: str = "") -> Starlette:
+    mock = MockWeixinPay(mch_key, app_id, mch_id)
+    app = Starlette(
+        routes=[
+            Route("/pay/unifiedorder", mock.unified_order, methods=["POST"]),
+            Route("/pay/orderquery", mock.order_query, methods=["POST"]),
+            Route("/pay/closeorder", mock.close_order, methods=["POST"]),
+            Route("/secapi/pay/refund", mock.refund, methods=["POST"]),
+            Route("/pay/refundquery", mock.refund_query, methods=["POST"]),
+            Route("/pay/downloadbill", mock.download_bill, methods=["POST"]),
+            Route("/mock/pay/{out_trade_no}", mock.mock_pay, methods=["POST"]),
+        ]
+    )
+    app.state.mock = mock
+    return app
+
+
+if __name__ == "__main__":
+    import click
+    import uvicorn
+
+    from market import config
+
+    @click.command()
+    @click.option("--host", default="127.0.0.1")
+    @click.option("--port", default=8900, type=int)
+    @click.option("--mch-key", default=config.WX_PAY_MCH_KEY)
+    @click.option("--app-id", default=config.WX_PAY_APP_ID)
+    @click.option("--mch-id", default=config.WX_PAY_MCH_ID)
+    def main(host, port, mch_key, app_id, mch_id):
+        """启动本地 mock 微信支付服务"""
+        uvicorn.run(create_app(mch_key, app_id, mch_id), host=host, port=port)
+
+    logging.basicConfig(level=logging.INFO)
+    main()
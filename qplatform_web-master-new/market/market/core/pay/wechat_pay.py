@@ -1,12 +1,8 @@
 # coding: utf-8
-import hashlib
-import random
-import string
+import hmac
 import time
 
-import requests
-from lxml import etree
-
+from . import codec
 from .base import Map, WeixinError
 
 try:
@@ -15,7 +11,7 @@ except Exception:
     request = None
 
 
-__all__ = ("WeixinPayError", "WeixinPay")
+__all__ = ("WeixinPayError", "WeixinPay", "AsyncWeixinPay")
 
 
 FAIL = "FAIL"
@@ -23,79 +19,89 @@ SUCCESS = "SUCCESS"
 
 
 class WeixinPayError(WeixinError):
-    def __init__(self, msg):
+    def __init__(self, msg, err_code=None):
         super(WeixinPayError, self).__init__(msg)
+        # 业务结果的错误码，如 ORDERPAID / ORDERNOTEXIST
+        self.err_code = err_code
 
 
 class WeixinPay(object):
     PAY_HOST = "https://api.mch.weixin.qq.com"
 
-    def __init__(self, app_id, mch_id, mch_key, notify_url, key=None, cert=None):
+    def __init__(
+        self, app_id, mch_id, mch_key, notify_url, key=None, cert=None, host=None
+    ):
         self.app_id = app_id
         self.mch_id = mch_id
         self.mch_key = mch_key
         self.notify_url = notify_url
         self.key = key
         self.cert = cert
-        self.sess = requests.Session()
+        if host:
+            self.PAY_HOST = host.rstrip("/")
+        self.signer = codec.Signer(mch_key)
+        self._sess = None
+
+    @property
+    def sess(self):
+        if self._sess is None:
+            import requests
+
+            self._sess = requests.Session()
+        return self._sess
 
     @property
     def nonce_str(self):
-        char = string.ascii_letters + string.digits
-        return "".join(random.choice(char) for _ in range(32))
+        return codec.nonce_str()
 
     def sign(self, raw):
-        raw = [
-            (k, str(raw[k]) if isinstance(raw[k], int) else raw[k])
-            for k in sorted(raw.keys())
-        ]
-        s = "&".join("=".join(kv) for kv in raw if kv[1])
-        s += "&key={0}".format(self.mch_key)
-        return hashlib.md5(s.encode("utf-8")).hexdigest().upper()
+        return self.signer.sign(raw)
 
     def check(self, data):
-        sign = data.pop("sign")
-        return sign == self.sign(data)
+        sign = data.pop("sign", None)
+        return bool(sign) and hmac.compare_digest(sign, self.sign(data))
 
     def to_xml(self, raw):
-        s = ""
-        for k, v in raw.items():
-            s += "<{0}>{1}</{0}>".format(k, v)
-        s = "<xml>{0}</xml>".format(s)
-        return s.encode("utf-8")
+        return codec.to_xml(raw)
 
     def to_dict(self, content):
-        raw = {}
-        root = etree.fromstring(
-            content.encode("utf-8"), parser=etree.XMLParser(resolve_entities=False)
-        )
-        for child in root:
-            raw[child.tag] = child.text
-        return raw
+        return codec.from_xml(content)
 
-    def _fetch(self, url, data, use_cert=False, appid=True):
+    def _prepare(self, data, appid=True):
         if appid:
             data.setdefault("appid", self.app_id)
         data.setdefault("mch_id", self.mch_id)
         data.setdefault("nonce_str", self.nonce_str)
         data.setdefault("sign", self.sign(data))
+        return self.to_xml(data)
 
-        if use_cert:
-            resp = self.sess.post(
-                url, data=self.to_xml(data), cert=(self.cert, self.key)
-            )
-        else:
-            resp = self.sess.post(url, data=self.to_xml(data))
-        content = resp.content.decode("utf-8")
+    def _prepare_pay(self, data):
+        data.setdefault("mch_appid", self.app_id)
+        data.setdefault("mchid", self.mch_id)
+        data.setdefault("nonce_str", self.nonce_str)
+        data.setdefault("sign", self.sign(data))
+        return self.to_xml(data)
+
+    def _parse(self, content):
         if "return_code" in content:
             data = Map(self.to_dict(content))
             if data.return_code == FAIL:
                 raise WeixinPayError(data.return_msg)
             if "result_code" in content and data.result_code == FAIL:
-                raise WeixinPayError(data.err_code_des)
+                raise WeixinPayError(data.err_code_des, data.err_code)
             return data
         return content
 
+    def _post(self, url, body, use_cert=False):
+        if use_cert:
+            resp = self.sess.post(url, data=body, cert=(self.cert, self.key))
+        else:
+            resp = self.sess.post(url, data=body)
+        return resp.content.decode("utf-8")
+
+    def _fetch(self, url, data, use_cert=False, appid=True):
+        return self._parse(self._post(url, self._prepare(data, appid), use_cert))
+
     def reply(self, msg, ok=True):
         code = SUCCESS if ok else FAIL
         return self.to_xml(dict(return_code=code, return_msg=msg))
@@ -141,7 +147,9 @@ class WeixinPay(object):
         详细规则参考 https://pay.weixin.qq.com/wiki/doc/api/jsapi.php?chapter=7_7&index=6
         """
         kwargs.setdefault("trade_type", "JSAPI")
-        raw = self.unified_order(**kwargs)
+        return self._jsapi_params(self.unified_order(**kwargs))
+
+    def _jsapi_params(self, raw):
         package = "prepay_id={0}".format(raw["prepay_id"])
         timestamp = str(int(time.time()))
         nonce_str = self.nonce_str
@@ -248,7 +256,7 @@ class WeixinPay(object):
         """
         企业付款到零钱
         """
-        url = "https://api.mch.weixin.qq.com/mmpaymkttransfers/promotion/transfers"
+        url = self.PAY_HOST + "/mmpaymkttransfers/promotion/transfers"
         if not self.key or not self.cert:
             raise WeixinPayError("企业接口需要双向证书")
         if "partner_trade_no" not in data:
@@ -264,7 +272,7 @@ class WeixinPay(object):
 
     def pay_individual_to_card(self, **data):
         """企业付款到银行卡"""
-        url = "https://api.mch.weixin.qq.com/mmpaysptrans/pay_bank"
+        url = self.PAY_HOST + "/mmpaysptrans/pay_bank"
         if not self.key or not self.cert:
             raise WeixinPayError("企业接口需要双向证书")
         if "partner_trade_no" not in data:
@@ -281,7 +289,7 @@ class WeixinPay(object):
 
     def pay_individual_bank_query(self, **data):
         """企业付款到银行卡查询"""
-        url = "https://api.mch.weixin.qq.com/mmpaysptrans/query_bank"
+        url = self.PAY_HOST + "/mmpaysptrans/query_bank"
         if not self.key or not self.cert:
             raise WeixinPayError("企业接口需要双向证书'")
         if "partner_trade_no" not in data:
@@ -290,7 +298,7 @@ class WeixinPay(object):
 
     def pay_individual_query(self, **data):
         """企业付款到零钱查询"""
-        url = "https://api.mch.weixin.qq.com/mmpaymkttransfers/gettransferinfo"
+        url = self.PAY_HOST + "/mmpaymkttransfers/gettransferinfo"
         if not self.key or not self.cert:
             raise WeixinPayError("企业接口需要双向证书'")
         if "partner_trade_no" not in data:
@@ -298,22 +306,109 @@ class WeixinPay(object):
         return self._fetch(url, data, True)
 
     def _fetch_pay(self, url, data, use_cert=False):
-        data.setdefault("mch_appid", self.app_id)
-        data.setdefault("mchid", self.mch_id)
-        data.setdefault("nonce_str", self.nonce_str)
-        data.setdefault("sign", self.sign(data))
+        return self._parse(self._post(url, self._prepare_pay(data), use_cert))
+
+
+class AsyncWeixinPay(WeixinPay):
+    """WeixinPay 的异步版本，接口与 WeixinPay 相同，返回值需要 await
+
+    请求使用 httpx.AsyncClient 的连接池（keep-alive），需要双向证书的接口使用单独的连接池；
+    transport 用于测试时直接请求本地的 mock 服务（见 mock_server）
+    """
+
+    def __init__(
+        self,
+        app_id,
+        mch_id,
+        mch_key,
+        notify_url,
+        key=None,
+        cert=None,
+        host=None,
+        timeout=10.0,
+        connect_timeout=3.0,
+        max_connections=100,
+        max_keepalive=20,
+        transport=None,
+    ):
+        super(AsyncWeixinPay, self).__init__(
+            app_id, mch_id, mch_key, notify_url, key, cert, host
+        )
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.transport = transport
+        self._client = None
+        self._cert_client = None
+
+    def _create_client(self, use_cert):
+        import httpx
+
+        kwargs = {}
         if use_cert:
-            resp = self.sess.post(
-                url, data=self.to_xml(data), cert=(self.cert, self.key)
-            )
-        else:
-            resp = self.sess.post(url, data=self.to_xml(data))
-        content = resp.content.decode("utf-8")
-        if "return_code" in content:
-            data = Map(self.to_dict(content))
-            if data.return_code == FAIL:
-                raise WeixinPayError(data.return_msg)
-            if "result_code" in content and data.result_code == FAIL:
-                raise WeixinPayError(data.err_code_des)
-            return data
-        return content
+            kwargs["cert"] = (self.cert, self.key)
+        if self.transport is not None:
+            kwargs["transport"] = self.transport
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+            ),
+            headers={"Content-Type": "text/xml; charset=utf-8"},
+            **kwargs
+        )
+
+    def client(self, use_cert=False):
+        if use_cert:
+            if self._cert_client is None:
+                self._cert_client = self._create_client(True)
+            return self._cert_client
+        if self._client is None:
+            self._client = self._create_client(False)
+        return self._client
+
+    async def _post(self, url, body, use_cert=False):
+        resp = await self.client(use_cert).post(url, content=body)
+        return resp.content.decode("utf-8")
+
+    async def _fetch(self, url, data, use_cert=False, appid=True):
+        return self._parse(await self._post(url, self._prepare(data, appid), use_cert))
+
+    async def _fetch_pay(self, url, data, use_cert=False):
+        return self._parse(await self._post(url, self._prepare_pay(data), use_cert))
+
+    async def jsapi(self, **kwargs):
+        kwargs.setdefault("trade_type", "JSAPI")
+        return self._jsapi_params(await self.unified_order(**kwargs))
+
+    async def stream_bill(self, bill_date, bill_type="ALL", **data):
+        """
+        逐行下载对账单，不把整个对账单读入内存
+        没有对账单或者请求失败时抛出 WeixinPayError
+        """
+        url = self.PAY_HOST + "/pay/downloadbill"
+        data.setdefault("bill_date", bill_date)
+        data.setdefault("bill_type", bill_type)
+        body = self._prepare(data)
+        async with self.client().stream("POST", url, content=body) as resp:
+            lines = resp.aiter_lines()
+            try:
+                first = await lines.__anext__()
+            except StopAsyncIteration:
+                return
+            if first.startswith("<xml>"):
+                # 出错时返回的是 xml
+                rest = "".join([line async for line in lines])
+                self._parse(first + rest)
+                raise WeixinPayError("对账单接口返回错误")
+            yield first
+            async for line in lines:
+                yield line
+
+    async def close(self):
+        for client in (self._client, self._cert_client):
+            if client is not None:
+                await client.aclose()
+        self._client = self._cert_client = None
@@ -1,34 +1,102 @@
 import datetime
 import logging
+from typing import NamedTuple, Optional
 from uuid import UUID
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyCookie, APIKeyHeader
 from passlib.context import CryptContext
+from sqlalchemy import or_
 from starlette.requests import Request
 
+from market import config
 from market.config import SECRET_ALGORITHM, SECRET_KEY
-from market.models import MarketAdminUser, MarketUser
+from market.core.cache import LRUCache
+from market.core.hasher import PasswordHasher
+from market.core.login_guard import LoginGuard
+from market.models import MarketAdminUser, MarketUser, db
 from market.models.const import SUPER_SCOPE, UserScope2, UserStatus
 
 logger = logging.getLogger(__name__)
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 轮数低于 BCRYPT_ROUNDS 的旧哈希在登录成功时重新计算
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+)
+pwd_hasher = PasswordHasher(
+    pwd_context,
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+)
 
 APIKEY_HEADER_NAME = "X-API-KEY"
 # api_key_schema = APIKeyCookie(name=APIKEY_HEADER_NAME)
 api_key_schema = APIKeyHeader(name=APIKEY_HEADER_NAME)
 
+# 登录失败次数 / IP 登录次数限制
+user_login_guard = LoginGuard(
+    "login_",
+    max_failures=config.LOGIN_MAX_FAILURES,
+    fail_window=config.LOGIN_FAIL_WINDOW,
+    max_ip_attempts=config.LOGIN_MAX_IP_ATTEMPTS,
+    ip_window=config.LOGIN_IP_WINDOW,
+    unknown_ttl=config.LOGIN_UNKNOWN_TTL,
+)
+admin_login_guard = LoginGuard(
+    "admin_login_",
+    max_failures=config.LOGIN_MAX_FAILURES,
+    fail_window=config.LOGIN_FAIL_WINDOW,
+    max_ip_attempts=config.LOGIN_MAX_IP_ATTEMPTS,
+    ip_window=config.LOGIN_IP_WINDOW,
+    unknown_ttl=config.LOGIN_UNKNOWN_TTL,
+)
 
-def verify_password(plain_password: str, hashed_password: str,salt: str):
-    #return pwd_context.verify(plain_password, hashed_password)
-    return pwd_context.verify("#".join((salt, plain_password)), hashed_password)
 
 
-def get_password_hash(password: str,salt):
-    #return pwd_context.hash(password)
-    return pwd_context.hash("#".join((salt, password)))
+class CachedUser(NamedTuple):
+    """鉴权用的用户信息（不含密码哈希等），需要完整信息时用 require_active_user_row"""
+
+    id: int
+    uuid: UUID
+    status: int
+
+
+class CachedAdmin(NamedTuple):
+    """鉴权用的管理员信息，需要完整信息时用 require_active_admin_row"""
+
+    id: int
+    uuid: UUID
+    status: int
+    scope1: str
+    scope2: int
+
+
+# 按 uuid 缓存的用户 / 管理员，避免每个请求都查询数据库
+user_cache = LRUCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+admin_cache = LRUCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+
+async def verify_password(plain_password: str, hashed_password: str, salt: str):
+    return await pwd_hasher.verify("#".join((salt, plain_password)), hashed_password)
+
+
+async def get_password_hash(password: str, salt: str):
+    return await pwd_hasher.hash("#".join((salt, password)))
+
+
+async def verify_and_rehash(user, password: str) -> bool:
+    """校验用户 / 管理员的密码，哈希参数过时则顺便更新哈希"""
+    ok, new_hash = await pwd_hasher.verify_and_update(
+        "#".join((user.uuid.hex, password)), user.password
+    )
+    if ok and new_hash:
+        await user.update(password=new_hash).apply()
+        logger.info("rehashed password of %s %s", type(user).__name__, user.id)
+    return ok
 
 
 def create_access_token(*, data: dict, expires_delta: datetime.timedelta = None):
@@ -43,33 +111,58 @@ def create_access_token(*, data: dict, expires_delta: datetime.timedelta = None)
 
 
 # -----
-async def authenticate_user(user_id: str, password: str):
-    user = await MarketUser.query.where(MarketUser.phone == user_id).gino.first()
-    if not user:
-        user = await MarketUser.query.where(
-            MarketUser.email == user_id
-        ).gino.first()
+async def find_by_identifier(model, user_id: str):
+    """按手机号 / 邮箱 / 用户名查找用户，一次查询，多条匹配时按此顺序优先"""
+    users = await model.query.where(
+        or_(model.phone == user_id, model.email == user_id, model.name == user_id)
+    ).limit(3).gino.all()
+    for field in ("phone", "email", "name"):
+        for user in users:
+            if getattr(user, field) == user_id:
+                return user
+    return None
+
+
+async def _authenticate(model, guard: LoginGuard, user_id, password, client_ip=None):
+    """返回 (用户, 失败原因)，失败原因 0 为用户不存在，1 为密码错误"""
+    if await guard.check(user_id, client_ip):
+        return None, 0
+    user = await find_by_identifier(model, user_id)
     if not user:
-        user = await MarketUser.query.where(
-            MarketUser.name == user_id
-        ).gino.first()
-
-    if not user:
-        return False
-    if not verify_password(password, user.password,user.uuid.hex):
-        return False
+        await guard.failed(user_id, unknown=True)
+        return None, 0
+    if not await verify_and_rehash(user, password):
+        await guard.failed(user_id)
+        return None, 1
+    await guard.succeeded(user_id)
+    return user, 0
+
+
+async def authenticate_user(user_id: str, password: str, client_ip: str = None):
+    user, _ = await _authenticate(MarketUser, user_login_guard, user_id, password, client_ip)
+    return user or False
+
+
+async def get_user(uid: UUID) -> Optional[CachedUser]:
+    key = uid.hex
+    user = user_cache.get(key)
+    if user is None:
+        row = await db.select(
+            [MarketUser.id, MarketUser.uuid, MarketUser.status]
+        ).where(MarketUser.uuid == uid).gino.first()
+        if row is not None:
+            user = CachedUser(*row)
+            user_cache.set(key, user)
     return user
 
 
-async def get_user(uid: UUID):
-    #return MarketUser.query.where(MarketAdminUser.id == uid).gino.first()
-    try:
-        return MarketUser.query.where(MarketUser.uuid==uid).gino.first()
-    except DoesNotExist:
-        return None
+def invalidate_user(uid: UUID):
+    """用户被禁用 / 修改密码后删除缓存（只影响当前进程，其它进程等缓存过期）"""
+    user_cache.delete(uid.hex)
 
 
-async def require_user(token: str = Depends(api_key_schema)):
+def decode_token(token: str) -> str:
+    """校验 token，返回其中的用户 uuid"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[SECRET_ALGORITHM])
     except jwt.PyJWTError:
@@ -85,15 +178,6 @@ async def require_user(token: str = Depends(api_key_schema)):
             detail="Could not validate credentials",
             headers={APIKEY_HEADER_NAME: SECRET_ALGORITHM},
         )
-    #try:
-    #    uid = int(uid_str)
-    #except ValueError:
-    #    raise HTTPException(
-    #        status_code=status.HTTP_401_UNAUTHORIZED,
-    #        detail="Could not validate credentials",
-    #        headers={APIKEY_HEADER_NAME: SECRET_ALGORITHM},
-    #    )
-
     expire = payload.get("exp")
     if not expire or datetime.datetime.now().timestamp() > float(expire):
         raise HTTPException(
@@ -101,8 +185,15 @@ async def require_user(token: str = Depends(api_key_schema)):
             detail="credentials expired",
             headers={APIKEY_HEADER_NAME: SECRET_ALGORITHM},
         )
+    return uid_str
+
 
-    #user = await get_user(int(uid))
+async def require_user(request: Request, token: str = Depends(api_key_schema)):
+    # 同一个请求只校验一次 token（check_task_permission 等会再次获取当前用户）
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return user
+    uid_str = decode_token(token)
     user = await get_user(UUID(hex=uid_str))
     if not user:
         raise HTTPException(
@@ -110,65 +201,75 @@ async def require_user(token: str = Depends(api_key_schema)):
             detail="Could not validate credentials",
             headers={APIKEY_HEADER_NAME: SECRET_ALGORITHM},
         )
+    request.state.current_user = user
     return user
 
 
-async def require_active_user(current_user: MarketUser = Depends(require_user)):
-    #print(current_user,'current_user--3333333333333')
-    #print(current_user.status,'status---22222222222222')
-    current_user = await current_user
+async def require_active_user(current_user: CachedUser = Depends(require_user)):
     if current_user.status != int(UserStatus.normal):
         raise HTTPException(status_code=400, detail="Inactive user")
-    #print('12345678900998876532')
     return current_user
 
 
-async def get_active_user(request: Request) -> MarketUser:
+async def require_active_user_row(
+    current_user: CachedUser = Depends(require_active_user),
+) -> MarketUser:
+    """当前用户的完整信息（修改密码等需要）"""
+    user = await MarketUser.get(current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    return user
+
+
+async def get_active_user(request: Request) -> CachedUser:
     """获取当前登录用户信息，获取失败时异常"""
-    return await require_active_user(await require_user(await api_key_schema(request)))
+    user = getattr(request.state, "current_user", None)
+    if user is None:
+        user = await require_user(request, await api_key_schema(request))
+    return await require_active_user(user)
 
 
 # -------------------------------------
-async def authenticate_admin_user(user_id: str, password: str):
-    user = await MarketAdminUser.query.where(
-        MarketAdminUser.phone == user_id
-    ).gino.first()
-    if not user:
-        user = await MarketAdminUser.query.where(
-            MarketAdminUser.email == user_id
-        ).gino.first()
-    if not user:
-        user = await MarketAdminUser.query.where(
-            MarketAdminUser.name == user_id
-        ).gino.first()
-    if not user:
-        return False
-    #print(user,'user-------------11111111111222222222233333334444444444')
-    #print(user.password,'password---------3444444444444555555555555656666666')
-    if not  verify_password(password, user.password, user.uuid.hex):
-        return False
-    return user
+async def authenticate_admin_user(user_id: str, password: str, client_ip: str = None):
+    user, _ = await _authenticate(
+        MarketAdminUser, admin_login_guard, user_id, password, client_ip
+    )
+    return user or False
+
+
+async def info_admin_user(user_id: str, password: str, client_ip: str = None):
+    user, reason = await _authenticate(
+        MarketAdminUser, admin_login_guard, user_id, password, client_ip
+    )
+    return user or False, reason
+
 
-async def info_admin_user(user_id: str, password: str):
-    user = await MarketAdminUser.query.where(
-            MarketAdminUser.phone == user_id
-            ).gino.first()
-    if not user:
-        user = await MarketAdminUser.query.where(
-                MarketAdminUser.email == user_id
-                ).gino.first()
-    if not user:
-        user = await MarketAdminUser.query.where(
-                MarketAdminUser.name == user_id
-                ).gino.first()
-    if not user:
-        return False,0
-    if not verify_password(password, user.password,user.uuid.hex):
-        return False,1
-    return user,0
 #async def get_admin_user(uid: int):
-async def get_admin_user(uid: UUID):
-    return await MarketAdminUser.query.where(MarketAdminUser.uuid == uid).gino.first()
+async def get_admin_user(uid: UUID) -> Optional[CachedAdmin]:
+    key = uid.hex
+    user = admin_cache.get(key)
+    if user is None:
+        row = await db.select(
+            [
+                MarketAdminUser.id,
+                MarketAdminUser.uuid,
+                MarketAdminUser.status,
+                MarketAdminUser.scope1,
+                MarketAdminUser.scope2,
+            ]
+        ).where(MarketAdminUser.uuid == uid).gino.first()
+        if row is not None:
+            user = CachedAdmin(*row)
+            admin_cache.set(key, user)
+    return user
+
+
+def invalidate_admin(uid: UUID):
+    """管理员被禁用 / 删除 / 修改密码后删除缓存"""
+    admin_cache.delete(uid.hex)
 
 
 async def require_admin(token: str = Depends(api_key_schema)):
@@ -204,7 +305,7 @@ async def require_admin(token: str = Depends(api_key_schema)):
     return user
 
 
-async def require_active_admin(current_user: MarketAdminUser = Depends(require_admin)):
+async def require_active_admin(current_user: CachedAdmin = Depends(require_admin)):
 # async def require_active_admin():
     """激活状态的管理员"""
     # return MarketAdminUser(
@@ -222,8 +323,21 @@ async def require_active_admin(current_user: MarketAdminUser = Depends(require_a
     return current_user
 
 
+async def require_active_admin_row(
+    current_user: CachedAdmin = Depends(require_active_admin),
+) -> MarketAdminUser:
+    """当前管理员的完整信息（修改密码等需要）"""
+    user = await MarketAdminUser.get(current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    return user
+
+
 async def require_super_scope_admin(
-    current_user: MarketAdminUser = Depends(require_active_admin),
+    current_user: CachedAdmin = Depends(require_active_admin),
 ):
     """总后台的管理员"""
     if current_user.scope1 != SUPER_SCOPE:
@@ -232,7 +346,7 @@ async def require_super_scope_admin(
 
 
 async def require_super_scope_su(
-    current_user: MarketAdminUser = Depends(require_super_scope_admin),
+    current_user: CachedAdmin = Depends(require_super_scope_admin),
 ):
     """总后台的超管"""
     if current_user.scope2 != int(UserScope2.su):
@@ -0,0 +1,161 @@
+"""短信发送
+
+阿里云 SDK 的请求是同步的，放到线程池中执行，不阻塞事件循环；
+只有网络异常 / 超时按指数退避重试，平台返回的错误（ClientException / ServerException）
+不重试，避免同一条短信发送两次。本地开发 / 测试使用 FakeSMSProvider，不真正发送
+"""
+import asyncio
+import collections
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# 阿里云 SDK 网络异常 / 超时的错误码（ClientException），请求不一定到达短信平台
+ALIYUN_TRANSPORT_ERRORS = ("SDK.HttpError",)
+
+
+class SMSMessage(NamedTuple):
+    phone: str
+    template_code: str
+    params: Dict
+
+
+class SMSError(Exception):
+    """短信平台返回失败，重试也不会成功"""
+
+
+class SMSTransportError(ConnectionError):
+    """网络异常 / 超时，可以重试"""
+
+
+# 只有这些异常会重试
+RETRY_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError)
+
+
+class AliyunSMSProvider:
+    """阿里云短信，使用 SendSms 接口"""
+
+    def __init__(self, client, region_id: str, sign_name: str, workers: int = 4):
+        self.client = client
+        self.region_id = region_id
+        self.sign_name = sign_name
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sms"
+        )
+
+    def _request(self, action: str, params: Dict):
+        from aliyunsdkcore.request import CommonRequest
+
+        request = CommonRequest()
+        request.set_accept_format("json")
+        request.set_domain("dysmsapi.aliyuncs.com")
+        request.set_method("POST")
+        request.set_protocol_type("https")  # https | http
+        request.set_version("2017-05-25")
+        request.set_action_name(action)
+        request.add_query_param("RegionId", self.region_id)
+        for key, val in params.items():
+            request.add_query_param(key, val)
+        return request
+
+    async def _do_action(self, request) -> Dict:
+        from aliyunsdkcore.acs_exception.exceptions import (
+            ClientException,
+            ServerException,
+        )
+
+        loop = asyncio.get_event_loop()
+        try:
+            resp = await loop.run_in_executor(
+                self._executor, self.client.do_action_with_exception, request
+            )
+        except ClientException as e:
+            if e.get_error_code() in ALIYUN_TRANSPORT_ERRORS:
+                raise SMSTransportError(str(e)) from e
+            raise SMSError(str(e)) from e
+        except ServerException as e:
+            raise SMSError(str(e)) from e
+        ret = json.loads(resp)
+        if ret.get("Code") != "OK":
+            raise SMSError(ret)
+        return ret
+
+    async def send(self, message: SMSMessage) -> Dict:
+        return await self._do_action(
+            self._request(
+                "SendSms",
+                {
+                    "SignName": self.sign_name,
+                    "TemplateCode": message.template_code,
+                    "PhoneNumbers": message.phone,
+                    "TemplateParam": json.dumps(message.params),
+                },
+            )
+        )
+
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class FakeSMSProvider:
+    """不真正发送，只记录最近发送的短信，用于本地开发和测试
+
+    :param fail_times: 前几次发送抛出异常，用于测试重试
+    """
+
+    def __init__(self, maxlen: int = 1000, fail_times: int = 0):
+        self.sent: Deque[SMSMessage] = collections.deque(maxlen=maxlen)
+        self.fail_times = fail_times
+
+    def _check_fail(self):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("fake sms provider failure")
+
+    async def send(self, message: SMSMessage) -> Dict:
+        self._check_fail()
+        logger.info("fake sms to %s: %s %s", *message)
+        self.sent.append(message)
+        return {"Code": "OK"}
+
+
+    def close(self):
+        pass
+
+
+class SMSGateway:
+    """
+    :param provider: AliyunSMSProvider / FakeSMSProvider
+    :param retries: 网络异常 / 超时时的重试次数（平台返回失败不重试）
+    :param backoff: 第一次重试前等待的秒数，之后每次翻倍
+    """
+
+    def __init__(self, provider, retries: int = 2, backoff: float = 0.5):
+        self.provider = provider
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _with_retry(self, func, *args):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return await func(*args)
+            except RETRY_ERRORS:
+                if attempt >= self.retries:
+                    raise
+                logger.warning("send sms failed, retry in %ss", delay, exc_info=True)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def send(self, phone: str, template_code: str, params: Dict) -> Dict:
+        """立即发送一条短信，失败时抛出 SMSError 或最后一次的异常"""
+        return await self._with_retry(
+            self.provider.send, SMSMessage(phone, template_code, params)
+        )
+
+    def close(self):
+        self.provider.close()
@@ -16,6 +16,8 @@ class Ctx(metaclass=SingletonMeta):
         self.redis_client = None
         self.sms_client = None
         self.mysql_cli = None
+        # 启动时创建的后台任务，关闭时统一取消
+        self.background_tasks = []
 
 
 ctx = Ctx()
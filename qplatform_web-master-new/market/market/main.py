@@ -1,7 +1,7 @@
 import asyncio
 import logging
+import uuid
 
-import aiomysql
 import motor.motor_asyncio
 from aioredis import create_redis_pool
 from fastapi import APIRouter, FastAPI
@@ -11,6 +11,7 @@ from starlette.middleware.cors import CORSMiddleware
 from market import config
 from market.api.admin.api import api_router as admin_router
 from market.api.endpoint.api import api_router as endpoint_router
+from market.core.mysql import MySQLPool
 from market.ctx import ctx
 from market.models import db
 
@@ -41,11 +42,15 @@ async def create_first_user():
         MarketAdminUser.email == config.FIRST_SUPERUSER
     ).gino.first()
     if not user:
+        user_uuid = uuid.uuid1()
         await MarketAdminUser.create(
+            uuid=user_uuid,
             name="aqfake",
             phone="12300000000",
             email=config.FIRST_SUPERUSER,
-            password=get_password_hash(config.FIRST_SUPERUSER_PASSWORD),
+            password=await get_password_hash(
+                config.FIRST_SUPERUSER_PASSWORD, user_uuid.hex
+            ),
             scope1=SUPER_SCOPE,
             scope2=int(UserScope2.su),
         )
@@ -98,8 +103,10 @@ async def config_app(app):
 
     @app.on_event("startup")
     async def init_middlewares() -> None:  # pylint: disable=W0612
-        # qplatform mysql db
-        ctx.mysql_cli = await aiomysql.create_pool(
+        # qplatform mysql db，只读，autocommit 避免连接归还时处于事务中被关闭
+        ctx.mysql_cli = await MySQLPool.create(
+            query_timeout=config.QP_WEB_DB_QUERY_TIMEOUT,
+            acquire_timeout=config.QP_WEB_DB_ACQUIRE_TIMEOUT,
             host=config.QP_WEB_DB_HOST,
             port=config.QP_WEB_DB_PORT,
             user=config.QP_WEB_DB_USER,
@@ -107,7 +114,11 @@ async def config_app(app):
             db=config.QP_WEB_DB_NAME,
             unix_socket=config.QP_WEB_DB_UNIX_SOCKET,
             charset=config.QP_WEB_DB_CHARSET,
-            autocommit=False,
+            autocommit=True,
+            minsize=config.QP_WEB_DB_POOL_MIN,
+            maxsize=config.QP_WEB_DB_POOL_MAX,
+            pool_recycle=config.QP_WEB_DB_POOL_RECYCLE,
+            connect_timeout=config.QP_WEB_DB_CONNECT_TIMEOUT,
         )
 
         # mongodb
@@ -122,34 +133,70 @@ async def config_app(app):
         ctx.redis_client = await create_redis_pool(config.REDIS_URL)
         logger.info("aio-redis startup")
 
-        # aliyu sms
-        try:
-            from aliyunsdkcore.client import AcsClient
+        # sms
+        from market.core.sms_gateway import (
+            AliyunSMSProvider,
+            FakeSMSProvider,
+            SMSGateway,
+        )
 
-            ctx.sms_client = AcsClient(
-                config.SMS_CLI_ACCESSKEYID,
-                config.SMS_CLI_ACCESSSECRET,
-                config.SMS_CLI_REGION,
-            )
-            # check send params
-            reg = config.SMS_REQ_REGION_ID
-            sign = config.SMS_REQ_REGION_SIGN_NAME
-            if not reg or not sign:
-                raise ValueError("sms config error")
-        except ImportError:
-            logger.exception(
-                "set up sms client failed, please install aliyun-python-sdk-core"
+        provider = None
+        if config.SMS_PROVIDER == "fake":
+            provider = FakeSMSProvider()
+        else:
+            try:
+                from aliyunsdkcore.client import AcsClient
+
+                # check send params
+                reg = config.SMS_REQ_REGION_ID
+                sign = config.SMS_REQ_REGION_SIGN_NAME
+                if not reg or not sign:
+                    raise ValueError("sms config error")
+                provider = AliyunSMSProvider(
+                    AcsClient(
+                        config.SMS_CLI_ACCESSKEYID,
+                        config.SMS_CLI_ACCESSSECRET,
+                        config.SMS_CLI_REGION,
+                    ),
+                    reg,
+                    sign,
+                    workers=config.SMS_WORKERS,
+                )
+            except ImportError:
+                logger.exception(
+                    "set up sms client failed, please install aliyun-python-sdk-core"
+                )
+            except (KeyError, ValueError):
+                logger.exception("set up sms client failed, please check config")
+        if provider is not None:
+            ctx.sms_client = SMSGateway(
+                provider,
+                retries=config.SMS_RETRIES,
+                backoff=config.SMS_RETRY_BACKOFF,
             )
-        except (KeyError, ValueError):
-            logger.exception("set up sms client failed, please check config")
         await db.gino.create_all()
         await create_first_user()
 
+        # background jobs
+        from market.api.share.counter import counter_flusher
+        from market.api.share.leaderboard import leaderboard_refresher
+        from market.api.share.order_sweeper import order_sweeper
+        from market.api.share.verification_code import captcha_pool
+
+        ctx.background_tasks.append(asyncio.ensure_future(leaderboard_refresher()))
+        ctx.background_tasks.append(asyncio.ensure_future(counter_flusher()))
+        ctx.background_tasks.append(asyncio.ensure_future(order_sweeper()))
+        ctx.background_tasks.append(asyncio.ensure_future(captcha_pool.refill()))
+
     @app.on_event("shutdown")
     async def deinit_middlewares() -> None:  # pylint: disable=W0612
+        # background jobs
+        for task in ctx.background_tasks:
+            task.cancel()
+        await asyncio.gather(*ctx.background_tasks, return_exceptions=True)
+        ctx.background_tasks.clear()
         # qplatform mysql db
-        ctx.mysql_cli.close()
-        await ctx.mysql_cli.wait_closed()
+        await ctx.mysql_cli.close()
         # mongodb
         if ctx.mongo_client:
             await ctx.mongo_client.close()
@@ -160,11 +207,23 @@ async def config_app(app):
             await ctx.redis_client.close()
         logger.info("aio-redis shutdown")
 
-        # aliyu sms
+        # sms
         if ctx.sms_client:
-            pass
+            ctx.sms_client.close()
+
+        from market.api.share.verification_code import captcha_pool
+
+        captcha_pool.close()
         logger.info("sms client shutdown")
 
+        from market.core.security import pwd_hasher
+
+        pwd_hasher.shutdown()
+
+        from market.core.pay import wx_pay
+
+        await wx_pay.close()
+
     return app
 
 
@@ -7,6 +7,7 @@ from uuid import UUID
 from sqlalchemy import (
     Boolean,
     Column,
+    Date,
     DateTime,
     Float,
     ForeignKey,
@@ -346,3 +347,22 @@ class UserOrder(db.Model):
     user_id = Column(ForeignKey("marketuser.id", ondelete="SET NULL"))
 
     user = relationship("Marketuser")
+
+
+class BillMismatch(db.Model):
+    __tablename__ = "billmismatch"
+
+    id = Column(Integer, primary_key=True)
+    bill_date = Column(Date, nullable=False, index=True)
+    mismatch_type = Column(
+        SmallInteger,
+        nullable=False,
+        comment="order_missing: 1\\nbill_missing: 2\\npay_id_mismatch: 3\\ncash_mismatch: 4\\nstatus_mismatch: 5",
+    )
+    out_trade_no = Column(String(32), nullable=False)
+    transaction_id = Column(String(48), server_default="", nullable=False)
+    order_id = Column(Integer)
+    bill_cash = Column(Float(53))
+    order_cash = Column(Float(53))
+    order_status = Column(SmallInteger)
+    create_dt = Column(DateTime, server_default=func.now(), nullable=False)
@@ -94,6 +94,16 @@ class ProductType(IntEnum):
     vip = 3  # vip
 
 
+class BillMismatchType(IntEnum):
+    """对账差异类型"""
+
+    order_missing = 1  # 对账单中有，订单表中没有
+    bill_missing = 2  # 订单已支付，对账单中没有
+    pay_id_mismatch = 3  # 微信订单号不一致
+    cash_mismatch = 4  # 金额不一致
+    status_mismatch = 5  # 对账单中支付成功，订单未支付
+
+
 class OrderStatus(IntEnum):
     """订单状态"""
 
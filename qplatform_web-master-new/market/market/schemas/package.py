@@ -171,6 +171,9 @@ class PkgSearch(BaseSearch):
     product_id: Optional[SearchStr]
     name: Optional[SearchStr]
     tag: Optional[SearchStr]
+    # 包含全部标签 / 包含任意一个标签
+    tags_all: List[SearchStr] = []
+    tags_any: List[SearchStr] = []
     market_id: Optional[int]
     status: Optional[ListStatus]
 
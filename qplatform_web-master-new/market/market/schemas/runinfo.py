@@ -24,6 +24,16 @@ class QueryRunInfo(BaseSearch):
     count: int = Query(default=10000, gt=0, le=100000)
     task_id: str
     task_type: TaskType
+    # 翻页游标，传入时按游标翻页并忽略 offset，空字符串表示第一页
+    cursor: Optional[str]
+    # 收益曲线降采样后最多保留的点数，不传时返回全部数据
+    max_points: Optional[int] = Query(default=None, ge=3, le=100000)
+
+
+class ExportRunInfo(CustomBaseModel):
+    """导出全部运行信息，不分页"""
+    task_id: str
+    task_type: TaskType
 
 
 class ReturnCurveInfo(CustomBaseModel):
@@ -90,13 +100,18 @@ class Indicators(CustomBaseModel):
     pnl_ratio: Optional[float]
 
 
-class PositionPage(CommonOut):
+class CursorPage(CommonOut):
+    # 下一页的游标，没有更多数据时为空
+    next_cursor: Optional[str]
+
+
+class PositionPage(CursorPage):
     data: List[PositionInfo]
 
 
-class OrderPage(CommonOut):
+class OrderPage(CursorPage):
     data: List[OrderInfo]
 
 
-class CurvePage(CommonOut):
+class CurvePage(CursorPage):
     data: List[ReturnCurveInfo]
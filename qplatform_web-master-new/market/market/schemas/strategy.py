@@ -228,6 +228,9 @@ class QStrategySearch(BaseSearch):
     package_id: Optional[SearchStr]
     style: Optional[SearchStr]
     tag: Optional[SearchStr]
+    # 包含全部标签 / 包含任意一个标签
+    tags_all: List[SearchStr] = []
+    tags_any: List[SearchStr] = []
     category: Optional[QStrategyType]
     status: Optional[ListStatus]
     sort: Optional[SearchStr]
@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import List, Optional, Union
 
 from fastapi import Query
@@ -51,3 +52,25 @@ class TagSearch(BaseSearch):
 
 class TagSearchOut(CommonOut):
     data: List[TagInfo] = []
+
+
+class TagFacetTarget(str, Enum):
+    strategy = "strategy"
+    package = "package"
+
+
+class TagFacetSearch(CustomBaseModel):
+    target: TagFacetTarget = TagFacetTarget.strategy
+    market_id: Optional[int]
+
+    class Config:
+        schema_extra = {"example": {"target": "strategy", "market_id": 1}}
+
+
+class TagFacet(CustomBaseModel):
+    name: str
+    count: int
+
+
+class TagFacetOut(CommonOut):
+    data: List[TagFacet] = []
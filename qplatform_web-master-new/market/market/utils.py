@@ -9,6 +9,28 @@ def next_product_id():
     return uuid.uuid1().hex
 
 
+def client_ip(request) -> str:
+    """客户端 IP，用于登录的 IP 限制和浏览计数
+
+    应用部署在 TRUSTED_PROXY_COUNT 层反向代理之后，每层代理把它看到的来源地址追加到
+    X-Forwarded-For 末尾：从右往左第 TRUSTED_PROXY_COUNT 个地址是最外层代理看到的客户端地址，
+    更靠左的地址是客户端自己填的，不能信任。TRUSTED_PROXY_COUNT 为 0（直接对外）时不读这些请求头
+    """
+    proxies = config.TRUSTED_PROXY_COUNT
+    if proxies > 0:
+        forwarded = [
+            ip.strip()
+            for ip in request.headers.get("x-forwarded-for", "").split(",")
+            if ip.strip()
+        ]
+        if forwarded:
+            return forwarded[-min(proxies, len(forwarded))]
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip
+    return request.client.host
+
+
 def send_email(email_to: str, subject_template="", html_template="", environment={}):
     import emails
     from emails.template import JinjaTemplate
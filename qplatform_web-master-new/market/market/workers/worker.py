@@ -1,6 +1,51 @@
+import asyncio
+import datetime
+from typing import Optional
+
+from market import config
 from market.core.celery_app import celery_app
 
 
 @celery_app.task(acks_late=True)
 def test_celery(word: str):
     return f"test task return {word}"
+
+
+async def _reconcile_bill(bill_date: datetime.date):
+    from market.api.share.reconcile import reconcile_wx_bill
+    from market.core.pay import wx_pay
+    from market.models import db
+
+    await db.set_bind(config.PG_DB_DSN)
+    try:
+        return await reconcile_wx_bill(bill_date)
+    finally:
+        await wx_pay.close()
+        await db.pop_bind().close()
+
+
+@celery_app.task(acks_late=True, name="market.reconcile_bill")
+def reconcile_bill(bill_date: Optional[str] = None):
+    """微信支付对账，bill_date 为 YYYY-MM-DD，默认对前一天的账单"""
+    if bill_date:
+        day = datetime.datetime.strptime(bill_date, "%Y-%m-%d").date()
+    else:
+        day = datetime.date.today() - datetime.timedelta(days=1)
+    return asyncio.get_event_loop().run_until_complete(_reconcile_bill(day))
+
+
+async def _order_payed(order_id: int):
+    from market.api.share.payment import activate_pushes
+    from market.models import db
+
+    await db.set_bind(config.PG_DB_DSN)
+    try:
+        return await activate_pushes(order_id)
+    finally:
+        await db.pop_bind().close()
+
+
+@celery_app.task(acks_late=True, name="market.order_payed")
+def order_payed(order_id: int):
+    """订单支付后的后续工作：重新开启到期关闭的推送"""
+    return asyncio.get_event_loop().run_until_complete(_order_payed(order_id))
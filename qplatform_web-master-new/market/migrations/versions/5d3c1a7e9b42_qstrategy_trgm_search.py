@@ -0,0 +1,31 @@
+"""qstrategy trigram search indexes
+
+Revision ID: 5d3c1a7e9b42
+Revises: 2495732f64b6
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5d3c1a7e9b42'
+down_revision = '2495732f64b6'
+branch_labels = None
+depends_on = None
+
+# 策略搜索使用 LIKE '%xx%' 和 similarity 排序，需要 pg_trgm 的 GIN 索引
+TRGM_COLUMNS = ('name', 'author_name', 'product_id', 'task_id', 'style')
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in TRGM_COLUMNS:
+        op.execute(
+            f'CREATE INDEX IF NOT EXISTS ix_qstrategy_{column}_trgm '
+            f'ON qstrategy USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    for column in TRGM_COLUMNS:
+        op.execute(f'DROP INDEX IF EXISTS ix_qstrategy_{column}_trgm')
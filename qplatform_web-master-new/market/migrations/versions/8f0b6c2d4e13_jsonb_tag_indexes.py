@@ -0,0 +1,30 @@
+"""jsonb tag indexes for qstrategy and strategypackage
+
+Revision ID: 8f0b6c2d4e13
+Revises: 5d3c1a7e9b42
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8f0b6c2d4e13'
+down_revision = '5d3c1a7e9b42'
+branch_labels = None
+depends_on = None
+
+# 标签过滤使用 tags @> '["xx"]'，jsonb_path_ops 比默认的 jsonb_ops 更小更快
+TAG_TABLES = ('qstrategy', 'strategypackage')
+
+
+def upgrade():
+    for table in TAG_TABLES:
+        op.execute(
+            f'CREATE INDEX IF NOT EXISTS ix_{table}_tags '
+            f'ON {table} USING gin (tags jsonb_path_ops)'
+        )
+
+
+def downgrade():
+    for table in TAG_TABLES:
+        op.execute(f'DROP INDEX IF EXISTS ix_{table}_tags')
@@ -0,0 +1,32 @@
+"""partial indexes for the order expiry sweeper
+
+Revision ID: b7e2d94a1c30
+Revises: 8f0b6c2d4e13
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d94a1c30'
+down_revision = '8f0b6c2d4e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已支付订单按到期时间过期
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_userorder_payed_expire_dt '
+        'ON userorder (status, expire_dt) WHERE status = 2'
+    )
+    # 超时未支付的订单按创建时间关闭
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_userorder_unpayed_create_dt '
+        'ON userorder (status, create_dt) WHERE status = 1'
+    )
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_userorder_unpayed_create_dt')
+    op.execute('DROP INDEX IF EXISTS ix_userorder_payed_expire_dt')
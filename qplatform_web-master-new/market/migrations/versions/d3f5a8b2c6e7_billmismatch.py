@@ -0,0 +1,43 @@
+"""bill reconciliation report table
+
+Revision ID: d3f5a8b2c6e7
+Revises: b7e2d94a1c30
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd3f5a8b2c6e7'
+down_revision = 'b7e2d94a1c30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('billmismatch',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('bill_date', sa.Date(), nullable=False),
+    sa.Column('mismatch_type', sa.SmallInteger(), nullable=False, comment='order_missing: 1\\nbill_missing: 2\\npay_id_mismatch: 3\\ncash_mismatch: 4\\nstatus_mismatch: 5'),
+    sa.Column('out_trade_no', sa.String(length=32), nullable=False),
+    sa.Column('transaction_id', sa.String(length=48), server_default='', nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('bill_cash', sa.Float(precision=53), nullable=True),
+    sa.Column('order_cash', sa.Float(precision=53), nullable=True),
+    sa.Column('order_status', sa.SmallInteger(), nullable=True),
+    sa.Column('create_dt', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_billmismatch_bill_date'), 'billmismatch', ['bill_date'], unique=False)
+    # 对账时按商户订单号批量查询订单
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_userorder_foreign_order_id '
+        'ON userorder (foreign_order_id)'
+    )
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_userorder_foreign_order_id')
+    op.drop_index(op.f('ix_billmismatch_bill_date'), table_name='billmismatch')
+    op.drop_table('billmismatch')
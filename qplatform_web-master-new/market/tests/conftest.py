@@ -4,11 +4,12 @@ from pathlib import Path
 import pytest
 from starlette.testclient import TestClient
 
-from gino_fastapi_demo.asgi import app
-
 
 @pytest.fixture
 def client():
+    # 需要数据库等外部服务，只在用到时导入，单元测试不依赖
+    from market.asgi import app
+
     cwd = Path(__file__).parent.parent
     subprocess.check_call(["alembic", "upgrade", "head"], cwd=cwd)
     with TestClient(app) as client:
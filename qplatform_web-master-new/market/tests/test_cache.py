@@ -0,0 +1,40 @@
+import time
+
+from market.core.cache import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=20)
+    now[0] += 10
+    assert cache.get("a", "missing") == "missing"
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_lru_falsy_values_and_delete():
+    cache = LRUCache()
+    cache.set("zero", 0)
+    cache.set("empty", [])
+    assert cache.get("zero", "missing") == 0
+    assert cache.get("empty", "missing") == []
+    cache.delete("zero")
+    cache.delete("unknown")
+    assert cache.get("zero") is None
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from market.api.share import counter
+from market.ctx import ctx
+from market.models.const import ProductType
+
+
+class FakeTransaction:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def hmget(self, key, *fields):
+        future = asyncio.get_running_loop().create_future()
+        self.calls.append((future, key, fields))
+        return future
+
+    async def execute(self):
+        for future, key, fields in self.calls:
+            values = self.redis.hashes.get(key, {})
+            future.set_result([values.get(field) for field in fields])
+
+
+class FakeRedis:
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+    def multi_exec(self):
+        return FakeTransaction(self)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis({})
+    monkeypatch.setattr(ctx, "redis_client", redis)
+    return redis
+
+
+def test_merge_pending(redis):
+    redis.hashes[counter.delta_key(ProductType.qstrategy)] = {
+        "p1:view_cnt": "2",
+        "p1:share_cnt": "1",
+    }
+    # 正在写入数据库的增量也要加上
+    redis.hashes[counter.flushing_key(ProductType.qstrategy)] = {"p1:view_cnt": "3"}
+    p1 = SimpleNamespace(product_id="p1", view_cnt=10, collect_cnt=4, share_cnt=None)
+    p2 = SimpleNamespace(product_id="p2", view_cnt=7, collect_cnt=0, share_cnt=0)
+
+    asyncio.run(counter.merge_pending(ProductType.qstrategy, [p1, p2, None]))
+    assert (p1.view_cnt, p1.collect_cnt, p1.share_cnt) == (15, 4, 1)
+    assert (p2.view_cnt, p2.collect_cnt, p2.share_cnt) == (7, 0, 0)
+
+
+def test_merge_pending_without_redis(monkeypatch):
+    monkeypatch.setattr(ctx, "redis_client", None)
+    item = SimpleNamespace(product_id="p1", view_cnt=1, collect_cnt=0, share_cnt=0)
+    asyncio.run(counter.merge_pending(ProductType.package, [item]))
+    assert item.view_cnt == 1
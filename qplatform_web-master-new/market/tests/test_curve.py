@@ -0,0 +1,36 @@
+import numpy as np
+
+from market.api.share.curve import downsample_curve, lttb_indices
+
+
+def test_lttb_keeps_all_points_when_short():
+    values = np.arange(5, dtype=np.float64)
+    assert lttb_indices(values, 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(values, 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_lttb_keeps_ends_and_is_sorted():
+    values = np.random.RandomState(0).randn(1000).cumsum()
+    idx = lttb_indices(values, 50)
+    assert len(idx) == 50
+    assert idx[0] == 0 and idx[-1] == 999
+    assert (np.diff(idx) > 0).all()
+
+
+def test_lttb_keeps_peak():
+    values = np.zeros(500)
+    values[237] = 10.0
+    assert 237 in lttb_indices(values, 20).tolist()
+
+
+def test_lttb_less_than_three_points():
+    assert lttb_indices(np.arange(10.0), 2).tolist() == [0, 9]
+
+
+def test_downsample_curve():
+    curve = [{"day": 20200101 + i, "returns": float(i % 7)} for i in range(300)]
+    assert downsample_curve(curve, 0) is curve
+    assert downsample_curve(curve, 300) is curve
+    points = downsample_curve(curve, 30)
+    assert len(points) == 30
+    assert points[0] is curve[0] and points[-1] is curve[-1]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from market.core.loader import BatchLoader
+
+
+class Source:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, keys):
+        self.batches.append(list(keys))
+        if self.fail:
+            raise RuntimeError("query failed")
+        return {key: key * 10 for key in keys if key != 0}
+
+
+def test_loads_in_one_batch():
+    source = Source()
+
+    async def main():
+        loader = BatchLoader(source)
+        a, b = await asyncio.gather(loader.load(1), loader.load(2))
+        assert (a, b) == (10, 20)
+        assert await loader.load_many([3, 1, 0, 3]) == [30, 10, None, 30]
+
+    asyncio.run(main())
+    # 重复的 key 和已加载的 key 不再查询
+    assert source.batches == [[1, 2], [3, 0]]
+
+
+def test_max_batch():
+    source = Source()
+
+    async def main():
+        loader = BatchLoader(source, max_batch=2)
+        assert await loader.load_many(range(1, 6)) == [10, 20, 30, 40, 50]
+
+    asyncio.run(main())
+    assert source.batches == [[1, 2], [3, 4], [5]]
+
+
+def test_no_cache():
+    source = Source()
+
+    async def main():
+        loader = BatchLoader(source, cache=False)
+        assert await loader.load(1) == 10
+        assert await loader.load(1) == 10
+
+    asyncio.run(main())
+    assert source.batches == [[1], [1]]
+
+
+def test_error_is_not_cached():
+    source = Source(fail=True)
+
+    async def main():
+        loader = BatchLoader(source)
+        with pytest.raises(RuntimeError):
+            await loader.load_many([1, 2])
+        source.fail = False
+        assert await loader.load_many([1, 2]) == [10, 20]
+
+    asyncio.run(main())
+    assert source.batches == [[1, 2], [1, 2]]
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from market.api.share import order, package, strategy, tag
+from market.api.share.pagination import CountMode
+from market.models.const import ListStatus
+from market.schemas.order import OrderSearch
+from market.schemas.package import PkgSearch
+from market.schemas.strategy import QStrategySearch
+from market.schemas.tag import TagSearch
+
+
+@pytest.fixture
+def modes(monkeypatch):
+    """记录传给 paginate 的 count 模式"""
+    modes = []
+
+    async def paginate(fetch_query, count_query, offset, limit, mode=CountMode.exact, table_name=None):
+        modes.append(mode)
+        return 0, []
+
+    for module in (order, package, strategy, tag):
+        monkeypatch.setattr(module, "paginate", paginate)
+    return modes
+
+
+@pytest.mark.parametrize(
+    "search, schema_in",
+    [
+        # 默认的删除标记也是过滤条件
+        (package.search_pkg, PkgSearch()),
+        (package.search_pkg, PkgSearch(status=ListStatus.online)),
+        (order.search_order, OrderSearch()),
+        (tag.search_tag, TagSearch()),
+        (strategy.search_strategy, QStrategySearch(status=ListStatus.online)),
+    ],
+)
+def test_estimated_not_used_with_filters(modes, search, schema_in):
+    asyncio.run(search(schema_in, count_mode=CountMode.estimated))
+    assert modes == [CountMode.exact]
+
+
+def test_estimated_without_filters(modes):
+    asyncio.run(strategy.search_strategy(QStrategySearch(), count_mode=CountMode.estimated))
+    assert modes == [CountMode.estimated]
+
+
+def test_cached_is_kept(modes):
+    asyncio.run(package.search_pkg(PkgSearch(name="x"), count_mode=CountMode.cached))
+    assert modes == [CountMode.cached]
@@ -0,0 +1,63 @@
+import asyncio
+import datetime
+
+from market.core.pay.bill import parse_bill, parse_line
+from market.core.pay.mock_server import MockWeixinPay
+
+# 微信支付文档中 ALL 类型对账单的一行（新版，27 列）
+LINE = (
+    "`2014-11-10 16:33:45,`wx2421b1c4370ec43b,`10000100,`0,`1000,"
+    "`1001690740201411100005734289,`1415640626,`085e9858e3ba5186aafcbaed1,"
+    "`MICROPAY,`SUCCESS,`OTHERS,`CNY,`0.01,`0.0,`0,`0,`0,`0,`,`,"
+    "`被扫支付测试,`订单额外描述,`0,`0.60%,`0.02,`0.00,`"
+)
+
+
+def test_parse_line():
+    row = parse_line(LINE)
+    assert row.trade_dt == datetime.datetime(2014, 11, 10, 16, 33, 45)
+    assert row.transaction_id == "1001690740201411100005734289"
+    assert row.out_trade_no == "1415640626"
+    assert row.trade_state == "SUCCESS"
+    assert row.cash == 0.02
+    assert row.refund_cash == 0
+    assert row.out_refund_no == "0"
+
+
+def test_parse_line_old_format():
+    # 旧版对账单没有订单金额列，使用应结订单金额
+    fields = LINE.split(",")[:24]
+    assert parse_line(",".join(fields)).cash == 0.01
+
+
+async def _lines(content):
+    for line in content.splitlines(keepends=True):
+        yield line
+
+
+async def _parse(content):
+    return [row async for row in parse_bill(_lines(content))]
+
+
+def test_parse_mock_bill():
+    mock = MockWeixinPay("key", "wxapp", "mch")
+    time_end = datetime.datetime(2020, 1, 2, 10, 0, 0)
+    for i, fee in enumerate((100, 2550)):
+        mock.orders[f"o{i}"] = {
+            "out_trade_no": f"o{i}",
+            "transaction_id": f"t{i}",
+            "trade_type": "NATIVE",
+            "total_fee": fee,
+            "body": "策略",
+            "time_end": time_end,
+        }
+    # 其它日期 / 未支付的订单不在对账单中
+    mock.orders["other"] = dict(mock.orders["o0"], out_trade_no="other", time_end=None)
+
+    rows = asyncio.run(_parse(mock.bill("20200102")))
+    assert [(r.out_trade_no, r.transaction_id, r.cash) for r in rows] == [
+        ("o0", "t0", 1.0),
+        ("o1", "t1", 25.5),
+    ]
+    assert rows[0].trade_dt == time_end
+    assert asyncio.run(_parse(mock.bill("20200103"))) == []
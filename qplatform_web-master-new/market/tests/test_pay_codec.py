@@ -0,0 +1,112 @@
+import hashlib
+import threading
+
+import pytest
+from lxml import etree
+
+from market.core.pay import codec
+
+MCH_KEY = "k" * 32
+NOTIFY = {
+    "appid": "wx2421b1c4370ec43b",
+    "attach": "支付测试",
+    "bank_type": "CFT",
+    "fee_type": "CNY",
+    "mch_id": "10000100",
+    "nonce_str": "5d2b6c2a8db53831f7eda20af46e531c",
+    "out_trade_no": "1409811653",
+    "result_code": "SUCCESS",
+    "return_code": "SUCCESS",
+    "total_fee": 1,
+    "coupon_fee": "",
+    "transaction_id": "1004400740201409030005092168",
+}
+
+
+# 原来 WeixinPay.sign 的实现
+def legacy_sign(raw, key=MCH_KEY):
+    raw = [
+        (k, str(raw[k]) if isinstance(raw[k], int) else raw[k])
+        for k in sorted(raw.keys())
+    ]
+    s = "&".join("=".join(kv) for kv in raw if kv[1])
+    s += "&key={0}".format(key)
+    return hashlib.md5(s.encode("utf-8")).hexdigest().upper()
+
+
+def test_xml_round_trip():
+    data = {"a": "1", "b": "<x&y>", "c": "a]]>b", "d": 5, "e": "中文"}
+    assert codec.from_xml(codec.to_xml(data)) == {
+        "a": "1",
+        "b": "<x&y>",
+        "c": "a]]>b",
+        "d": "5",
+        "e": "中文",
+    }
+    assert codec.from_xml(codec.to_xml(data).decode("utf-8"))["e"] == "中文"
+
+
+def test_from_xml_empty_node():
+    assert codec.from_xml(b"<xml><a></a><b>1</b></xml>") == {"a": None, "b": "1"}
+
+
+def test_from_xml_does_not_resolve_entities():
+    content = (
+        b'<?xml version="1.0"?><!DOCTYPE xml [<!ENTITY e SYSTEM "file:///etc/passwd">]>'
+        b"<xml><a>&e;</a></xml>"
+    )
+    assert codec.from_xml(content)["a"] is None
+
+
+def test_from_xml_syntax_error():
+    with pytest.raises(etree.XMLSyntaxError):
+        codec.from_xml(b"<xml><a>")
+
+
+def test_from_xml_in_threads():
+    content = codec.to_xml(NOTIFY)
+    expected = {k: str(v) if v != "" else None for k, v in NOTIFY.items()}
+    results = []
+
+    def parse():
+        results.append(all(codec.from_xml(content) == expected for _ in range(500)))
+
+    threads = [threading.Thread(target=parse) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [True] * 8
+
+
+def test_sign_same_as_legacy():
+    signer = codec.Signer(MCH_KEY)
+    assert signer.sign(NOTIFY) == legacy_sign(NOTIFY)
+    # 字段顺序不同、缓存命中后结果不变
+    reordered = dict(reversed(list(NOTIFY.items())))
+    assert signer.sign(reordered) == legacy_sign(NOTIFY)
+    assert signer.sign(NOTIFY) == legacy_sign(NOTIFY)
+    # sign 字段不参与签名
+    assert signer.sign({**NOTIFY, "sign": "xxx"}) == legacy_sign(NOTIFY)
+
+
+def test_sign_order_cache_is_bounded():
+    signer = codec.Signer(MCH_KEY, max_cached=2)
+    for i in range(5):
+        data = {f"k{i}": "v", "a": "1"}
+        assert signer.sign(data) == legacy_sign(data)
+    assert len(signer._orders) <= 2
+
+
+def test_check():
+    signer = codec.Signer(MCH_KEY)
+    data = {**NOTIFY, "sign": legacy_sign(NOTIFY)}
+    assert signer.check(data)
+    assert not signer.check({**data, "total_fee": 2})
+    assert not signer.check(NOTIFY)
+    assert not codec.Signer("other").check(data)
+
+
+def test_nonce_str():
+    a, b = codec.nonce_str(), codec.nonce_str()
+    assert len(a) == 32 and a != b
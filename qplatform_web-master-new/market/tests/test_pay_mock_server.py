@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from market.core.pay import codec
+from market.core.pay.bill import parse_bill
+from market.core.pay.mock_server import create_app
+from market.core.pay.wechat_pay import AsyncWeixinPay, WeixinPayError
+
+MCH_KEY = "k" * 32
+APP_ID = "wxapp"
+MCH_ID = "10000100"
+
+
+def make_client(app, mch_key=MCH_KEY):
+    return AsyncWeixinPay(
+        APP_ID,
+        MCH_ID,
+        mch_key,
+        "http://market/api/v1/pay/notify/wechat",
+        host="http://mock",
+        transport=httpx.ASGITransport(app=app),
+    )
+
+
+async def unified_order(client, out_trade_no, total_fee=100):
+    return await client.unified_order(
+        out_trade_no=out_trade_no,
+        body="策略",
+        total_fee=total_fee,
+        trade_type="NATIVE",
+        product_id="p1",
+        spbill_create_ip="127.0.0.1",
+    )
+
+
+def test_pay_flow():
+    app = create_app(MCH_KEY, APP_ID, MCH_ID)
+
+    async def main():
+        client = make_client(app)
+        try:
+            order = await unified_order(client, "o1")
+            assert order.code_url.startswith("weixin://")
+            assert (await client.order_query(out_trade_no="o1")).trade_state == "NOTPAY"
+
+            resp = await client.client().post("http://mock/mock/pay/o1?notify=0")
+            assert resp.status_code == 200
+            paid = await client.order_query(out_trade_no="o1")
+            assert paid.trade_state == "SUCCESS"
+            assert paid.total_fee == "100" and paid.transaction_id
+
+            with pytest.raises(WeixinPayError) as exc:
+                await client.close_order("o1")
+            assert exc.value.err_code == "ORDERPAID"
+
+            rows = [
+                row
+                async for row in parse_bill(
+                    client.stream_bill(datetime.date.today().strftime("%Y%m%d"))
+                )
+            ]
+            assert [(r.out_trade_no, r.transaction_id, r.cash) for r in rows] == [
+                ("o1", paid.transaction_id, 1.0)
+            ]
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+
+
+def test_close_order():
+    app = create_app(MCH_KEY, APP_ID, MCH_ID)
+
+    async def main():
+        client = make_client(app)
+        try:
+            await unified_order(client, "o2")
+            await client.close_order("o2")
+            assert (await client.order_query(out_trade_no="o2")).trade_state == "CLOSED"
+            with pytest.raises(WeixinPayError) as exc:
+                await client.close_order("unknown")
+            assert exc.value.err_code == "ORDERNOTEXIST"
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+
+
+def test_bad_sign():
+    app = create_app(MCH_KEY, APP_ID, MCH_ID)
+
+    async def main():
+        client = make_client(app, mch_key="other")
+        try:
+            with pytest.raises(WeixinPayError) as exc:
+                await unified_order(client, "o3")
+            assert exc.value.err_code is None
+        finally:
+            await client.close()
+        assert app.state.mock.orders == {}
+
+    asyncio.run(main())
+
+
+def test_notify_is_signed():
+    app = create_app(MCH_KEY, APP_ID, MCH_ID)
+    received = []
+
+    async def notify(request):
+        received.append(codec.from_xml(await request.body()))
+        return Response(codec.to_xml({"return_code": "SUCCESS", "return_msg": "OK"}))
+
+    notify_app = Starlette(
+        routes=[Route("/api/v1/pay/notify/wechat", notify, methods=["POST"])]
+    )
+    app.state.mock.notify_transport = httpx.ASGITransport(app=notify_app)
+
+    async def main():
+        client = make_client(app)
+        try:
+            await unified_order(client, "o4", 2550)
+            resp = await client.client().post("http://mock/mock/pay/o4")
+            assert codec.from_xml(resp.content)["return_code"] == "SUCCESS"
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+    (data,) = received
+    assert codec.Signer(MCH_KEY).check(data)
+    assert data["out_trade_no"] == "o4" and data["total_fee"] == "2550"
+    assert data["appid"] == APP_ID and data["mch_id"] == MCH_ID
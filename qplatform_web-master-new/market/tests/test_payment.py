@@ -0,0 +1,157 @@
+import asyncio
+import sys
+from types import ModuleType, SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from market.api.endpoint.v1 import pay as pay_endpoint
+from market.api.share import payment
+from market.core.pay import codec
+from market.core.pay.mock_server import create_app
+from market.core.pay.wechat_pay import AsyncWeixinPay
+from market.ctx import ctx
+
+MCH_KEY = "k" * 32
+APP_ID = "wxapp"
+MCH_ID = "10000100"
+
+
+class FakeRedis:
+    SET_IF_NOT_EXIST = "SET_IF_NOT_EXIST"
+
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, expire=0, exist=None):
+        if exist == self.SET_IF_NOT_EXIST and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    """mock 微信支付服务的支付通知发送到 market 的通知接口，mark_payed / 入队只记录调用"""
+    market_app = FastAPI()
+    market_app.include_router(pay_endpoint.router, prefix="/api/v1")
+    mock_app = create_app(MCH_KEY, APP_ID, MCH_ID)
+    mock_app.state.mock.notify_transport = httpx.ASGITransport(app=market_app)
+    client = AsyncWeixinPay(
+        APP_ID,
+        MCH_ID,
+        MCH_KEY,
+        "http://market/api/v1/pay/notify/wechat",
+        host="http://mock",
+        transport=httpx.ASGITransport(app=mock_app),
+    )
+    ns = SimpleNamespace(
+        client=client, mock=mock_app.state.mock, calls=[], enqueued=[], result={"id": 1}
+    )
+
+    async def mark_payed(condition, payed_cash=None, pay_id=None, include_abandoned=False):
+        ns.calls.append(
+            {"payed_cash": payed_cash, "pay_id": pay_id, "abandoned": include_abandoned}
+        )
+        if isinstance(ns.result, Exception):
+            raise ns.result
+        return ns.result
+
+    async def enqueue_order_payed(order_id):
+        ns.enqueued.append(order_id)
+
+    monkeypatch.setattr(payment, "wx_pay", client)
+    monkeypatch.setattr(payment, "mark_payed", mark_payed)
+    monkeypatch.setattr(payment, "enqueue_order_payed", enqueue_order_payed)
+    monkeypatch.setattr(ctx, "redis_client", FakeRedis())
+    yield ns
+    asyncio.run(client.close())
+
+
+async def _pay(client, out_trade_no, total_fee=100):
+    await client.unified_order(
+        out_trade_no=out_trade_no,
+        body="策略",
+        total_fee=total_fee,
+        trade_type="NATIVE",
+        product_id="p1",
+        spbill_create_ip="127.0.0.1",
+    )
+    resp = await client.client().post(f"http://mock/mock/pay/{out_trade_no}")
+    return codec.from_xml(resp.content)
+
+
+def test_notify_marks_order_payed_once(env):
+    client, mock, calls = env.client, env.mock, env.calls
+
+    async def main():
+        reply = await _pay(client, "o1", 2550)
+        assert reply["return_code"] == "SUCCESS"
+        transaction_id = mock.orders["o1"]["transaction_id"]
+        assert calls == [{"payed_cash": 25.5, "pay_id": transaction_id, "abandoned": True}]
+        # 微信重试的通知直接应答成功，不再更新订单
+        reply = codec.from_xml(await mock.notify(mock.orders["o1"]))
+        assert reply["return_code"] == "SUCCESS"
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_notify_failure_is_retried(env):
+    client, mock, calls = env.client, env.mock, env.calls
+    env.result = RuntimeError("db down")
+
+    async def main():
+        reply = await _pay(client, "o2")
+        assert reply["return_code"] == "FAIL"
+        env.result = {"id": 2}
+        reply = codec.from_xml(await mock.notify(mock.orders["o2"]))
+        assert reply["return_code"] == "SUCCESS"
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_notify_bad_sign(env):
+    client, calls = env.client, env.calls
+
+    async def main():
+        await _pay(client, "o3")
+        data = {
+            "return_code": "SUCCESS",
+            "result_code": "SUCCESS",
+            "appid": APP_ID,
+            "mch_id": MCH_ID,
+            "out_trade_no": "o3",
+            "transaction_id": "t3",
+            "total_fee": 1,
+            "sign": "BAD",
+        }
+        reply = await payment.handle_wx_notify(codec.to_xml(data))
+        assert reply["return_code"] == "FAIL"
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_enqueue_order_payed(monkeypatch):
+    sent = []
+
+    class FakeCelery:
+        def send_task(self, name, args):
+            sent.append((name, args))
+            if args == [2]:
+                raise RuntimeError("broker down")
+
+    module = ModuleType("market.core.celery_app")
+    module.celery_app = FakeCelery()
+    monkeypatch.setitem(sys.modules, "market.core.celery_app", module)
+
+    asyncio.run(payment.enqueue_order_payed(1))
+    # 入队失败只记录日志
+    asyncio.run(payment.enqueue_order_payed(2))
+    assert sent == [("market.order_payed", [1]), ("market.order_payed", [2])]
@@ -0,0 +1,19 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from market.api.share.run_info import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    oid = ObjectId()
+    cursor = encode_cursor({"day": 20200102, "_id": oid, "returns": 0.1})
+    assert cursor == f"20200102_{oid}"
+    assert decode_cursor(cursor) == (20200102, oid)
+
+
+@pytest.mark.parametrize("cursor", ["20200102", "x_5f0000000000000000000000", "20200102_xyz"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
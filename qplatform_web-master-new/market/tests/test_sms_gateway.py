@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from market.core.sms_gateway import FakeSMSProvider, SMSError, SMSGateway, SMSMessage
+
+
+def test_send():
+    provider = FakeSMSProvider(maxlen=2)
+    gateway = SMSGateway(provider)
+
+    async def main():
+        for i in range(3):
+            assert await gateway.send(f"1380000000{i}", "SMS_1", {"code": i}) == {
+                "Code": "OK"
+            }
+
+    asyncio.run(main())
+    assert list(provider.sent) == [
+        SMSMessage("13800000001", "SMS_1", {"code": 1}),
+        SMSMessage("13800000002", "SMS_1", {"code": 2}),
+    ]
+
+
+def test_retry_transport_errors():
+    provider = FakeSMSProvider(fail_times=2)
+    gateway = SMSGateway(provider, retries=2, backoff=0)
+    asyncio.run(gateway.send("13800000000", "SMS_1", {"code": "1234"}))
+    assert len(provider.sent) == 1
+
+    provider = FakeSMSProvider(fail_times=3)
+    gateway = SMSGateway(provider, retries=2, backoff=0)
+    with pytest.raises(ConnectionError):
+        asyncio.run(gateway.send("13800000000", "SMS_1", {"code": "1234"}))
+    assert len(provider.sent) == 0
+
+
+@pytest.mark.parametrize("error", [SMSError({"Code": "isv.BUSINESS_LIMIT_CONTROL"}), ValueError()])
+def test_no_retry_on_other_errors(error):
+    calls = []
+
+    class Provider(FakeSMSProvider):
+        async def send(self, message):
+            calls.append(message)
+            raise error
+
+    gateway = SMSGateway(Provider(), retries=2, backoff=0)
+    with pytest.raises(type(error)):
+        asyncio.run(gateway.send("13800000000", "SMS_1", {"code": "1234"}))
+    assert len(calls) == 1
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+import pytest
+from starlette.datastructures import Headers
+
+from market import config
+from market.utils import client_ip
+
+
+def make_request(headers=None, host="10.0.0.2"):
+    return SimpleNamespace(headers=Headers(headers or {}), client=SimpleNamespace(host=host))
+
+
+@pytest.mark.parametrize(
+    "proxies, headers, expected",
+    [
+        # 直接对外时不信任请求头
+        (0, {"x-forwarded-for": "1.1.1.1", "x-real-ip": "1.1.1.1"}, "10.0.0.2"),
+        (1, {}, "10.0.0.2"),
+        (1, {"x-real-ip": "2.2.2.2"}, "2.2.2.2"),
+        (1, {"x-forwarded-for": "3.3.3.3"}, "3.3.3.3"),
+        # 客户端伪造的地址在左边，取代理追加的最后一个
+        (1, {"x-forwarded-for": "6.6.6.6, 3.3.3.3"}, "3.3.3.3"),
+        (2, {"x-forwarded-for": "6.6.6.6, 3.3.3.3, 172.16.0.1"}, "3.3.3.3"),
+        (2, {"x-forwarded-for": "3.3.3.3"}, "3.3.3.3"),
+    ],
+)
+def test_client_ip(monkeypatch, proxies, headers, expected):
+    monkeypatch.setattr(config, "TRUSTED_PROXY_COUNT", proxies)
+    assert client_ip(make_request(headers)) == expected